@@ -1,7 +1,9 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+from .encoding import SEG_MAP_FORMATS, decode_seg_map, encode_seg_map
 from .inference import inference_model, init_model, show_result_pyplot
 from .mmseg_inferencer import MMSegInferencer
 
 __all__ = [
-    'init_model', 'inference_model', 'show_result_pyplot', 'MMSegInferencer'
+    'init_model', 'inference_model', 'show_result_pyplot', 'MMSegInferencer',
+    'SEG_MAP_FORMATS', 'encode_seg_map', 'decode_seg_map'
 ]
@@ -0,0 +1,98 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import io
+from typing import Optional, Sequence
+
+import cv2
+import numpy as np
+from PIL import Image
+
+SEG_MAP_FORMATS = ('png', 'palette_png', 'rle', 'raw')
+
+
+def encode_seg_map(seg_map: np.ndarray,
+                   seg_format: str = 'png',
+                   compress_level: int = 1,
+                   palette: Optional[Sequence[Sequence[int]]] = None) -> bytes:
+    """Encode a label map into bytes to be sent over the network.
+
+    The formats are:
+
+    - ``'png'``: Grayscale PNG of the labels.
+    - ``'palette_png'``: Palette-indexed PNG of the labels colored by
+      ``palette``, which is shown in color by image viewers but decoded as
+      the labels.
+    - ``'rle'``: Run-length encoding of the labels in row-major order, i.e.
+      the height and width and the number of runs as little-endian uint32,
+      followed by the uint8 label and then the uint32 length of the runs.
+      It is fast to encode and decode, and compact for the label maps with
+      large regions.
+    - ``'raw'``: The height and width as little-endian uint32, followed by
+      the uint8 labels in row-major order, which is not compressed at all.
+
+    Args:
+        seg_map (np.ndarray): The label map of shape (H, W), whose labels are
+            stored as uint8.
+        seg_format (str): The format of the bytes. Defaults to 'png'.
+        compress_level (int): The zlib compression level of PNG, from 0 (no
+            compression) to 9 (best compression). Defaults to 1.
+        palette (Sequence[Sequence[int]], optional): The RGB color of each
+            label, which is required by ``'palette_png'``. Defaults to None.
+
+    Returns:
+        bytes: The encoded label map.
+    """
+    seg_map = np.ascontiguousarray(seg_map, dtype=np.uint8)
+    assert seg_map.ndim == 2, \
+        f'The label map should be of shape (H, W), but got {seg_map.shape}'
+    height, width = seg_map.shape
+    if seg_format == 'png':
+        _, buffer = cv2.imencode('.png', seg_map,
+                                 [cv2.IMWRITE_PNG_COMPRESSION, compress_level])
+        return buffer.tobytes()
+    elif seg_format == 'palette_png':
+        assert palette is not None, 'palette_png requires the palette'
+        output = Image.fromarray(seg_map)
+        output.putpalette(np.asarray(palette, dtype=np.uint8).ravel())
+        with io.BytesIO() as f:
+            output.save(f, format='PNG', compress_level=compress_level)
+            return f.getvalue()
+    elif seg_format == 'rle':
+        flat = seg_map.ravel()
+        starts = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+        starts = np.concatenate([[0], starts]) if flat.size > 0 else starts
+        lengths = np.diff(np.append(starts, flat.size))
+        header = np.array([height, width, len(starts)], dtype='<u4')
+        return header.tobytes() + flat[starts].tobytes() + lengths.astype(
+            '<u4').tobytes()
+    elif seg_format == 'raw':
+        header = np.array([height, width], dtype='<u4')
+        return header.tobytes() + seg_map.tobytes()
+    raise ValueError(f'seg_format should be one of {SEG_MAP_FORMATS}, '
+                     f'but got {seg_format}')
+
+
+def decode_seg_map(content: bytes, seg_format: str = 'png') -> np.ndarray:
+    """Decode a label map from the bytes encoded by :func:`encode_seg_map`.
+
+    Args:
+        content (bytes): The encoded label map.
+        seg_format (str): The format of the bytes. Defaults to 'png'.
+
+    Returns:
+        np.ndarray: The uint8 label map of shape (H, W).
+    """
+    if seg_format in ('png', 'palette_png'):
+        # decode the palette-indexed PNG as the indices instead of colors
+        with Image.open(io.BytesIO(content)) as img:
+            return np.array(img)
+    elif seg_format == 'rle':
+        height, width, num_runs = np.frombuffer(content, '<u4', 3).tolist()
+        values = np.frombuffer(content, np.uint8, num_runs, 12)
+        lengths = np.frombuffer(content, '<u4', num_runs, 12 + num_runs)
+        return np.repeat(values, lengths).reshape(height, width)
+    elif seg_format == 'raw':
+        height, width = np.frombuffer(content, '<u4', 2).tolist()
+        return np.frombuffer(content, np.uint8, height * width,
+                             8).reshape(height, width)
+    raise ValueError(f'seg_format should be one of {SEG_MAP_FORMATS}, '
+                     f'but got {seg_format}')
@@ -1,8 +1,9 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import copy
 import warnings
 from collections import defaultdict
 from pathlib import Path
-from typing import Optional, Sequence, Union
+from typing import Dict, Optional, Sequence, Union
 
 import mmcv
 import numpy as np
@@ -85,6 +86,9 @@ def init_model(config: Union[str, Path, Config],
                 'palette': get_palette(dataset_name)
             }
     model.cfg = config  # save the config in the model for convenience
+    if 'test_pipeline' in config:
+        # build the test pipelines once instead of in each inference
+        _get_test_pipelines(model)
     model.to(device)
     model.eval()
     return model
@@ -93,32 +97,58 @@ def init_model(config: Union[str, Path, Config],
 ImageType = Union[str, np.ndarray, Sequence[str], Sequence[np.ndarray]]
 
 
-def _preprare_data(imgs: ImageType, model: BaseSegmentor):
+def _build_test_pipelines(cfg: Config) -> Dict[str, Compose]:
+    """Build the test pipelines for each kind of input images.
+
+    The annotations are not loaded, and the images of the ``'ndarray'``
+    pipeline are loaded by ``LoadImageFromNDArray`` instead of the first
+    transform of ``cfg.test_pipeline``. ``cfg`` is not modified.
+
+    Args:
+        cfg (:obj:`mmengine.Config`): The config with ``test_pipeline``.
 
-    cfg = model.cfg
-    for t in cfg.test_pipeline:
-        if t.get('type') == 'LoadAnnotations':
-            cfg.test_pipeline.remove(t)
+    Returns:
+        dict[str, :obj:`Compose`]: The test pipelines of the image files
+        and the loaded images, keyed by ``'path'`` and ``'ndarray'``.
+    """
+    pipeline_cfg = [
+        transform for transform in copy.deepcopy(cfg.test_pipeline)
+        if transform.get('type') != 'LoadAnnotations'
+    ]
+    ndarray_pipeline_cfg = copy.deepcopy(pipeline_cfg)
+    ndarray_pipeline_cfg[0]['type'] = 'LoadImageFromNDArray'
+    return dict(
+        path=Compose(pipeline_cfg), ndarray=Compose(ndarray_pipeline_cfg))
+
+
+def _get_test_pipelines(model: BaseSegmentor) -> Dict[str, Compose]:
+    """Get the test pipelines cached on the model, which are rebuilt if
+    ``model.cfg.test_pipeline`` has been changed since they were built."""
+    pipeline_cfg = model.cfg.test_pipeline
+    if getattr(model, 'test_pipelines', None) is None or \
+            getattr(model, '_test_pipeline_cfg', None) != pipeline_cfg:
+        model.test_pipelines = _build_test_pipelines(model.cfg)
+        model._test_pipeline_cfg = copy.deepcopy(pipeline_cfg)
+    return model.test_pipelines
+
+
+def _preprare_data(imgs: ImageType, model: BaseSegmentor):
 
     is_batch = True
     if not isinstance(imgs, (list, tuple)):
         imgs = [imgs]
         is_batch = False
 
-    if isinstance(imgs[0], np.ndarray):
-        cfg.test_pipeline[0]['type'] = 'LoadImageFromNDArray'
-
-    # TODO: Consider using the singleton pattern to avoid building
-    # a pipeline for each inference
-    pipeline = Compose(cfg.test_pipeline)
+    # the pipelines are built by ``init_model``, or once here for the models
+    # built in other ways
+    pipelines = _get_test_pipelines(model)
 
     data = defaultdict(list)
     for img in imgs:
         if isinstance(img, np.ndarray):
-            data_ = dict(img=img)
+            data_ = pipelines['ndarray'](dict(img=img))
         else:
-            data_ = dict(img_path=img)
-        data_ = pipeline(data_)
+            data_ = pipelines['path'](dict(img_path=img))
         data['inputs'].append(data_['inputs'])
         data['data_samples'].append(data_['data_samples'])
 
@@ -129,6 +159,10 @@ def inference_model(model: BaseSegmentor,
                     img: ImageType) -> Union[SegDataSample, SampleList]:
     """Inference image(s) with the segmentor.
 
+    The test pipelines built from ``model.cfg.test_pipeline`` are cached in
+    ``model.test_pipelines``, and are rebuilt once the config is changed,
+    e.g. by assigning another ``model.cfg.test_pipeline``.
+
     Args:
         model (nn.Module): The loaded segmentor.
         imgs (str/ndarray or list[str/ndarray]): Either image files or loaded
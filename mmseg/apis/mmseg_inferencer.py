@@ -1,7 +1,10 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import os.path as osp
 import warnings
-from typing import List, Optional, Sequence, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Callable, Iterable, Iterator, List, Optional, Sequence,
+                    Union)
 
 import mmcv
 import mmengine
@@ -13,10 +16,11 @@ from mmengine.infer.infer import BaseInferencer, ModelType
 from mmengine.model import revert_sync_batchnorm
 from mmengine.registry import init_default_scope
 from mmengine.runner.checkpoint import _load_checkpoint_to_model
-from PIL import Image
+from torch.utils.data import DataLoader, Dataset
 
 from mmseg.structures import SegDataSample
-from mmseg.utils import ConfigType, SampleList, get_classes, get_palette
+from mmseg.utils import (AsyncWriter, ConfigType, SampleList, get_classes,
+                         get_palette, save_png)
 from mmseg.visualization import SegLocalVisualizer
 
 InputType = Union[str, np.ndarray]
@@ -24,6 +28,21 @@ InputsType = Union[InputType, Sequence[InputType]]
 PredType = Union[SegDataSample, SampleList]
 
 
+class _PipelineDataset(Dataset):
+    """The inputs processed by the pipeline in the workers of
+    ``DataLoader``."""
+
+    def __init__(self, inputs: list, pipeline: Callable) -> None:
+        self.inputs = inputs
+        self.pipeline = pipeline
+
+    def __getitem__(self, idx: int) -> dict:
+        return self.pipeline(self.inputs[idx])
+
+    def __len__(self) -> int:
+        return len(self.inputs)
+
+
 class MMSegInferencer(BaseInferencer):
     """Semantic segmentation inferencer, provides inference and visualization
     interfaces. Note: MMEngine >= 0.5.0 is required.
@@ -55,12 +74,22 @@ class MMSegInferencer(BaseInferencer):
         device (str, optional): Device to run inference. If None, the available
             device will be automatically used. Defaults to None.
         scope (str, optional): The scope of the model. Defaults to 'mmseg'.
+        num_writers (int): The number of background threads that encode and
+            write the predictions and visualizations, so that writing does not
+            block drawing and postprocessing the other images. If it is 0,
+            they are written synchronously. Defaults to 0.
+        max_pending_writes (int): The maximum number of pending writes, more
+            than which the inferencer waits for the writes to bound the
+            memory. Defaults to 32.
     """ # noqa
 
-    preprocess_kwargs: set = set()
+    preprocess_kwargs: set = {'num_workers', 'worker_type', 'prefetch_factor'}
     forward_kwargs: set = {'mode', 'out_dir'}
     visualize_kwargs: set = {'show', 'wait_time', 'img_out_dir', 'opacity'}
-    postprocess_kwargs: set = {'pred_out_dir', 'return_datasample'}
+    postprocess_kwargs: set = {
+        'pred_out_dir', 'return_datasample', 'pred_format'
+    }
+    pred_formats = ('png', 'palette_png', 'npy')
 
     def __init__(self,
                  model: Union[ModelType, str],
@@ -69,11 +98,15 @@ class MMSegInferencer(BaseInferencer):
                  palette: Optional[Union[str, List]] = None,
                  dataset_name: Optional[str] = None,
                  device: Optional[str] = None,
-                 scope: Optional[str] = 'mmseg') -> None:
+                 scope: Optional[str] = 'mmseg',
+                 num_writers: int = 0,
+                 max_pending_writes: int = 32) -> None:
         # A global counter tracking the number of images processes, for
         # naming of the output images
         self.num_visualized_imgs = 0
         self.num_pred_imgs = 0
+        self.writer = AsyncWriter(
+            num_workers=num_writers, max_pending=max_pending_writes)
         init_default_scope(scope if scope else 'mmseg')
         super().__init__(
             model=model, weights=weights, device=device, scope=scope)
@@ -190,6 +223,70 @@ class MMSegInferencer(BaseInferencer):
             pred_out_dir=pred_out_dir,
             **kwargs)
 
+    def preprocess(self,
+                   inputs: list,
+                   batch_size: int = 1,
+                   num_workers: int = 0,
+                   worker_type: str = 'thread',
+                   prefetch_factor: int = 2) -> Iterator:
+        """Process the inputs by the pipeline and collate them into batches.
+
+        The images in a batch may be of different shapes, which are padded
+        into a batch by the data preprocessor of the model. If
+        ``num_workers`` is positive, the inputs are loaded and transformed by
+        a pool of workers ahead of the forward of the model, so that the
+        decoding of the images overlaps with the computation.
+
+        Args:
+            inputs (list): Inputs given by :meth:`_inputs_to_list`.
+            batch_size (int): Batch size. Defaults to 1.
+            num_workers (int): The number of workers to process the inputs.
+                If it is 0, the inputs are processed in the main thread.
+                Defaults to 0.
+            worker_type (str): The type of the workers, either ``'thread'``
+                or ``'process'``. The process workers are the workers of
+                ``DataLoader``, which do not contend for the GIL but have to
+                send the processed inputs back. Defaults to 'thread'.
+            prefetch_factor (int): The number of batches loaded in advance by
+                each worker. Defaults to 2.
+
+        Yields:
+            dict: The batches collated by ``collate_fn``.
+        """
+        if num_workers == 0:
+            chunked_data = self._get_chunk_data(
+                map(self.pipeline, inputs), batch_size)
+            yield from map(self.collate_fn, chunked_data)
+        elif worker_type == 'thread':
+            chunked_data = self._get_chunk_data(
+                self._map_async(inputs, num_workers,
+                                num_workers * prefetch_factor * batch_size),
+                batch_size)
+            yield from map(self.collate_fn, chunked_data)
+        elif worker_type == 'process':
+            yield from DataLoader(
+                _PipelineDataset(inputs, self.pipeline),
+                batch_size=batch_size,
+                num_workers=num_workers,
+                collate_fn=self.collate_fn,
+                prefetch_factor=prefetch_factor)
+        else:
+            raise ValueError('worker_type should be "thread" or "process", '
+                             f'but got {worker_type}')
+
+    def _map_async(self, inputs: Iterable, num_workers: int,
+                   max_pending: int) -> Iterator[dict]:
+        """Process the inputs by the pipeline in a thread pool, and yield the
+        results in order with at most ``max_pending`` inputs in flight."""
+        with ThreadPoolExecutor(num_workers) as executor:
+            futures: deque = deque()
+            for single_input in inputs:
+                futures.append(executor.submit(self.pipeline, single_input))
+                if len(futures) >= max_pending:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
     def visualize(self,
                   inputs: list,
                   preds: List[dict],
@@ -238,19 +335,30 @@ class MMSegInferencer(BaseInferencer):
                 raise ValueError('Unsupported input type:'
                                  f'{type(single_input)}')
 
-            out_file = osp.join(img_out_dir, img_name) if img_out_dir != ''\
-                else None
-
-            self.visualizer.add_datasample(
-                img_name,
-                img,
-                pred,
-                show=show,
-                wait_time=wait_time,
-                draw_gt=False,
-                draw_pred=True,
-                out_file=out_file)
-            results.append(self.visualizer.get_image())
+            if img_out_dir == '':
+                self.visualizer.add_datasample(
+                    img_name,
+                    img,
+                    pred,
+                    show=show,
+                    wait_time=wait_time,
+                    draw_gt=False,
+                    draw_pred=True)
+                vis = self.visualizer.get_image()
+            else:
+                # the image is written to `img_out_dir` by `self.writer`
+                # only, instead of `add_datasample`, which would also save it
+                # to the storage backends of the visualizer
+                vis = self.visualizer._draw_sem_seg(
+                    img, pred.pred_sem_seg,
+                    self.visualizer.dataset_meta['classes'],
+                    self.visualizer.dataset_meta['palette'])
+                if show:
+                    self.visualizer.show(
+                        vis, win_name=img_name, wait_time=wait_time)
+                self.writer.submit(mmcv.imwrite, mmcv.rgb2bgr(vis),
+                                   osp.join(img_out_dir, img_name))
+            results.append(vis)
             self.num_visualized_imgs += 1
 
         return results
@@ -259,14 +367,18 @@ class MMSegInferencer(BaseInferencer):
                     preds: PredType,
                     visualization: List[np.ndarray],
                     return_datasample: bool = False,
-                    pred_out_dir: str = '') -> dict:
+                    pred_out_dir: str = '',
+                    pred_format: str = 'png') -> dict:
         """Process the predictions and visualization results from ``forward``
         and ``visualize``.
 
         This method should be responsible for the following tasks:
 
         1. Pack the predictions and visualization results and return them.
-        2. Save the predictions, if it needed.
+        2. Save the predictions, if it needed. They are written by the
+           background threads of ``self.writer``, which is flushed with
+           the visualizations submitted by :meth:`visualize` before
+           returning.
 
         Args:
             preds (List[Dict]): Predictions of the model.
@@ -277,6 +389,11 @@ class MMSegInferencer(BaseInferencer):
             pred_out_dir: File to save the inference results w/o
                 visualization. If left as empty, no file will be saved.
                 Defaults to ''.
+            pred_format (str): The file format of the saved predictions.
+                ``'png'`` saves the label maps as grayscale PNG files,
+                ``'palette_png'`` saves them as palette-indexed PNG files
+                colored by the palette of the model, and ``'npy'`` saves the
+                raw label maps as ``.npy`` files. Defaults to 'png'.
 
         Returns:
             dict: Inference and visualization results with key ``predictions``
@@ -288,7 +405,11 @@ class MMSegInferencer(BaseInferencer):
               If ``return_datasample=False``, it will be the segmentation mask
               with label indice.
         """
+        if pred_format not in self.pred_formats:
+            raise ValueError(f'pred_format should be one of '
+                             f'{self.pred_formats}, but got {pred_format}')
         if return_datasample:
+            self.writer.flush()
             if len(preds) == 1:
                 return preds[0]
             else:
@@ -307,10 +428,9 @@ class MMSegInferencer(BaseInferencer):
                 results_dict['visualization'].append(vis)
             if pred_out_dir != '':
                 mmengine.mkdir_or_exist(pred_out_dir)
-                img_name = str(self.num_pred_imgs).zfill(8) + '_pred.png'
-                img_path = osp.join(pred_out_dir, img_name)
-                output = Image.fromarray(pred_data.astype(np.uint8))
-                output.save(img_path)
+                img_name = str(self.num_pred_imgs).zfill(8) + '_pred'
+                self._write_pred(pred_data, osp.join(pred_out_dir, img_name),
+                                 pred_format)
             self.num_pred_imgs += 1
 
         if len(results_dict['predictions']) == 1:
@@ -318,8 +438,25 @@ class MMSegInferencer(BaseInferencer):
             if visualization is not None:
                 results_dict['visualization'] = \
                     results_dict['visualization'][0]
+        self.writer.flush()
         return results_dict
 
+    def _write_pred(self, pred_data: np.ndarray, filename: str,
+                    pred_format: str) -> None:
+        """Submit the writing of a predicted label map without the file
+        extension to the writer."""
+        if pred_format == 'npy':
+            self.writer.submit(np.save, f'{filename}.npy', pred_data)
+        elif pred_format == 'palette_png':
+            self.writer.submit(
+                save_png,
+                pred_data.astype(np.uint8),
+                f'{filename}.png',
+                palette=self.model.dataset_meta['palette'])
+        else:
+            self.writer.submit(save_png, pred_data.astype(np.uint8),
+                               f'{filename}.png')
+
     def _init_pipeline(self, cfg: ConfigType) -> Compose:
         """Initialize the test pipeline.
 
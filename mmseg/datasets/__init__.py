@@ -19,6 +19,7 @@ from .night_driving import NightDrivingDataset
 from .pascal_context import PascalContextDataset, PascalContextDataset59
 from .potsdam import PotsdamDataset
 from .refuge import REFUGEDataset
+from .samplers import AspectRatioBatchSampler, RepeatFactorSampler
 from .stare import STAREDataset
 from .synapse import SynapseDataset
 # yapf: disable
@@ -51,5 +52,5 @@ __all__ = [
     'BioMedicalGaussianNoise', 'BioMedicalGaussianBlur',
     'BioMedicalRandomGamma', 'BioMedical3DPad', 'RandomRotFlip',
     'SynapseDataset', 'REFUGEDataset', 'MapillaryDataset_v1',
-    'MapillaryDataset_v2'
+    'MapillaryDataset_v2', 'AspectRatioBatchSampler', 'RepeatFactorSampler'
 ]
@@ -0,0 +1,161 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import hashlib
+import os
+import os.path as osp
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import mmcv
+import mmengine
+import numpy as np
+from mmengine.dist import barrier, get_local_rank
+from PIL import Image
+
+
+class AnnotationIndex:
+    """The on-disk index of the images and annotations in directories.
+
+    The index lists the images under ``img_dir`` recursively, and stores
+    their relative paths, their shapes read from the image headers and the
+    label values present in their annotations under ``ann_dir`` in columns of
+    a ``.npz`` file under ``index_dir``. It is loaded instead of listing the
+    directories again, which is slow for large datasets on network file
+    systems.
+
+    The index file is named by the hash of the directories and suffixes, and
+    records the modification time of all the sub-directories of ``img_dir``
+    and ``ann_dir``. It is rebuilt when any of them changes, i.e. files or
+    sub-directories are added, removed or renamed. The modification of the
+    content of a file is not detected.
+
+    Args:
+        index_dir (str): The directory to store the index.
+        img_dir (str): The directory of images.
+        img_suffix (str): Suffix of images.
+        ann_dir (str, optional): The directory of annotations. If it is None,
+            the label values of the annotations are not indexed.
+            Defaults to None.
+        seg_map_suffix (str): Suffix of segmentation maps.
+            Defaults to '.png'.
+        num_workers (int): The number of threads to read the image headers
+            and annotations when building the index. Defaults to 8.
+    """
+
+    def __init__(self,
+                 index_dir: str,
+                 img_dir: str,
+                 img_suffix: str,
+                 ann_dir: Optional[str] = None,
+                 seg_map_suffix: str = '.png',
+                 num_workers: int = 8) -> None:
+        self.img_dir = osp.abspath(img_dir)
+        self.img_suffix = img_suffix
+        self.ann_dir = osp.abspath(ann_dir) if ann_dir is not None else None
+        self.seg_map_suffix = seg_map_suffix
+        self.num_workers = num_workers
+        key = hashlib.md5(
+            repr((self.img_dir, img_suffix, self.ann_dir,
+                  seg_map_suffix)).encode()).hexdigest()
+        self.index_path = osp.join(index_dir, f'{key}.npz')
+
+    def load(self) -> Dict[str, np.ndarray]:
+        """Load the index, which is built by the local rank 0 of each node if
+        it does not exist or is outdated.
+
+        Returns:
+            dict[str, np.ndarray]: The columns of the index, including
+            ``img_paths`` relative to ``img_dir``, ``heights`` and
+            ``widths`` of the images, and ``label_ids`` concatenated from
+            the label values of all the annotations, which are split by
+            ``label_offsets``.
+        """
+        if get_local_rank() == 0 and self._load() is None:
+            self._build()
+        barrier()
+        index = self._load()
+        assert index is not None, \
+            f'The index {self.index_path} is changed while loading'
+        return index
+
+    def _load(self) -> Optional[Dict[str, np.ndarray]]:
+        """Load the index if it is valid, or return None."""
+        if not osp.isfile(self.index_path):
+            return None
+        with np.load(self.index_path) as npz:
+            index = dict(npz)
+        for dir_path, mtime in zip(index['dirs'], index['dir_mtimes']):
+            try:
+                if os.stat(dir_path).st_mtime_ns != mtime:
+                    return None
+            except OSError:
+                return None
+        return index
+
+    def _scan(self, root: str, suffix: Optional[str],
+              dirs: List[Tuple[str, int]]) -> List[str]:
+        """List the files under ``root`` recursively in the same way as
+        ``fileio.list_dir_or_file``, and record the modification time of the
+        directories into ``dirs``."""
+        files = []
+        # stat before listing, so that the changes during the listing make
+        # the index outdated
+        dirs.append((root, os.stat(root).st_mtime_ns))
+        for entry in os.scandir(root):
+            if not entry.name.startswith('.') and entry.is_file():
+                if suffix is not None and entry.path.endswith(suffix):
+                    files.append(osp.relpath(entry.path, self.img_dir))
+            elif osp.isdir(entry.path):
+                files.extend(self._scan(entry.path, suffix, dirs))
+        return files
+
+    def _read_sample(self, img_path: str) -> Tuple[int, int, np.ndarray]:
+        """Read the image shape and the label values of a sample."""
+        with Image.open(osp.join(self.img_dir, img_path)) as img:
+            width, height = img.size
+        if self.ann_dir is None:
+            return height, width, np.zeros(0, dtype=np.uint8)
+        seg_map_path = osp.join(
+            self.ann_dir, img_path.replace(self.img_suffix,
+                                           self.seg_map_suffix))
+        if not osp.isfile(seg_map_path):
+            return height, width, np.zeros(0, dtype=np.uint8)
+        with open(seg_map_path, 'rb') as f:
+            seg_map = mmcv.imfrombytes(
+                f.read(), flag='unchanged', backend='pillow')
+        if seg_map.dtype == np.uint8:
+            label_ids = np.flatnonzero(
+                np.bincount(seg_map.ravel(), minlength=256))
+        else:
+            label_ids = np.unique(seg_map)
+        return height, width, label_ids
+
+    def _build(self) -> None:
+        """List the directories and write the index."""
+        dirs: List[Tuple[str, int]] = []
+        img_paths = sorted(self._scan(self.img_dir, self.img_suffix, dirs))
+        if self.ann_dir is not None and osp.isdir(self.ann_dir):
+            self._scan(self.ann_dir, None, dirs)
+
+        with ThreadPoolExecutor(max(self.num_workers, 1)) as executor:
+            samples = list(executor.map(self._read_sample, img_paths))
+        label_offsets = np.cumsum([0] + [len(sample[2]) for sample in samples])
+        label_ids = np.concatenate([np.zeros(0, dtype=np.uint8)] +
+                                   [sample[2] for sample in samples])
+        if label_ids.size == 0 or label_ids.max() < 256:
+            label_ids = label_ids.astype(np.uint8)
+
+        mmengine.mkdir_or_exist(osp.dirname(self.index_path))
+        # write to a temporary file which is renamed after finished, so that
+        # the readers do not see a partial index
+        tmp_path = f'{self.index_path}.tmp-{os.getpid()}.npz'
+        np.savez(
+            tmp_path,
+            img_paths=np.array(img_paths, dtype=str),
+            heights=np.array([sample[0] for sample in samples],
+                             dtype=np.int32),
+            widths=np.array([sample[1] for sample in samples], dtype=np.int32),
+            label_ids=label_ids,
+            label_offsets=label_offsets.astype(np.int64),
+            dirs=np.array([dir_path for dir_path, _ in dirs], dtype=str),
+            dir_mtimes=np.array([mtime for _, mtime in dirs], dtype=np.int64))
+        os.replace(tmp_path, self.index_path)
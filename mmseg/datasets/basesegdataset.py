@@ -1,14 +1,21 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import copy
 import os.path as osp
-from typing import Callable, Dict, List, Optional, Sequence, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+import mmcv
 import mmengine
 import mmengine.fileio as fileio
 import numpy as np
+from mmcv.transforms import LoadAnnotations, LoadImageFromFile
 from mmengine.dataset import BaseDataset, Compose
+from mmengine.dist import all_gather_object, get_dist_info
+from PIL import Image
 
 from mmseg.registry import DATASETS
+from mmseg.utils import get_label_lut
+from .ann_index import AnnotationIndex
+from .decode_cache import DecodeCache
 
 
 @DATASETS.register_module()
@@ -77,6 +84,24 @@ class BaseSegDataset(BaseDataset):
             See https://mmengine.readthedocs.io/en/latest/api/fileio.htm
             for details. Defaults to None.
             Notes: mmcv>=2.0.0rc4, mmengine>=0.2.0 required.
+        decode_cache_dir (str, optional): The directory of the decoded data
+            cache. If it is set, the leading loading transforms of
+            ``pipeline``, i.e. ``LoadImageFromFile`` and ``LoadAnnotations``,
+            are run once on all the samples when the dataset is fully
+            initialized, and their results are written into memory-mapped
+            shard files. The later fetches read the results from the shards
+            instead of decoding the files again. See
+            :class:`mmseg.datasets.decode_cache.DecodeCache` for details.
+            Defaults to None.
+        index_cache_dir (str, optional): The directory of the annotation
+            index. If it is set and ``ann_file`` is not given, the samples
+            are loaded from an index file under it instead of listing the
+            image directory, which is built on the first run and rebuilt
+            when the directories change. The index also provides ``height``,
+            ``width`` and the ``label_ids`` present in the annotation of
+            each sample. It only supports local directories. See
+            :class:`mmseg.datasets.ann_index.AnnotationIndex` for details.
+            Defaults to None.
     """
     METAINFO: dict = dict()
 
@@ -96,7 +121,9 @@ class BaseSegDataset(BaseDataset):
                  max_refetch: int = 1000,
                  ignore_index: int = 255,
                  reduce_zero_label: bool = False,
-                 backend_args: Optional[dict] = None) -> None:
+                 backend_args: Optional[dict] = None,
+                 decode_cache_dir: Optional[str] = None,
+                 index_cache_dir: Optional[str] = None) -> None:
 
         self.img_suffix = img_suffix
         self.seg_map_suffix = seg_map_suffix
@@ -112,6 +139,7 @@ class BaseSegDataset(BaseDataset):
         self.serialize_data = serialize_data
         self.test_mode = test_mode
         self.max_refetch = max_refetch
+        self.index_cache_dir = index_cache_dir
         self.data_list: List[dict] = []
         self.data_bytes: np.ndarray
 
@@ -125,6 +153,9 @@ class BaseSegDataset(BaseDataset):
             dict(
                 label_map=self.label_map,
                 reduce_zero_label=self.reduce_zero_label))
+        # Compile ``reduce_zero_label`` and ``label_map`` into one lookup
+        # table, which is applied to the annotations when loading them
+        self.label_lut = get_label_lut(self.label_map, self.reduce_zero_label)
 
         # Update palette based on label map or generate palette
         # if it is not defined
@@ -137,6 +168,15 @@ class BaseSegDataset(BaseDataset):
 
         # Build pipeline.
         self.pipeline = Compose(pipeline)
+        self.decode_cache = DecodeCache(
+            decode_cache_dir) if decode_cache_dir is not None else None
+        # the number of leading transforms whose results are cached
+        self.num_cached_transforms = 0
+        self._img_shapes: Optional[np.ndarray] = None
+        # the columns of the serialized data list, see `_serialize_data`
+        self.shared_info: dict = dict()
+        self.path_columns: Dict[str, Tuple[str, np.ndarray, np.ndarray]] = \
+            dict()
         # Full initialize the dataset.
         if not lazy_init:
             self.full_init()
@@ -145,6 +185,47 @@ class BaseSegDataset(BaseDataset):
             assert self._metainfo.get('classes') is not None, \
                 'dataset metainfo `classes` should be specified when testing'
 
+    def full_init(self) -> None:
+        """Load annotation file and build the decoded data cache if
+        ``decode_cache_dir`` is set."""
+        if self._fully_initialized:
+            return
+        super().full_init()
+        if self.decode_cache is not None:
+            self._build_decode_cache()
+
+    def _build_decode_cache(self) -> None:
+        """Cache the results of the leading loading transforms."""
+        loaders = []
+        for transform in self.pipeline.transforms:
+            if not isinstance(transform, (LoadImageFromFile, LoadAnnotations)):
+                break
+            loaders.append(transform)
+        self.num_cached_transforms = len(loaders)
+        if self.num_cached_transforms > 0:
+            data_list = [self.get_data_info(i) for i in range(len(self))]
+            self.decode_cache.build(data_list, loaders)
+
+    def prepare_data(self, idx) -> Any:
+        """Get data processed by ``self.pipeline``, where the results of the
+        cached loading transforms are read from the decoded data cache.
+
+        Args:
+            idx (int): The index of ``data_info``.
+
+        Returns:
+            Any: Depends on ``self.pipeline``.
+        """
+        data_info = self.get_data_info(idx)
+        if self.num_cached_transforms == 0:
+            return self.pipeline(data_info)
+        data_info = self.decode_cache.load(idx, data_info)
+        for transform in self.pipeline.transforms[self.num_cached_transforms:]:
+            if data_info is None:
+                return None
+            data_info = transform(data_info)
+        return data_info
+
     @classmethod
     def get_label_map(cls,
                       new_classes: Optional[Sequence] = None
@@ -184,6 +265,228 @@ class BaseSegDataset(BaseDataset):
         else:
             return None
 
+    def _serialize_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Serialize ``self.data_list`` into columns to save memory.
+
+        The fields with the same value in all the samples, e.g.
+        ``label_map``, ``reduce_zero_label`` and ``seg_fields``, are kept
+        once in ``self.shared_info``. The paths, i.e. the string fields named
+        with the suffix ``_path``, are kept in ``self.path_columns`` as their
+        common prefix, and the concatenated bytes and end addresses of the
+        rest of them. Only the other fields are serialized per sample as
+        ``BaseDataset``. The data information is assembled lazily in
+        :meth:`get_data_info`.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Serialized result and corresponding
+            address of the other fields.
+        """
+        self.shared_info = dict()
+        self.path_columns = dict()
+        if len(self.data_list) > 0:
+            for key, value in self.data_list[0].items():
+                if isinstance(value, str) and key.endswith('_path') and all(
+                        isinstance(data_info.get(key), str)
+                        for data_info in self.data_list):
+                    paths = [data_info[key] for data_info in self.data_list]
+                    prefix = osp.commonprefix(paths)
+                    encoded = [path[len(prefix):].encode() for path in paths]
+                    self.path_columns[key] = (prefix,
+                                              np.frombuffer(
+                                                  b''.join(encoded),
+                                                  dtype=np.uint8),
+                                              np.cumsum([
+                                                  len(path) for path in encoded
+                                              ],
+                                                        dtype=np.int64))
+                elif not isinstance(value, np.ndarray) and all(
+                        key in data_info
+                        and self._same_value(data_info[key], value)
+                        for data_info in self.data_list):
+                    self.shared_info[key] = value
+        columns = set(self.shared_info) | set(self.path_columns)
+        self.data_list = [{
+            key: value
+            for key, value in data_info.items() if key not in columns
+        } for data_info in self.data_list]
+        return super()._serialize_data()
+
+    @staticmethod
+    def _same_value(a: Any, b: Any) -> bool:
+        """Whether two values of data information are the same."""
+        if a is b:
+            return True
+        if type(a) is not type(b) or isinstance(a, np.ndarray):
+            return False
+        return a == b
+
+    @staticmethod
+    def _get_column_subset(
+            data: np.ndarray, address: np.ndarray,
+            indices: Union[Sequence[int],
+                           int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the subset of a column of concatenated bytes and their end
+        addresses, the same as ``BaseDataset._get_serialized_subset``."""
+        if isinstance(indices, int):
+            indices = np.arange(len(address))[:indices] if indices >= 0 \
+                else np.arange(len(address))[indices:]
+        indices = np.asarray(indices, dtype=np.int64) % max(len(address), 1)
+        starts = np.concatenate([[0], address[:-1]])[indices]
+        ends = address[indices]
+        sub_data = np.concatenate(
+            [data[start:end] for start, end in zip(starts, ends)] +
+            [np.zeros(0, dtype=np.uint8)])
+        return sub_data, np.cumsum(ends - starts, dtype=np.int64)
+
+    def get_subset_(self, indices: Union[Sequence[int], int]) -> None:
+        """The in-place version of ``get_subset`` to convert dataset to a
+        subset of original dataset, together with the path columns and the
+        decoded data cache.
+
+        Args:
+            indices (int or Sequence[int]): The indices of the subset, see
+                ``BaseDataset.get_subset_``.
+        """
+        positions = self._get_subset_positions(indices)
+        super().get_subset_(indices)
+        if self.serialize_data:
+            self.path_columns = self._get_path_columns_subset(indices)
+        if self._img_shapes is not None:
+            self._img_shapes = self._img_shapes[positions]
+        if self.num_cached_transforms > 0:
+            self.decode_cache = self.decode_cache.get_subset(positions)
+
+    def get_subset(self, indices: Union[Sequence[int], int]) -> BaseDataset:
+        """Return a subset of dataset, together with the path columns and the
+        decoded data cache.
+
+        Args:
+            indices (int or Sequence[int]): The indices of the subset, see
+                ``BaseDataset.get_subset``.
+
+        Returns:
+            BaseDataset: A subset of dataset.
+        """
+        positions = self._get_subset_positions(indices)
+        sub_dataset = super().get_subset(indices)
+        if self.serialize_data:
+            sub_dataset.path_columns = self._get_path_columns_subset(indices)
+        if self._img_shapes is not None:
+            sub_dataset._img_shapes = self._img_shapes[positions]
+        if self.num_cached_transforms > 0:
+            sub_dataset.decode_cache = self.decode_cache.get_subset(positions)
+        return sub_dataset
+
+    def _get_subset_positions(
+            self, indices: Union[Sequence[int], int]) -> np.ndarray:
+        """Get the positions in the dataset of the samples in the subset,
+        the same as ``BaseDataset.get_subset``."""
+        positions = np.arange(len(self))
+        if isinstance(indices, int):
+            return positions[:indices] if indices >= 0 \
+                else positions[indices:]
+        return positions[np.asarray(indices, dtype=np.int64)]
+
+    def _get_path_columns_subset(
+        self, indices: Union[Sequence[int], int]
+    ) -> Dict[str, Tuple[str, np.ndarray, np.ndarray]]:
+        """Get the subset of the path columns."""
+        return {
+            key: (prefix, ) + self._get_column_subset(data, address, indices)
+            for key, (prefix, data, address) in self.path_columns.items()
+        }
+
+    def get_data_info(self, idx: int) -> dict:
+        """Get annotation by index, with the lookup table remapping the
+        labels.
+
+        Args:
+            idx (int): The index of data.
+
+        Returns:
+            dict: The idx-th annotation of the dataset.
+        """
+        data_info = super().get_data_info(idx)
+        if self.serialize_data:
+            for key, (prefix, data, address) in self.path_columns.items():
+                start = 0 if idx % len(address) == 0 else \
+                    address[idx - 1].item()
+                end = address[idx].item()
+                data_info[key] = prefix + data[start:end].tobytes().decode()
+            data_info.update(copy.deepcopy(self.shared_info))
+        if self.label_lut is not None:
+            data_info['label_lut'] = self.label_lut
+        return data_info
+
+    def get_img_shapes(self) -> np.ndarray:
+        """Get the shapes of all the images without decoding them.
+
+        The shape of an image is read from ``height`` and ``width`` of its
+        data information if they are available, or from the header of the
+        image file otherwise. In distributed environments, each rank reads a
+        shard of the images and the shapes are gathered. The shapes are
+        cached after the first call, which should be called by all the ranks.
+
+        Returns:
+            np.ndarray: The shapes (h, w) of the images, of shape (N, 2).
+        """
+        if self._img_shapes is None:
+            rank, world_size = get_dist_info()
+            shapes = [
+                self._get_img_shape(self.get_data_info(idx))
+                for idx in range(rank, len(self), world_size)
+            ]
+            img_shapes = np.zeros((len(self), 2), dtype=np.int64)
+            for i, rank_shapes in enumerate(all_gather_object(shapes)):
+                if len(rank_shapes) > 0:
+                    img_shapes[i::world_size] = rank_shapes
+            self._img_shapes = img_shapes
+        return self._img_shapes
+
+    def _get_img_shape(self, data_info: dict) -> tuple:
+        """Get the shape (h, w) of an image without decoding it."""
+        if 'height' in data_info and 'width' in data_info:
+            return data_info['height'], data_info['width']
+        with fileio.get_local_path(
+                data_info['img_path'],
+                backend_args=self.backend_args) as local_path:
+            with Image.open(local_path) as img:
+                width, height = img.size
+        return height, width
+
+    def get_cat_ids(self, idx: int) -> List[int]:
+        """Get the category ids present in the annotation of a sample.
+
+        The label values are read from ``label_ids`` of the data information
+        if they are available, e.g. from the annotation index, or by decoding
+        the annotation otherwise. They are cast to uint8 and remapped by the
+        lookup table of the dataset, the same as ``LoadAnnotations``, and the
+        ignored label is excluded.
+
+        Args:
+            idx (int): The index of data.
+
+        Returns:
+            list[int]: The category ids present in the sample.
+        """
+        data_info = self.get_data_info(idx)
+        label_ids = data_info.get('label_ids')
+        if label_ids is None:
+            seg_map = mmcv.imfrombytes(
+                fileio.get(
+                    data_info['seg_map_path'], backend_args=self.backend_args),
+                flag='unchanged',
+                backend='pillow')
+            label_ids = np.unique(seg_map)
+        # the labels above 255 wrap around as in ``LoadAnnotations``
+        label_ids = np.unique(np.asarray(label_ids).astype(np.uint8))
+        if self.label_lut is not None:
+            label_ids = np.unique(self.label_lut[label_ids])
+        return [
+            int(label_id) for label_id in label_ids
+            if label_id != self.ignore_index
+        ]
+
     def _update_palette(self) -> list:
         """Update palette after loading metainfo.
 
@@ -249,6 +552,11 @@ class BaseSegDataset(BaseDataset):
                 data_info['reduce_zero_label'] = self.reduce_zero_label
                 data_info['seg_fields'] = []
                 data_list.append(data_info)
+        elif self.index_cache_dir is not None and isinstance(
+                fileio.get_file_backend(
+                    img_dir, backend_args=self.backend_args),
+                fileio.LocalBackend):
+            data_list = self._load_data_list_from_index(img_dir, ann_dir)
         else:
             for img in fileio.list_dir_or_file(
                     dir_path=img_dir,
@@ -266,3 +574,39 @@ class BaseSegDataset(BaseDataset):
                 data_list.append(data_info)
             data_list = sorted(data_list, key=lambda x: x['img_path'])
         return data_list
+
+    def _load_data_list_from_index(self, img_dir: str,
+                                   ann_dir: Optional[str]) -> List[dict]:
+        """Load the data list from the annotation index under
+        ``index_cache_dir``.
+
+        Args:
+            img_dir (str): The directory of images.
+            ann_dir (str, optional): The directory of annotations.
+
+        Returns:
+            list[dict]: All data info of dataset.
+        """
+        index = AnnotationIndex(
+            self.index_cache_dir,
+            img_dir,
+            self.img_suffix,
+            ann_dir=ann_dir,
+            seg_map_suffix=self.seg_map_suffix).load()
+        data_list = []
+        label_offsets = index['label_offsets']
+        for i, img in enumerate(index['img_paths'].tolist()):
+            data_info = dict(
+                img_path=osp.join(img_dir, img),
+                height=int(index['heights'][i]),
+                width=int(index['widths'][i]))
+            if ann_dir is not None:
+                seg_map = img.replace(self.img_suffix, self.seg_map_suffix)
+                data_info['seg_map_path'] = osp.join(ann_dir, seg_map)
+                data_info['label_ids'] = index['label_ids'][
+                    label_offsets[i]:label_offsets[i + 1]]
+            data_info['label_map'] = self.label_map
+            data_info['reduce_zero_label'] = self.reduce_zero_label
+            data_info['seg_fields'] = []
+            data_list.append(data_info)
+        return data_list
@@ -0,0 +1,207 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import copy
+import hashlib
+import os
+import os.path as osp
+import shutil
+from typing import Callable, Dict, List, Optional, Sequence
+
+import mmengine
+import numpy as np
+from mmengine.dist import barrier, get_local_rank
+
+
+class DecodeCache:
+    """The cache of decoded data in memory-mapped shard files.
+
+    The cache runs the deterministic loading transforms, e.g.
+    ``LoadImageFromFile`` and ``LoadAnnotations``, once on all the samples of
+    a dataset, and writes the numpy arrays in their results into shard files
+    under ``cache_dir``, together with an index of the shard, offset, shape
+    and dtype of each array. The other values in the results are kept in the
+    index. Afterwards, the arrays are served as views of the shard files
+    mapped with ``np.memmap``, which are shared by all the processes on the
+    same node through the page cache.
+
+    The cache is stored in a sub-directory named by the fingerprint of the
+    samples and the loading transforms, so that it is rebuilt when either of
+    them changes.
+
+    Args:
+        cache_dir (str): The directory to store the cache.
+        shard_size (int): The maximum number of bytes of a shard file, unless
+            a single array is larger than it. Defaults to 1 GiB.
+    """
+
+    index_file = 'index.pkl'
+    # the arrays are aligned to be viewed with any dtype
+    alignment = 64
+
+    def __init__(self, cache_dir: str, shard_size: int = 1 << 30) -> None:
+        self.cache_dir = cache_dir
+        self.shard_size = shard_size
+        self.cache_path: Optional[str] = None
+        self.index: List[Optional[dict]] = []
+        self.shards: Dict[int, np.memmap] = dict()
+
+    @staticmethod
+    def get_fingerprint(data_list: Sequence[dict],
+                        loaders: Sequence[Callable]) -> str:
+        """Get the fingerprint of the samples and the loading transforms.
+
+        Args:
+            data_list (Sequence[dict]): The data information of the samples.
+            loaders (Sequence[Callable]): The loading transforms.
+
+        Returns:
+            str: The hex digest of the fingerprint.
+        """
+        md5 = hashlib.md5()
+        for loader in loaders:
+            md5.update(repr(loader).encode())
+        for data_info in data_list:
+            for key, value in sorted(data_info.items()):
+                md5.update(key.encode())
+                if isinstance(value, np.ndarray):
+                    md5.update(value.tobytes())
+                else:
+                    md5.update(repr(value).encode())
+        return md5.hexdigest()
+
+    def build(self, data_list: Sequence[dict],
+              loaders: Sequence[Callable]) -> None:
+        """Build the cache, or open it if it has been built.
+
+        The cache is built by the local rank 0 of each node, while the other
+        ranks wait for it.
+
+        Args:
+            data_list (Sequence[dict]): The data information of the samples.
+            loaders (Sequence[Callable]): The loading transforms.
+        """
+        fingerprint = self.get_fingerprint(data_list, loaders)
+        self.cache_path = osp.join(self.cache_dir, fingerprint)
+        index_path = osp.join(self.cache_path, self.index_file)
+        if get_local_rank() == 0 and not osp.exists(index_path):
+            self._write(data_list, loaders)
+        barrier()
+        self.index = mmengine.load(index_path)
+        assert len(self.index) == len(data_list), \
+            f'The cache under {self.cache_path} does not match the dataset'
+        self.shards = dict()
+
+    def _write(self, data_list: Sequence[dict],
+               loaders: Sequence[Callable]) -> None:
+        """Decode the samples and write them into shard files."""
+        assert self.cache_path is not None
+        # write to a temporary directory which is renamed after finished, so
+        # that the builders of the same cache do not see partial results
+        tmp_path = f'{self.cache_path}.tmp-{os.getpid()}'
+        mmengine.mkdir_or_exist(tmp_path)
+        index: List[Optional[dict]] = []
+        shard_id, offset = 0, 0
+        shard_file = open(osp.join(tmp_path, f'{shard_id:05d}.bin'), 'wb')
+        for data_info in data_list:
+            results: Optional[dict] = copy.deepcopy(data_info)
+            for loader in loaders:
+                results = loader(results)
+                if results is None:
+                    break
+            if results is None:
+                index.append(None)
+                continue
+
+            entry: dict = dict(arrays=dict(), values=dict())
+            for key, value in results.items():
+                # only keep the results added or modified by the loaders
+                if key in data_info and self._equal(data_info[key], value):
+                    continue
+                if isinstance(value, np.ndarray):
+                    value = np.ascontiguousarray(value)
+                    if offset > 0 and offset + value.nbytes > self.shard_size:
+                        shard_file.close()
+                        shard_id, offset = shard_id + 1, 0
+                        shard_file = open(
+                            osp.join(tmp_path, f'{shard_id:05d}.bin'), 'wb')
+                    shard_file.write(value.tobytes())
+                    entry['arrays'][key] = (shard_id, offset, value.shape,
+                                            value.dtype.str)
+                    offset += value.nbytes
+                    padding = -offset % self.alignment
+                    shard_file.write(b'\0' * padding)
+                    offset += padding
+                else:
+                    entry['values'][key] = value
+            index.append(entry)
+        shard_file.close()
+        mmengine.dump(index, osp.join(tmp_path, self.index_file))
+        try:
+            os.rename(tmp_path, self.cache_path)
+        except OSError:
+            # the cache has been built by another process
+            shutil.rmtree(tmp_path)
+
+    @staticmethod
+    def _equal(a, b) -> bool:
+        """Whether two values in the results are equal."""
+        if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+            return isinstance(a, np.ndarray) and isinstance(
+                b, np.ndarray) and np.array_equal(a, b)
+        return a == b
+
+    def _get_shard(self, shard_id: int) -> np.memmap:
+        """Map the shard file lazily in each process."""
+        if shard_id not in self.shards:
+            # use copy-on-write mapping, so that the in-place transforms do
+            # not modify the cache
+            self.shards[shard_id] = np.memmap(
+                osp.join(self.cache_path, f'{shard_id:05d}.bin'),
+                dtype=np.uint8,
+                mode='c')
+        return self.shards[shard_id]
+
+    def load(self, idx: int, data_info: dict) -> Optional[dict]:
+        """Update the data information with the cached results.
+
+        Args:
+            idx (int): The index of the sample.
+            data_info (dict): The data information of the sample.
+
+        Returns:
+            dict, optional: The results of the loading transforms, or None if
+            the loading transforms return None.
+        """
+        entry = self.index[idx]
+        if entry is None:
+            return None
+        data_info.update(copy.deepcopy(entry['values']))
+        for key, (shard_id, offset, shape, dtype) in entry['arrays'].items():
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            shard = self._get_shard(shard_id)
+            data_info[key] = shard[offset:offset +
+                                   nbytes].view(dtype).reshape(shape)
+        return data_info
+
+    def get_subset(self, positions: Sequence[int]) -> 'DecodeCache':
+        """Get the cache of a subset of the samples, which shares the shard
+        files with this cache.
+
+        Args:
+            positions (Sequence[int]): The indices of the samples in the
+                subset.
+
+        Returns:
+            DecodeCache: The cache of the subset.
+        """
+        sub_cache = copy.copy(self)
+        sub_cache.index = [self.index[i] for i in positions]
+        sub_cache.shards = dict()
+        return sub_cache
+
+    def __getstate__(self) -> dict:
+        """Do not pickle the mapped shards, which are mapped again in each
+        process."""
+        state = self.__dict__.copy()
+        state['shards'] = dict()
+        return state
@@ -0,0 +1,5 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from .batch_sampler import AspectRatioBatchSampler
+from .repeat_factor_sampler import RepeatFactorSampler
+
+__all__ = ['AspectRatioBatchSampler', 'RepeatFactorSampler']
@@ -0,0 +1,96 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from typing import Iterator, List, Sequence
+
+import numpy as np
+from torch.utils.data import BatchSampler, Sampler
+
+from mmseg.registry import DATA_SAMPLERS
+
+
+@DATA_SAMPLERS.register_module()
+class AspectRatioBatchSampler(BatchSampler):
+    """A sampler wrapper for grouping images with similar aspect ratios into
+    the same batch, so that less padding is needed to stack them.
+
+    The aspect ratios (w / h) of the images are divided into buckets by
+    ``ratio_boundaries``, and the indices from ``sampler`` are put into the
+    bucket of their aspect ratio, which is yielded as a batch once it is
+    full. The image shapes are read from ``get_img_shapes`` of the dataset,
+    e.g. :meth:`mmseg.datasets.BaseSegDataset.get_img_shapes`, without
+    decoding the images. As the indices come from ``sampler``, e.g.
+    ``DefaultSampler``, each rank groups its own shard in distributed
+    environments.
+
+    Note:
+        It can be used by the validation and test dataloaders with the
+        metrics of mmseg, e.g. :class:`mmseg.evaluation.IoUMetric`, which
+        collect the results in the order of ``sample_idx`` packed by
+        :class:`mmseg.datasets.transforms.PackSegInputs`, so the regrouped
+        order of each rank is restored and the padded samples of
+        ``DefaultSampler`` are dropped. The other metrics, which rely on
+        ``collect_results`` of mmengine to interleave the results of the
+        ranks in the order of ``DefaultSampler``, should not be used with it.
+
+    Args:
+        sampler (Sampler): Base sampler.
+        batch_size (int): Size of mini-batch.
+        drop_last (bool): If ``True``, the sampler will drop the last batch if
+            its size would be less than ``batch_size``. Defaults to False.
+        ratio_boundaries (Sequence[float]): The boundaries of the aspect
+            ratio buckets in ascending order. Defaults to (1., ), i.e. the
+            portrait and landscape images are grouped separately.
+    """
+
+    def __init__(
+        self,
+        sampler: Sampler,
+        batch_size: int,
+        drop_last: bool = False,
+        ratio_boundaries: Sequence[float] = (1., )
+    ) -> None:
+        if not isinstance(sampler, Sampler):
+            raise TypeError('sampler should be an instance of ``Sampler``, '
+                            f'but got {sampler}')
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise ValueError('batch_size should be a positive integer value, '
+                             f'but got batch_size={batch_size}')
+        assert list(ratio_boundaries) == sorted(ratio_boundaries), \
+            'ratio_boundaries should be in ascending order'
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.ratio_boundaries = ratio_boundaries
+
+        img_shapes = self.sampler.dataset.get_img_shapes()
+        aspect_ratios = img_shapes[:, 1] / img_shapes[:, 0]
+        self.bucket_ids = np.searchsorted(
+            ratio_boundaries, aspect_ratios, side='right')
+
+    def __iter__(self) -> Iterator[List[int]]:
+        buckets: List[List[int]] = [
+            [] for _ in range(len(self.ratio_boundaries) + 1)
+        ]
+        for idx in self.sampler:
+            bucket = buckets[self.bucket_ids[idx]]
+            bucket.append(idx)
+            # yield a batch of indices in the same aspect ratio bucket
+            if len(bucket) == self.batch_size:
+                yield bucket[:]
+                del bucket[:]
+
+        # yield the rest data and reset the buckets
+        left_data = [idx for bucket in buckets for idx in bucket]
+        while len(left_data) > 0:
+            if len(left_data) < self.batch_size:
+                if not self.drop_last:
+                    yield left_data[:]
+                left_data = []
+            else:
+                yield left_data[:self.batch_size]
+                left_data = left_data[self.batch_size:]
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.sampler) // self.batch_size
+        else:
+            return (len(self.sampler) + self.batch_size - 1) // self.batch_size
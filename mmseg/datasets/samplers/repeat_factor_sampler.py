@@ -0,0 +1,131 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import itertools
+import math
+from typing import Iterator, List, Optional, Sized
+
+import numpy as np
+import torch
+from mmengine.dist import all_gather_object, get_dist_info, sync_random_seed
+from torch.utils.data import Sampler
+
+from mmseg.registry import DATA_SAMPLERS
+
+
+@DATA_SAMPLERS.register_module()
+class RepeatFactorSampler(Sampler):
+    """An infinite sampler oversampling the images of rare classes for the
+    iteration-based runner.
+
+    It is a drop-in replacement of ``InfiniteSampler`` with repeat factor
+    sampling proposed in `LVIS <https://arxiv.org/abs/1908.03195>`_. For each
+    class ``c``, its repeat factor is
+
+    .. math::
+        r(c) = max(1, \\sqrt{t / f(c)})
+
+    where ``f(c)`` is the fraction of the images containing class ``c`` and
+    ``t`` is ``repeat_thr``. The repeat factor of an image is the maximum of
+    the repeat factors of the classes in it. In each pass over the dataset,
+    an image is repeated by its repeat factor with stochastic rounding, so
+    the images of rare classes are sampled more often.
+
+    The classes of the images are read from ``get_cat_ids`` of the dataset,
+    e.g. :meth:`mmseg.datasets.BaseSegDataset.get_cat_ids`, which is fast
+    with the annotation index of the dataset (``index_cache_dir``). In
+    distributed environments, each rank reads a shard of the images and the
+    classes are gathered once when the sampler is built. All the ranks draw
+    the same sequence of indices from the seed, and each of them takes its
+    own slice.
+
+    Args:
+        dataset (Sized): The dataset.
+        repeat_thr (float): The threshold of the fraction of images, below
+            which the images of a class are oversampled. Defaults to 0.01.
+        shuffle (bool): Whether shuffle the dataset or not. Defaults to True.
+        seed (int, optional): Random seed. If None, set a random seed.
+            Defaults to None.
+    """
+
+    def __init__(self,
+                 dataset: Sized,
+                 repeat_thr: float = 0.01,
+                 shuffle: bool = True,
+                 seed: Optional[int] = None) -> None:
+        rank, world_size = get_dist_info()
+        self.rank = rank
+        self.world_size = world_size
+
+        self.dataset = dataset
+        self.repeat_thr = repeat_thr
+        self.shuffle = shuffle
+        if seed is None:
+            seed = sync_random_seed()
+        self.seed = seed
+        self.size = len(dataset)
+        self.repeat_factors = self._get_repeat_factors()
+        self.indices = self._indices_of_rank()
+
+    def _get_cat_ids(self) -> List[List[int]]:
+        """Get the category ids of all the images, which are read by the
+        ranks in shards and gathered."""
+        cat_ids = [
+            self.dataset.get_cat_ids(idx)
+            for idx in range(self.rank, self.size, self.world_size)
+        ]
+        all_cat_ids: List[List[int]] = [[] for _ in range(self.size)]
+        for i, rank_cat_ids in enumerate(all_gather_object(cat_ids)):
+            all_cat_ids[i::self.world_size] = rank_cat_ids
+        return all_cat_ids
+
+    def _get_repeat_factors(self) -> np.ndarray:
+        """Get the repeat factors of all the images."""
+        all_cat_ids = self._get_cat_ids()
+        num_images: dict = dict()
+        for cat_ids in all_cat_ids:
+            for cat_id in set(cat_ids):
+                num_images[cat_id] = num_images.get(cat_id, 0) + 1
+        cat_repeats = {
+            cat_id: max(1., math.sqrt(self.repeat_thr * self.size / num))
+            for cat_id, num in num_images.items()
+        }
+        repeat_factors = [
+            max((cat_repeats[cat_id] for cat_id in cat_ids), default=1.)
+            for cat_ids in all_cat_ids
+        ]
+        return np.array(repeat_factors, dtype=np.float64)
+
+    def _infinite_indices(self) -> Iterator[int]:
+        """Infinitely yield a sequence of indices."""
+        g = torch.Generator()
+        g.manual_seed(self.seed)
+        repeat_factors = torch.from_numpy(self.repeat_factors)
+        int_parts = repeat_factors.floor()
+        frac_parts = repeat_factors - int_parts
+        while True:
+            # stochastic rounding, so that the expected number of the
+            # repeats of each image is its repeat factor
+            repeats = int_parts + (
+                torch.rand(self.size, generator=g, dtype=torch.float64) <
+                frac_parts)
+            indices = torch.repeat_interleave(
+                torch.arange(self.size), repeats.long())
+            if self.shuffle:
+                indices = indices[torch.randperm(len(indices), generator=g)]
+            yield from indices.tolist()
+
+    def _indices_of_rank(self) -> Iterator[int]:
+        """Slice the infinite indices by rank."""
+        yield from itertools.islice(self._infinite_indices(), self.rank, None,
+                                    self.world_size)
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate the indices."""
+        yield from self.indices
+
+    def __len__(self) -> int:
+        """Length of base dataset."""
+        return self.size
+
+    def set_epoch(self, epoch: int) -> None:
+        """Not supported in iteration-based runner."""
+        pass
@@ -33,6 +33,9 @@ class PackSegInputs(BaseTransform):
 
         - ``flip_direction``: the flipping direction
 
+        - ``sample_idx``: the index of the sample in the dataset, which
+            restores the order of the dataset when collecting the results
+
     Args:
         meta_keys (Sequence[str], optional): Meta keys to be packed from
             ``SegDataSample`` and collected in ``data[img_metas]``.
@@ -44,7 +47,8 @@ class PackSegInputs(BaseTransform):
     def __init__(self,
                  meta_keys=('img_path', 'seg_map_path', 'ori_shape',
                             'img_shape', 'pad_shape', 'scale_factor', 'flip',
-                            'flip_direction', 'reduce_zero_label')):
+                            'flip_direction', 'reduce_zero_label',
+                            'sample_idx')):
         self.meta_keys = meta_keys
 
     def transform(self, results: dict) -> dict:
@@ -10,7 +10,7 @@ from mmcv.transforms import LoadAnnotations as MMCV_LoadAnnotations
 from mmcv.transforms import LoadImageFromFile
 
 from mmseg.registry import TRANSFORMS
-from mmseg.utils import datafrombytes
+from mmseg.utils import datafrombytes, get_label_lut
 
 
 @TRANSFORMS.register_module()
@@ -41,6 +41,12 @@ class LoadAnnotations(MMCV_LoadAnnotations):
 
     - seg_map_path (str): Path of semantic segmentation ground truth file.
 
+    Optional Keys:
+
+    - label_lut (np.ndarray): The uint8 lookup table compiled from
+      ``reduce_zero_label`` and ``label_map`` by the dataset. If it is not
+      given, it is compiled from ``label_map`` when loading.
+
     Added Keys:
 
     - seg_fields (List)
@@ -104,19 +110,14 @@ class LoadAnnotations(MMCV_LoadAnnotations):
             'Initialize dataset with `reduce_zero_label` as ' \
             f'{results["reduce_zero_label"]} but when load annotation ' \
             f'the `reduce_zero_label` is {self.reduce_zero_label}'
-        if self.reduce_zero_label:
-            # avoid using underflow conversion
-            gt_semantic_seg[gt_semantic_seg == 0] = 255
-            gt_semantic_seg = gt_semantic_seg - 1
-            gt_semantic_seg[gt_semantic_seg == 254] = 255
-        # modify if custom classes
-        if results.get('label_map', None) is not None:
-            # Add deep copy to solve bug of repeatedly
-            # replace `gt_semantic_seg`, which is reported in
-            # https://github.com/open-mmlab/mmsegmentation/pull/1445/
-            gt_semantic_seg_copy = gt_semantic_seg.copy()
-            for old_id, new_id in results['label_map'].items():
-                gt_semantic_seg[gt_semantic_seg_copy == old_id] = new_id
+        # the lookup table is compiled by the dataset, or from the
+        # ``label_map`` of custom classes if it is not given
+        label_lut = results.get('label_lut', None)
+        if label_lut is None:
+            label_lut = get_label_lut(
+                results.get('label_map', None), self.reduce_zero_label)
+        if label_lut is not None:
+            gt_semantic_seg = np.take(label_lut, gt_semantic_seg)
         results['gt_seg_map'] = gt_semantic_seg
         results['seg_fields'].append('gt_seg_map')
 
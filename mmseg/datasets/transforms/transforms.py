@@ -214,12 +214,20 @@ class RandomCrop(BaseTransform):
         cat_max_ratio (float): The maximum ratio that single category could
             occupy.
         ignore_index (int): The label index to be ignored. Default: 255
+        batch_candidates (bool): Whether to sample the offsets of all the
+            candidate crops at once when ``cat_max_ratio < 1``, and pick the
+            first acceptable one. Otherwise, a new candidate is sampled after
+            each rejection. Defaults to False.
     """
 
+    # the number of candidate crops checked by cat_max_ratio
+    num_trials = 10
+
     def __init__(self,
                  crop_size: Union[int, Tuple[int, int]],
                  cat_max_ratio: float = 1.,
-                 ignore_index: int = 255):
+                 ignore_index: int = 255,
+                 batch_candidates: bool = False):
         super().__init__()
         assert isinstance(crop_size, int) or (
             isinstance(crop_size, tuple) and len(crop_size) == 2
@@ -232,6 +240,7 @@ class RandomCrop(BaseTransform):
         self.crop_size = crop_size
         self.cat_max_ratio = cat_max_ratio
         self.ignore_index = ignore_index
+        self.batch_candidates = batch_candidates
 
     @cache_randomness
     def crop_bbox(self, results: dict) -> tuple:
@@ -244,40 +253,76 @@ class RandomCrop(BaseTransform):
             tuple: Coordinates of the cropped image.
         """
 
-        def generate_crop_bbox(img: np.ndarray) -> tuple:
+        def generate_crop_bbox(img: np.ndarray,
+                               num: Optional[int] = None) -> tuple:
             """Randomly get a crop bounding box.
 
             Args:
                 img (np.ndarray): Original input image.
+                num (int, optional): The number of bounding boxes. If it is
+                    None, a single bounding box is returned.
 
             Returns:
-                tuple: Coordinates of the cropped image.
+                tuple: Coordinates of the cropped image, which are arrays of
+                shape (num, ) if ``num`` is not None.
             """
 
             margin_h = max(img.shape[0] - self.crop_size[0], 0)
             margin_w = max(img.shape[1] - self.crop_size[1], 0)
-            offset_h = np.random.randint(0, margin_h + 1)
-            offset_w = np.random.randint(0, margin_w + 1)
+            offset_h = np.random.randint(0, margin_h + 1, size=num)
+            offset_w = np.random.randint(0, margin_w + 1, size=num)
             crop_y1, crop_y2 = offset_h, offset_h + self.crop_size[0]
             crop_x1, crop_x2 = offset_w, offset_w + self.crop_size[1]
 
             return crop_y1, crop_y2, crop_x1, crop_x2
 
         img = results['img']
+        if self.cat_max_ratio < 1. and self.batch_candidates:
+            # the last candidate is used if all the others are rejected
+            candidates = np.stack(
+                generate_crop_bbox(img, self.num_trials + 1), axis=1)
+            for crop_bbox in candidates[:-1]:
+                if self._accept_crop(
+                        self.crop(results['gt_seg_map'], crop_bbox)):
+                    break
+            else:
+                crop_bbox = candidates[-1]
+            return tuple(crop_bbox.tolist())
+
         crop_bbox = generate_crop_bbox(img)
         if self.cat_max_ratio < 1.:
             # Repeat 10 times
-            for _ in range(10):
+            for _ in range(self.num_trials):
                 seg_temp = self.crop(results['gt_seg_map'], crop_bbox)
-                labels, cnt = np.unique(seg_temp, return_counts=True)
-                cnt = cnt[labels != self.ignore_index]
-                if len(cnt) > 1 and np.max(cnt) / np.sum(
-                        cnt) < self.cat_max_ratio:
+                if self._accept_crop(seg_temp):
                     break
                 crop_bbox = generate_crop_bbox(img)
 
         return crop_bbox
 
+    def _accept_crop(self, seg_map: np.ndarray) -> bool:
+        """Whether the crop of segmentation map has more than one category and
+        none of them occupies more than ``cat_max_ratio``.
+
+        The categories of uint8 segmentation maps are counted with
+        ``np.bincount``, which does not sort the pixels as ``np.unique``.
+
+        Args:
+            seg_map (np.ndarray): The cropped segmentation map.
+
+        Returns:
+            bool: Whether to accept the crop.
+        """
+        if seg_map.dtype == np.uint8:
+            cnt = np.bincount(seg_map.ravel(), minlength=256)
+            if 0 <= self.ignore_index < 256:
+                cnt[self.ignore_index] = 0
+            cnt = cnt[cnt > 0]
+        else:
+            labels, cnt = np.unique(seg_map, return_counts=True)
+            cnt = cnt[labels != self.ignore_index]
+        return len(cnt) > 1 and np.max(cnt) / np.sum(cnt) < self.cat_max_ratio
+
     def crop(self, img: np.ndarray, crop_bbox: tuple) -> np.ndarray:
         """Crop from ``img``
 
@@ -580,6 +625,12 @@ class PhotoMetricDistortion(BaseTransform):
     6. convert color from HSV to BGR
     7. random contrast (mode 1)
 
+    All the parameters are sampled up front. For uint8 images, the brightness
+    and contrast distortions are applied with a 256-entry lookup table, and
+    the saturation and hue distortions are applied in a single round trip to
+    HSV. :class:`mmseg.models.BatchPhotoMetricDistortion` applies the same
+    distortions to a batch of images on device in the data preprocessor.
+
     Required Keys:
 
     - img
@@ -692,9 +743,56 @@ class PhotoMetricDistortion(BaseTransform):
             img = mmcv.hsv2bgr(img)
         return img
 
+    def _get_params(self) -> dict:
+        """Sample all the parameters of the distortions up front, in the same
+        order as they are applied sequentially.
+
+        Returns:
+            dict: The parameters, where the distortions which are not applied
+            are None.
+        """
+        params = dict(
+            brightness=None, contrast=None, saturation=None, hue=None)
+        if random.randint(2):
+            params['brightness'] = random.uniform(-self.brightness_delta,
+                                                  self.brightness_delta)
+        # mode == 1 --> do random contrast first
+        # mode == 0 --> do random contrast last
+        params['mode'] = mode = random.randint(2)
+        if mode == 1 and random.randint(2):
+            params['contrast'] = random.uniform(self.contrast_lower,
+                                                self.contrast_upper)
+        if random.randint(2):
+            params['saturation'] = random.uniform(self.saturation_lower,
+                                                  self.saturation_upper)
+        if random.randint(2):
+            params['hue'] = random.randint(-self.hue_delta, self.hue_delta)
+        if mode == 0 and random.randint(2):
+            params['contrast'] = random.uniform(self.contrast_lower,
+                                                self.contrast_upper)
+        return params
+
+    def _get_lut(self,
+                 brightness: Optional[float] = None,
+                 contrast: Optional[float] = None) -> Optional[np.ndarray]:
+        """Compose the brightness and contrast distortions of uint8 images
+        into a lookup table, which gives the same results as ``convert``."""
+        if brightness is None and contrast is None:
+            return None
+        lut = np.arange(256, dtype=np.uint8)
+        if brightness is not None:
+            lut = self.convert(lut, beta=brightness)
+        if contrast is not None:
+            lut = self.convert(lut, alpha=contrast)
+        return lut
+
     def transform(self, results: dict) -> dict:
         """Transform function to perform photometric distortion on images.
 
+        For uint8 images, the brightness and contrast distortions are applied
+        with a lookup table, and the saturation and hue distortions share a
+        single round trip to HSV.
+
         Args:
             results (dict): Result dict from loading pipeline.
 
@@ -703,6 +801,40 @@ class PhotoMetricDistortion(BaseTransform):
         """
 
         img = results['img']
+        if img.dtype != np.uint8:
+            results['img'] = self._transform_sequential(img)
+            return results
+
+        params = self._get_params()
+        # random brightness, and random contrast if mode == 1
+        lut = self._get_lut(
+            params['brightness'],
+            params['contrast'] if params['mode'] == 1 else None)
+        if lut is not None:
+            img = cv2.LUT(img, lut)
+
+        # random saturation and hue
+        if params['saturation'] is not None or params['hue'] is not None:
+            img = mmcv.bgr2hsv(img)
+            if params['saturation'] is not None:
+                img[:, :, 1] = self.convert(
+                    img[:, :, 1], alpha=params['saturation'])
+            if params['hue'] is not None:
+                img[:, :, 0] = (img[:, :, 0].astype(int) + params['hue']) % 180
+            img = mmcv.hsv2bgr(img)
+
+        # random contrast if mode == 0
+        if params['mode'] == 0:
+            lut = self._get_lut(contrast=params['contrast'])
+            if lut is not None:
+                img = cv2.LUT(img, lut)
+
+        results['img'] = img
+        return results
+
+    def _transform_sequential(self, img: np.ndarray) -> np.ndarray:
+        """Apply the distortions one by one to the images which are not
+        uint8."""
         # random brightness
         img = self.brightness(img)
 
@@ -722,8 +854,7 @@ class PhotoMetricDistortion(BaseTransform):
         if mode == 0:
             img = self.contrast(img)
 
-        results['img'] = img
-        return results
+        return img
 
     def __repr__(self):
         repr_str = self.__class__.__name__
@@ -1269,29 +1400,27 @@ class GenerateEdge(BaseTransform):
             dict: Result dict with edge mask.
         """
         h, w = results['img_shape']
-        edge = np.zeros((h, w), dtype=np.uint8)
         seg_map = results['gt_seg_map']
-
-        # down
-        edge_down = edge[1:h, :]
-        edge_down[(seg_map[1:h, :] != seg_map[:h - 1, :])
-                  & (seg_map[1:h, :] != self.ignore_index) &
-                  (seg_map[:h - 1, :] != self.ignore_index)] = 1
-        # left
-        edge_left = edge[:, :w - 1]
-        edge_left[(seg_map[:, :w - 1] != seg_map[:, 1:w])
-                  & (seg_map[:, :w - 1] != self.ignore_index) &
-                  (seg_map[:, 1:w] != self.ignore_index)] = 1
-        # up_left
-        edge_upleft = edge[:h - 1, :w - 1]
-        edge_upleft[(seg_map[:h - 1, :w - 1] != seg_map[1:h, 1:w])
-                    & (seg_map[:h - 1, :w - 1] != self.ignore_index) &
-                    (seg_map[1:h, 1:w] != self.ignore_index)] = 1
-        # up_right
-        edge_upright = edge[:h - 1, 1:w]
-        edge_upright[(seg_map[:h - 1, 1:w] != seg_map[1:h, :w - 1])
-                     & (seg_map[:h - 1, 1:w] != self.ignore_index) &
-                     (seg_map[1:h, :w - 1] != self.ignore_index)] = 1
+        valid = seg_map != self.ignore_index
+        edge = np.zeros((h, w), dtype=bool)
+        diff = np.empty((h, w), dtype=bool)
+
+        # the pixels compared with their neighbours in the directions of down,
+        # left, up_left and up_right, where the edges are marked on the former
+        neighbours = [
+            (np.s_[1:h, :], np.s_[:h - 1, :]),
+            (np.s_[:, :w - 1], np.s_[:, 1:w]),
+            (np.s_[:h - 1, :w - 1], np.s_[1:h, 1:w]),
+            (np.s_[:h - 1, 1:w], np.s_[1:h, :w - 1]),
+        ]
+        for src, dst in neighbours:
+            # reuse a buffer instead of allocating the temporary masks
+            out = diff[src]
+            np.not_equal(seg_map[src], seg_map[dst], out=out)
+            out &= valid[src]
+            out &= valid[dst]
+            edge[src] |= out
+        edge = edge.view(np.uint8)
 
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT,
                                            (self.edge_width, self.edge_width))
@@ -2,7 +2,7 @@
 import os.path as osp
 import shutil
 from collections import OrderedDict
-from typing import Dict, Optional, Sequence
+from typing import Dict, Optional, Sequence, Tuple
 
 try:
 
@@ -12,14 +12,19 @@ except ImportError:
     CSLabels = None
     CSEval = None
 
+import mmcv
 import numpy as np
-from mmengine.dist import is_main_process, master_only
+import torch
+from mmengine import fileio
+from mmengine.dist import broadcast_object_list, is_main_process, master_only
 from mmengine.evaluator import BaseMetric
 from mmengine.logging import MMLogger, print_log
 from mmengine.utils import mkdir_or_exist
-from PIL import Image
+from prettytable import PrettyTable
 
 from mmseg.registry import METRICS
+from mmseg.utils import AsyncWriter, apply_label_lut, save_png
+from .utils import collect_results_in_order
 
 
 @METRICS.register_module()
@@ -43,6 +48,23 @@ class CityscapesMetric(BaseMetric):
             names to disambiguate homonymous metrics of different evaluators.
             If prefix is not provided in the argument, self.default_prefix
             will be used instead. Defaults to None.
+        num_writers (int): The number of background threads that encode and
+            write the predictions to ``output_dir``, so that writing does not
+            block the evaluation. If it is 0, the predictions are written
+            synchronously. Defaults to 0.
+        png_compress_level (int): The zlib compression level of the output
+            PNG files, from 0 (no compression) to 9 (best compression).
+            Defaults to 6.
+        convert_on_device (bool): Whether to convert the predicted trainIds
+            to labelIds on the device of predictions, so that only the uint8
+            labelIds are transferred to host. Defaults to False.
+        native_eval (bool): Whether to compute the scores of the official
+            cityscapesscripts in process, from the in-memory predictions and
+            ground truth together with the ``*_gtFine_instanceIds.png``
+            instance maps, instead of writing the predictions to disk and
+            evaluating the file lists after all batches. The per-image
+            statistics are computed on each rank, and the predictions are
+            only written when ``keep_results`` is True. Defaults to False.
     """
 
     def __init__(self,
@@ -52,6 +74,10 @@ class CityscapesMetric(BaseMetric):
                  keep_results: bool = False,
                  collect_device: str = 'cpu',
                  prefix: Optional[str] = None,
+                 num_writers: int = 0,
+                 png_compress_level: int = 6,
+                 convert_on_device: bool = False,
+                 native_eval: bool = False,
                  **kwargs) -> None:
         super().__init__(collect_device=collect_device, prefix=prefix)
         if CSEval is None:
@@ -67,6 +93,13 @@ class CityscapesMetric(BaseMetric):
                 f'set keep_results as True, but got {keep_results}')
         self.keep_results = keep_results
         self.prefix = prefix
+        self.png_compress_level = png_compress_level
+        self.writer = AsyncWriter(num_workers=num_writers)
+        self.convert_on_device = convert_on_device
+        self.label_id_lut = self._build_label_id_lut()
+        self.native_eval = native_eval
+        if native_eval:
+            self._build_native_eval_info()
         if is_main_process():
             mkdir_or_exist(self.output_dir)
 
@@ -89,15 +122,27 @@ class CityscapesMetric(BaseMetric):
         mkdir_or_exist(self.output_dir)
 
         for data_sample in data_samples:
-            pred_label = data_sample['pred_sem_seg']['data'][0].cpu().numpy()
-            # when evaluating with official cityscapesscripts,
-            # labelIds should be used
-            pred_label = self._convert_to_label_id(pred_label)
+            pred_label = data_sample['pred_sem_seg']['data'][0]
             basename = osp.splitext(osp.basename(data_sample['img_path']))[0]
             png_filename = osp.abspath(
                 osp.join(self.output_dir, f'{basename}.png'))
-            output = Image.fromarray(pred_label.astype(np.uint8)).convert('P')
-            output.save(png_filename)
+            if self.native_eval and not self.format_only:
+                if self.keep_results:
+                    self._save_label_id(pred_label, png_filename)
+                gt_label = data_sample['gt_sem_seg']['data'][0]
+                instance_filename = data_sample['seg_map_path'].replace(
+                    'labelTrainIds.png', 'instanceIds.png')
+                instance_map = mmcv.imfrombytes(
+                    fileio.get(instance_filename),
+                    flag='unchanged',
+                    backend='pillow')
+                self.results.append(
+                    (data_sample.get('sample_idx'),
+                     self._compute_native_stats(pred_label.cpu().numpy(),
+                                                gt_label.cpu().numpy(),
+                                                instance_map)))
+                continue
+            self._save_label_id(pred_label, png_filename)
             if self.format_only:
                 # format_only always for test dataset without ground truth
                 gt_filename = ''
@@ -106,7 +151,63 @@ class CityscapesMetric(BaseMetric):
                 # **_gtFine_labelIds.png is used
                 gt_filename = data_sample['seg_map_path'].replace(
                     'labelTrainIds.png', 'labelIds.png')
-            self.results.append((png_filename, gt_filename))
+            self.results.append(
+                (data_sample.get('sample_idx'), (png_filename, gt_filename)))
+
+    def _save_label_id(self, pred_label: torch.Tensor,
+                       png_filename: str) -> None:
+        """Convert the predicted trainIds to labelIds and write them."""
+        # when evaluating with official cityscapesscripts,
+        # labelIds should be used
+        if self.convert_on_device:
+            pred_label = apply_label_lut(pred_label,
+                                         self.label_id_lut).cpu().numpy()
+        else:
+            pred_label = self._convert_to_label_id(pred_label.cpu().numpy())
+        self.writer.submit(
+            save_png,
+            pred_label,
+            png_filename,
+            self.png_compress_level,
+            mode='P')
+
+    def evaluate(self, size: int) -> dict:
+        """Evaluate the model performance of the whole dataset after
+        processing all batches.
+
+        The results are collected in the order of their sample indices, so
+        the samples may be reordered in each rank, e.g. by
+        ``AspectRatioBatchSampler``.
+
+        Args:
+            size (int): Length of the entire validation dataset.
+
+        Returns:
+            dict: Evaluation metrics dict on the val dataset.
+        """
+        # make sure the predictions of all ranks have been written before
+        # evaluating them
+        self.writer.flush()
+        results = collect_results_in_order(self.results, size,
+                                           self.collect_device,
+                                           getattr(self, 'collect_dir', None))
+
+        if is_main_process():
+            _metrics = self.compute_metrics(results)
+            if self.prefix:
+                _metrics = {
+                    '/'.join((self.prefix, k)): v
+                    for k, v in _metrics.items()
+                }
+            metrics = [_metrics]
+        else:
+            metrics = [None]  # type: ignore
+
+        broadcast_object_list(metrics)
+
+        # reset the results list
+        self.results.clear()
+        return metrics[0]
 
     def compute_metrics(self, results: list) -> Dict[str, float]:
         """Compute the metrics from processed results.
@@ -127,6 +228,9 @@ class CityscapesMetric(BaseMetric):
             msg = '\n' + msg
         print_log(msg, logger=logger)
 
+        if self.native_eval:
+            return self._compute_native_metrics(results)
+
         eval_results = dict()
         print_log(
             f'Evaluating results under {self.output_dir} ...', logger=logger)
@@ -147,12 +251,201 @@ class CityscapesMetric(BaseMetric):
         return metric
 
     @staticmethod
-    def _convert_to_label_id(result):
+    def _build_label_id_lut() -> np.ndarray:
+        """Build the lookup table converting trainId to id for cityscapes.
+
+        Returns:
+            np.ndarray: The uint8 lookup table with 256 entries, where the
+            values which are not trainIds are kept unchanged.
+        """
+        lut = np.arange(256, dtype=np.uint8)
+        for trainId, label in CSLabels.trainId2label.items():
+            if 0 <= trainId < 256:
+                lut[trainId] = label.id
+        return lut
+
+    def _convert_to_label_id(self, result):
         """Convert trainId to id for cityscapes."""
         if isinstance(result, str):
             result = np.load(result)
-        result_copy = result.copy()
-        for trainId, label in CSLabels.trainId2label.items():
-            result_copy[result == trainId] = label.id
+        return apply_label_lut(result, self.label_id_lut)
+
+    def _build_native_eval_info(self) -> None:
+        """Build the lookup tables of the native evaluation.
+
+        The confusion matrix of the native evaluation is computed in the
+        trainId space, whose rows are the ground truth eval classes and whose
+        last column counts the predictions out of the eval classes. The
+        instance maps are indexed by labelIds.
+        """
+        eval_labels = sorted(
+            (label for label in CSLabels.labels
+             if 0 <= label.trainId < 255 and not label.ignoreInEval),
+            key=lambda label: label.trainId)
+        assert [label.trainId for label in eval_labels] == list(
+            range(len(eval_labels))), 'trainIds should be contiguous'
+        self.num_eval_classes = len(eval_labels)
+        self.eval_class_names = [label.name for label in eval_labels]
+        self.category_names = list(CSLabels.category2labels)
+        # the categories whose labels all have instances, which get an
+        # instance-level score as in cityscapesscripts
+        self.is_instance_category = np.array([
+            all(label.hasInstances
+                for label in CSLabels.category2labels[category]
+                if label.id >= 0) for category in self.category_names
+        ])
+        # the category index of each trainId, the predictions out of the
+        # eval classes are mapped to -1
+        self.train_id_category = np.full(
+            self.num_eval_classes + 1, -1, dtype=np.int64)
+        for label in eval_labels:
+            self.train_id_category[label.trainId] = self.category_names.index(
+                label.category)
+
+        max_id = max(label.id for label in CSLabels.labels)
+        # the trainId, category index and average size of the instances of
+        # each labelId, where -1 marks the instances that are not evaluated
+        self.instance_class_lut = np.full(max_id + 1, -1, dtype=np.int64)
+        self.instance_category_lut = np.full(max_id + 1, -1, dtype=np.int64)
+        self.avg_class_size = np.zeros(max_id + 1, dtype=np.float64)
+        for label in CSLabels.labels:
+            if label.id < 0 or not label.hasInstances or label.ignoreInEval:
+                continue
+            self.instance_class_lut[label.id] = label.trainId
+            self.avg_class_size[label.id] = CSEval.args.avgClassSize[
+                label.name]
+            category = self.category_names.index(label.category)
+            if self.is_instance_category[category]:
+                self.instance_category_lut[label.id] = category
+        self.has_instances = np.isin(
+            np.arange(self.num_eval_classes), self.instance_class_lut)
 
-        return result_copy
+    def _compute_native_stats(
+            self, pred_label: np.ndarray, gt_label: np.ndarray,
+            instance_map: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Compute the statistics of one image for the native evaluation.
+
+        Args:
+            pred_label (np.ndarray): The predicted trainIds of shape (H, W).
+            gt_label (np.ndarray): The ground truth trainIds of shape (H, W).
+            instance_map (np.ndarray): The ground truth instanceIds of shape
+                (H, W), where the ids larger than 1000 are
+                ``labelId * 1000 + instance index``.
+
+        Returns:
+            tuple[np.ndarray]: The confusion matrix of shape
+            (num_eval_classes, num_eval_classes + 1), the weighted true
+            positives and false negatives of the instances of each class with
+            shape (2, num_eval_classes), and those of each category with
+            shape (2, num_categories).
+        """
+        num_classes = self.num_eval_classes
+        pred_label = np.minimum(pred_label, num_classes).astype(np.int64)
+        gt_label = gt_label.astype(np.int64)
+        valid = gt_label < num_classes
+        confusion_matrix = np.bincount(
+            gt_label[valid] * (num_classes + 1) + pred_label[valid],
+            minlength=num_classes * (num_classes + 1)).reshape(
+                num_classes, num_classes + 1)
+
+        # the instances are weighted by the average size of their class,
+        # following cityscapesscripts
+        instance_mask = instance_map > 1000
+        instance_ids, instance_inds = np.unique(
+            instance_map[instance_mask], return_inverse=True)
+        label_ids = instance_ids // 1000
+        instance_classes = self.instance_class_lut[label_ids]
+        instance_categories = self.instance_category_lut[label_ids]
+        instance_preds = pred_label[instance_mask]
+        num_instances = len(instance_ids)
+        sizes = np.bincount(instance_inds, minlength=num_instances)
+        weights = self.avg_class_size[label_ids] / np.maximum(sizes, 1)
+        class_tp = np.bincount(
+            instance_inds,
+            weights=instance_preds == instance_classes[instance_inds],
+            minlength=num_instances)
+        category_tp = np.bincount(
+            instance_inds,
+            weights=self.train_id_category[instance_preds] ==
+            instance_categories[instance_inds],
+            minlength=num_instances)
+
+        instance_class_stats = np.zeros((2, num_classes))
+        instance_category_stats = np.zeros((2, len(self.category_names)))
+        for stats, inds, tp in [
+            (instance_class_stats, instance_classes, class_tp),
+            (instance_category_stats, instance_categories, category_tp)
+        ]:
+            keep = inds >= 0
+            np.add.at(stats[0], inds[keep], (tp * weights)[keep])
+            np.add.at(stats[1], inds[keep], ((sizes - tp) * weights)[keep])
+        return confusion_matrix, instance_class_stats, instance_category_stats
+
+    def _compute_native_metrics(self, results: list) -> Dict[str, float]:
+        """Compute the cityscapesscripts scores from the per-image statistics
+        of the native evaluation.
+
+        Args:
+            results (list): The per-image statistics returned by
+                :meth:`_compute_native_stats`.
+
+        Returns:
+            dict[str: float]: Cityscapes evaluation results.
+        """
+        logger: MMLogger = MMLogger.get_current_instance()
+        results = tuple(zip(*results))
+        confusion_matrix = sum(results[0])
+        instance_class_stats = sum(results[1])
+        instance_category_stats = sum(results[2])
+        num_classes = self.num_eval_classes
+
+        # the false positives only count the pixels of evaluated ground truth
+        class_tp = np.diag(confusion_matrix).astype(np.float64)
+        class_fn = confusion_matrix.sum(axis=1) - class_tp
+        class_fp = confusion_matrix[:, :num_classes].sum(axis=0) - class_tp
+        category_tp = np.zeros(len(self.category_names))
+        category_fn = np.zeros(len(self.category_names))
+        category_fp = np.zeros(len(self.category_names))
+        for i in range(len(self.category_names)):
+            classes = np.flatnonzero(self.train_id_category == i)
+            tp = confusion_matrix[np.ix_(classes, classes)].sum()
+            category_tp[i] = tp
+            category_fn[i] = confusion_matrix[classes].sum() - tp
+            category_fp[i] = confusion_matrix[:, classes].sum() - tp
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            class_iou = class_tp / (class_tp + class_fp + class_fn)
+            class_iiou = instance_class_stats[0] / (
+                instance_class_stats.sum(0) + class_fp)
+            category_iou = category_tp / (
+                category_tp + category_fp + category_fn)
+            category_iiou = instance_category_stats[0] / (
+                instance_category_stats.sum(0) + category_fp)
+        class_iiou[~self.has_instances] = np.nan
+        category_iiou[~self.is_instance_category] = np.nan
+
+        class_table = PrettyTable()
+        class_table.add_column('Class', self.eval_class_names)
+        class_table.add_column('IoU', np.round(class_iou * 100, 2))
+        class_table.add_column('iIoU', np.round(class_iiou * 100, 2))
+        print_log('per class results:', logger)
+        print_log('\n' + class_table.get_string(), logger=logger)
+        category_table = PrettyTable()
+        category_table.add_column('Category', self.category_names)
+        category_table.add_column('IoU', np.round(category_iou * 100, 2))
+        category_table.add_column('iIoU', np.round(category_iiou * 100, 2))
+        print_log('per category results:', logger)
+        print_log('\n' + category_table.get_string(), logger=logger)
+
+        metric = dict()
+        metric['averageScoreCategories'] = self._nanmean(category_iou)
+        metric['averageScoreInstCategories'] = self._nanmean(category_iiou)
+        return metric
+
+    @staticmethod
+    def _nanmean(scores: np.ndarray) -> float:
+        """Average the scores which are not NaN, as cityscapesscripts."""
+        scores = scores[~np.isnan(scores)]
+        if scores.size == 0:
+            return float('nan')
+        return float(scores.mean())
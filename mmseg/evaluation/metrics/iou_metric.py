@@ -5,14 +5,15 @@ from typing import Dict, List, Optional, Sequence
 
 import numpy as np
 import torch
-from mmengine.dist import is_main_process
+from mmengine.dist import all_reduce, broadcast_object_list, is_main_process
 from mmengine.evaluator import BaseMetric
 from mmengine.logging import MMLogger, print_log
 from mmengine.utils import mkdir_or_exist
-from PIL import Image
 from prettytable import PrettyTable
 
 from mmseg.registry import METRICS
+from mmseg.utils import AsyncWriter, apply_label_lut, save_png
+from .utils import collect_results_in_order
 
 
 @METRICS.register_module()
@@ -41,6 +42,19 @@ class IoUMetric(BaseMetric):
             names to disambiguate homonymous metrics of different evaluators.
             If prefix is not provided in the argument, self.default_prefix
             will be used instead. Defaults to None.
+        streaming (bool): Whether to accumulate a single running confusion
+            matrix instead of keeping the histograms of every image in
+            ``self.results``. The confusion matrices of all ranks are summed
+            with one all-reduce, so the memory and communication cost do not
+            grow with the dataset size. The confusion matrix is saved to
+            ``output_dir`` if it is set. Defaults to False.
+        num_writers (int): The number of background threads that encode and
+            write the predictions to ``output_dir``, so that writing does not
+            block the evaluation. If it is 0, the predictions are written
+            synchronously. Defaults to 0.
+        png_compress_level (int): The zlib compression level of the output
+            PNG files, from 0 (no compression) to 9 (best compression).
+            Defaults to 6.
     """
 
     def __init__(self,
@@ -52,6 +66,9 @@ class IoUMetric(BaseMetric):
                  output_dir: Optional[str] = None,
                  format_only: bool = False,
                  prefix: Optional[str] = None,
+                 streaming: bool = False,
+                 num_writers: int = 0,
+                 png_compress_level: int = 6,
                  **kwargs) -> None:
         super().__init__(collect_device=collect_device, prefix=prefix)
 
@@ -63,6 +80,14 @@ class IoUMetric(BaseMetric):
         if self.output_dir and is_main_process():
             mkdir_or_exist(self.output_dir)
         self.format_only = format_only
+        self.streaming = streaming
+        self.confusion_matrix: Optional[torch.Tensor] = None
+        self.png_compress_level = png_compress_level
+        self.writer = AsyncWriter(num_workers=num_writers)
+        # shift the labels back by one for the datasets with
+        # reduce_zero_label=True, where 255 wraps to 0
+        self.reduce_zero_label_lut = np.roll(
+            np.arange(256, dtype=np.uint8), -1)
 
     def process(self, data_batch: dict, data_samples: Sequence[dict]) -> None:
         """Process one batch of data and data_samples.
@@ -75,35 +100,116 @@ class IoUMetric(BaseMetric):
             data_samples (Sequence[dict]): A batch of outputs from the model.
         """
         num_classes = len(self.dataset_meta['classes'])
-        for data_sample in data_samples:
-            pred_label = data_sample['pred_sem_seg']['data'].squeeze()
-            # format_only always for test dataset without ground truth
-            if not self.format_only:
-                label = data_sample['gt_sem_seg']['data'].squeeze().to(
-                    pred_label)
-                self.results.append(
-                    self.intersect_and_union(pred_label, label, num_classes,
-                                             self.ignore_index))
-            # format_result
-            if self.output_dir is not None:
+        # format_only always for test dataset without ground truth
+        if not self.format_only:
+            pred_labels = [
+                data_sample['pred_sem_seg']['data'].squeeze()
+                for data_sample in data_samples
+            ]
+            labels = [
+                data_sample['gt_sem_seg']['data'].squeeze().to(pred_label)
+                for data_sample, pred_label in zip(data_samples, pred_labels)
+            ]
+            confusion_matrices = self.batch_confusion_matrix(
+                pred_labels, labels, num_classes, self.ignore_index)
+            if self.streaming:
+                # keep the running confusion matrix on device until
+                # evaluation
+                confusion_matrix = confusion_matrices.sum(dim=0)
+                if self.confusion_matrix is None:
+                    self.confusion_matrix = confusion_matrix
+                else:
+                    self.confusion_matrix += confusion_matrix
+            else:
+                # transfer the histograms of the whole batch to host at once
+                batch_areas = torch.stack(
+                    self.confusion_matrix_to_areas(confusion_matrices),
+                    dim=1).cpu()
+                # keep the sample indices to restore the order of the
+                # dataset when collecting the results
+                for data_sample, areas in zip(data_samples, batch_areas):
+                    self.results.append(
+                        (data_sample.get('sample_idx'),
+                         tuple(area.clone() for area in areas)))
+        # format_result
+        if self.output_dir is not None:
+            for data_sample in data_samples:
+                pred_label = data_sample['pred_sem_seg']['data'].squeeze()
                 basename = osp.splitext(osp.basename(
                     data_sample['img_path']))[0]
                 png_filename = osp.abspath(
                     osp.join(self.output_dir, f'{basename}.png'))
-                output_mask = pred_label.cpu().numpy()
                 # The index range of official ADE20k dataset is from 0 to 150.
                 # But the index range of output is from 0 to 149.
                 # That is because we set reduce_zero_label=True.
+                # The labels are converted to uint8 on device, which also
+                # reduces the transfer to host. They wrap around as in
+                # ``astype(np.uint8)`` before being looked up, so that the
+                # labels above 255 are valid indices of the lookup table.
+                output_mask = pred_label.to(torch.uint8)
                 if data_sample.get('reduce_zero_label', False):
-                    output_mask = output_mask + 1
-                output = Image.fromarray(output_mask.astype(np.uint8))
-                output.save(png_filename)
+                    output_mask = apply_label_lut(output_mask,
+                                                  self.reduce_zero_label_lut)
+                output_mask = output_mask.cpu().numpy()
+                self.writer.submit(save_png, output_mask, png_filename,
+                                   self.png_compress_level)
+
+    def evaluate(self, size: int) -> dict:
+        """Evaluate the model performance of the whole dataset after
+        processing all batches.
+
+        If ``streaming`` is True, the running confusion matrices of all ranks
+        are summed with one all-reduce instead of collecting the results of
+        every image. Otherwise, the results are collected in the order of
+        their sample indices, so the samples may be reordered in each rank,
+        e.g. by ``AspectRatioBatchSampler``.
+
+        Args:
+            size (int): Length of the entire validation dataset.
+
+        Returns:
+            dict: Evaluation metrics dict on the val dataset.
+        """
+        # make sure the predictions of all ranks have been written
+        self.writer.flush()
+        if self.streaming:
+            num_classes = len(self.dataset_meta['classes'])
+            confusion_matrix = self.confusion_matrix
+            if confusion_matrix is None:
+                confusion_matrix = torch.zeros(
+                    (num_classes + 1, num_classes + 1), dtype=torch.int64)
+            all_reduce(confusion_matrix)
+            results = [confusion_matrix.cpu()]
+        else:
+            results = collect_results_in_order(
+                self.results, size, self.collect_device,
+                getattr(self, 'collect_dir', None))
+
+        if is_main_process():
+            _metrics = self.compute_metrics(results)
+            if self.prefix:
+                _metrics = {
+                    '/'.join((self.prefix, k)): v
+                    for k, v in _metrics.items()
+                }
+            metrics = [_metrics]
+        else:
+            metrics = [None]  # type: ignore
+
+        broadcast_object_list(metrics)
+
+        # reset the running confusion matrix and the results
+        self.confusion_matrix = None
+        self.results.clear()
+        return metrics[0]
 
     def compute_metrics(self, results: list) -> Dict[str, float]:
         """Compute the metrics from processed results.
 
         Args:
-            results (list): The processed results of each batch.
+            results (list): The processed results of each batch. If
+                ``streaming`` is True, it only contains the confusion matrix
+                summed over the whole dataset.
 
         Returns:
             Dict[str, float]: The computed metrics. The keys are the names of
@@ -115,16 +221,26 @@ class IoUMetric(BaseMetric):
         if self.format_only:
             logger.info(f'results are saved to {osp.dirname(self.output_dir)}')
             return OrderedDict()
-        # convert list of tuples to tuple of lists, e.g.
-        # [(A_1, B_1, C_1, D_1), ...,  (A_n, B_n, C_n, D_n)] to
-        # ([A_1, ..., A_n], ..., [D_1, ..., D_n])
-        results = tuple(zip(*results))
-        assert len(results) == 4
-
-        total_area_intersect = sum(results[0])
-        total_area_union = sum(results[1])
-        total_area_pred_label = sum(results[2])
-        total_area_label = sum(results[3])
+        if self.streaming:
+            confusion_matrix = results[0]
+            if self.output_dir is not None:
+                np.save(
+                    osp.join(self.output_dir, 'confusion_matrix.npy'),
+                    confusion_matrix[:-1, :-1].numpy())
+            total_area_intersect, total_area_union, total_area_pred_label, \
+                total_area_label = self.confusion_matrix_to_areas(
+                    confusion_matrix)
+        else:
+            # convert list of tuples to tuple of lists, e.g.
+            # [(A_1, B_1, C_1, D_1), ...,  (A_n, B_n, C_n, D_n)] to
+            # ([A_1, ..., A_n], ..., [D_1, ..., D_n])
+            results = tuple(zip(*results))
+            assert len(results) == 4
+
+            total_area_intersect = sum(results[0])
+            total_area_union = sum(results[1])
+            total_area_pred_label = sum(results[2])
+            total_area_label = sum(results[3])
         ret_metrics = self.total_area_to_metrics(
             total_area_intersect, total_area_union, total_area_pred_label,
             total_area_label, self.metrics, self.nan_to_num, self.beta)
@@ -199,6 +315,109 @@ class IoUMetric(BaseMetric):
         area_union = area_pred_label + area_label - area_intersect
         return area_intersect, area_union, area_pred_label, area_label
 
+    @staticmethod
+    def batch_confusion_matrix(pred_labels: Sequence[torch.Tensor],
+                               labels: Sequence[torch.Tensor],
+                               num_classes: int,
+                               ignore_index: int) -> torch.Tensor:
+        """Calculate the confusion matrices of a batch of images.
+
+        The confusion matrices of all images are computed with one
+        ``bincount`` on the device of predictions. Instead of selecting the
+        valid pixels with boolean indexing, which synchronizes with the
+        device and allocates variable-size tensors, the ignored pixels are
+        counted into an extra bin of every image, which is dropped
+        afterwards.
+
+        The labels out of range are counted into an extra row and column of
+        the confusion matrices, the same as :meth:`intersect_and_union`,
+        where the predictions of the pixels whose ground truth is out of
+        range still count into the prediction histogram, and vice versa.
+
+        Args:
+            pred_labels (Sequence[torch.Tensor]): Prediction segmentation
+                maps of the batch. The shape of each map is (H, W).
+            labels (Sequence[torch.Tensor]): Ground truth segmentation maps of
+                the batch. The shape of each map is (H, W).
+            num_classes (int): Number of categories.
+            ignore_index (int): Index that will be ignored in evaluation.
+
+        Returns:
+            torch.Tensor: The confusion matrices with shape
+                (N, num_classes + 1, num_classes + 1), whose rows are the
+                ground truth labels and columns are the predicted labels, and
+                whose last row and column are the labels out of range.
+        """
+        # the last bin of each image counts the ignored pixels
+        size = num_classes + 1
+        num_bins = size**2 + 1
+        batch_inds = []
+        for i, (pred_label, label) in enumerate(zip(pred_labels, labels)):
+            pred_label = pred_label.long()
+            label = label.long()
+            ignored = label == ignore_index
+            pred_label = pred_label.masked_fill(
+                (pred_label < 0) | (pred_label >= num_classes), num_classes)
+            label = label.masked_fill((label < 0) | (label >= num_classes),
+                                      num_classes)
+            inds = (size * label + pred_label).masked_fill_(
+                ignored, num_bins - 1)
+            batch_inds.append(inds.flatten() + i * num_bins)
+        batch_size = len(batch_inds)
+        confusion_matrices = torch.bincount(
+            torch.cat(batch_inds), minlength=batch_size * num_bins)
+        return confusion_matrices.view(batch_size, num_bins)[:, :-1].reshape(
+            batch_size, size, size)
+
+    @staticmethod
+    def compute_confusion_matrix(pred_label: torch.tensor, label: torch.tensor,
+                                 num_classes: int,
+                                 ignore_index: int) -> torch.Tensor:
+        """Calculate the confusion matrix.
+
+        Args:
+            pred_label (torch.tensor): Prediction segmentation map. The shape
+                is (H, W).
+            label (torch.tensor): Ground truth segmentation map. The shape is
+                (H, W).
+            num_classes (int): Number of categories.
+            ignore_index (int): Index that will be ignored in evaluation.
+
+        Returns:
+            torch.Tensor: The confusion matrix with shape
+                (num_classes + 1, num_classes + 1), whose rows are the ground
+                truth labels and columns are the predicted labels, and whose
+                last row and column are the labels out of range.
+        """
+        return IoUMetric.batch_confusion_matrix([pred_label], [label],
+                                                num_classes, ignore_index)[0]
+
+    @staticmethod
+    def confusion_matrix_to_areas(confusion_matrix: torch.Tensor) -> tuple:
+        """Calculate the histograms of intersection and union from the
+        confusion matrix.
+
+        Args:
+            confusion_matrix (torch.Tensor): The confusion matrix with shape
+                (..., num_classes + 1, num_classes + 1), whose rows are the
+                ground truth labels and columns are the predicted labels, and
+                whose last row and column are the labels out of range.
+
+        Returns:
+            torch.Tensor: The intersection of prediction and ground truth
+                histogram on all classes.
+            torch.Tensor: The union of prediction and ground truth histogram on
+                all classes.
+            torch.Tensor: The prediction histogram on all classes.
+            torch.Tensor: The ground truth histogram on all classes.
+        """
+        confusion_matrix = confusion_matrix.float()
+        area_intersect = confusion_matrix.diagonal(dim1=-2, dim2=-1)[..., :-1]
+        area_pred_label = confusion_matrix.sum(dim=-2)[..., :-1]
+        area_label = confusion_matrix.sum(dim=-1)[..., :-1]
+        area_union = area_pred_label + area_label - area_intersect
+        return area_intersect, area_union, area_pred_label, area_label
+
     @staticmethod
     def total_area_to_metrics(total_area_intersect: np.ndarray,
                               total_area_union: np.ndarray,
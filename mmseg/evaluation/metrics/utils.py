@@ -0,0 +1,48 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import sys
+from typing import Optional
+
+from mmengine.dist import collect_results, is_main_process
+
+
+def collect_results_in_order(results: list,
+                             size: int,
+                             collect_device: str = 'cpu',
+                             tmpdir: Optional[str] = None) -> Optional[list]:
+    """Collect the results of all ranks in the order of the dataset.
+
+    Each item of ``results`` is a pair of the index of its sample in the
+    dataset, i.e. ``sample_idx`` in the meta information, and the result.
+    ``mmengine.dist.collect_results`` interleaves the results of the ranks
+    in the order of ``DefaultSampler`` and drops the padded samples at the
+    end, which goes wrong once the samples of a rank are reordered, e.g. by
+    ``AspectRatioBatchSampler``. Here the results are sorted by their sample
+    indices instead, and the padded samples are dropped as duplicates. If
+    any sample index is None, the results are ordered as
+    ``collect_results``.
+
+    Args:
+        results (list): The pairs of the sample index and the result of
+            each sample in this rank.
+        size (int): Length of the entire dataset.
+        collect_device (str): Device name used for collecting results from
+            different ranks, either 'cpu' or 'gpu'. Defaults to 'cpu'.
+        tmpdir (str, optional): The directory to collect the results on
+            'cpu'. Defaults to None.
+
+    Returns:
+        list, optional: The results of all the samples without the sample
+        indices in the main process, or None in the other processes.
+    """
+    kwargs = dict(tmpdir=tmpdir) if collect_device == 'cpu' else dict()
+    # collect all the results including the padded samples, which are
+    # dropped by their sample indices
+    results = collect_results(results, sys.maxsize, collect_device, **kwargs)
+    if not is_main_process():
+        return None
+    if any(sample_idx is None for sample_idx, _ in results):
+        return [result for _, result in results[:size]]
+    ordered_results = dict()
+    for sample_idx, result in results:
+        ordered_results.setdefault(sample_idx, result)
+    return [ordered_results[idx] for idx in sorted(ordered_results)]
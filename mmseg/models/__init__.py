@@ -1,5 +1,8 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 from .backbones import *  # noqa: F401,F403
+from .batch_augments import (BatchCutMix, BatchGenerateEdge,
+                             BatchPhotoMetricDistortion, BatchRandomCutOut,
+                             BatchRandomFlip, BatchRandomResizeCrop)
 from .builder import (BACKBONES, HEADS, LOSSES, SEGMENTORS, build_backbone,
                       build_head, build_loss, build_segmentor)
 from .data_preprocessor import SegDataPreProcessor
@@ -10,5 +13,7 @@ from .segmentors import *  # noqa: F401,F403
 
 __all__ = [
     'BACKBONES', 'HEADS', 'LOSSES', 'SEGMENTORS', 'build_backbone',
-    'build_head', 'build_loss', 'build_segmentor', 'SegDataPreProcessor'
+    'build_head', 'build_loss', 'build_segmentor', 'SegDataPreProcessor',
+    'BatchPhotoMetricDistortion', 'BatchGenerateEdge', 'BatchRandomResizeCrop',
+    'BatchRandomFlip', 'BatchRandomCutOut', 'BatchCutMix'
 ]
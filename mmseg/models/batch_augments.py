@@ -0,0 +1,577 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from mmengine.structures import PixelData
+from torch import Tensor
+
+from mmseg.registry import MODELS
+from mmseg.utils import SampleList
+
+
+def bgr_to_hsv(img: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
+    """Convert a batch of BGR images to HSV.
+
+    Args:
+        img (Tensor): The BGR images of shape (N, 3, H, W), whose values
+            are in [0, 255].
+
+    Returns:
+        tuple[Tensor]: The hue in degrees of [0, 360), the saturation in
+        [0, 1] and the value in [0, 255], each of shape (N, H, W).
+    """
+    blue, green, red = img.unbind(1)
+    value, max_channel = img.max(1)
+    delta = value - img.min(1)[0]
+    saturation = torch.where(value > 0, delta / value.clamp(min=1e-6),
+                             torch.zeros_like(value))
+    safe_delta = delta.clamp(min=1e-6)
+    hue = torch.stack([
+        (red - green) / safe_delta + 4,
+        (blue - red) / safe_delta + 2,
+        ((green - blue) / safe_delta) % 6,
+    ], 1).gather(1, max_channel[:, None])[:, 0]
+    hue = torch.where(delta > 0, hue * 60, torch.zeros_like(hue))
+    return hue, saturation, value
+
+
+def hsv_to_bgr(hue: Tensor, saturation: Tensor, value: Tensor) -> Tensor:
+    """Convert a batch of HSV images to BGR.
+
+    Args:
+        hue (Tensor): The hue in degrees of [0, 360), of shape (N, H, W).
+        saturation (Tensor): The saturation in [0, 1], of shape (N, H, W).
+        value (Tensor): The value in [0, 255], of shape (N, H, W).
+
+    Returns:
+        Tensor: The BGR images of shape (N, 3, H, W).
+    """
+    hue = hue / 60
+    sector = hue.floor()
+    fraction = hue - sector
+    sector = sector.long() % 6
+    p = value * (1 - saturation)
+    q = value * (1 - saturation * fraction)
+    t = value * (1 - saturation * (1 - fraction))
+    candidates = torch.stack([value, q, p, t], 1)
+    # the indices of B, G, R channels in the candidates of each sector
+    table = sector.new_tensor([[2, 2, 3, 0, 0, 1], [3, 0, 0, 1, 2, 2],
+                               [0, 1, 2, 2, 3, 0]])
+    index = table[:, sector].transpose(0, 1)
+    return candidates.gather(1, index)
+
+
+# the segmentation maps in the data samples transformed with the images
+SEG_FIELDS = ('gt_sem_seg', 'gt_edge_map')
+
+
+def stack_seg_maps(data_samples: SampleList) -> Dict[str, Tensor]:
+    """Stack the segmentation maps of the data samples.
+
+    Args:
+        data_samples (list[:obj:`SegDataSample`]): The data samples.
+
+    Returns:
+        dict[str, Tensor]: The segmentation maps of shape (N, 1, H, W) keyed
+        by the fields in ``SEG_FIELDS`` that all the data samples have.
+    """
+    return {
+        key: torch.stack(
+            [data_sample.get(key).data for data_sample in data_samples])
+        for key in SEG_FIELDS
+        if all(key in data_sample for data_sample in data_samples)
+    }
+
+
+def unstack_seg_maps(data_samples: SampleList, seg_maps: Dict[str,
+                                                              Tensor]) -> None:
+    """Set the segmentation maps of the data samples in place.
+
+    Args:
+        data_samples (list[:obj:`SegDataSample`]): The data samples.
+        seg_maps (dict[str, Tensor]): The segmentation maps of shape
+            (N, 1, H, W), as returned by :func:`stack_seg_maps`.
+    """
+    for key, batch_seg_maps in seg_maps.items():
+        for data_sample, seg_map in zip(data_samples, batch_seg_maps):
+            data_sample.set_data({key: PixelData(data=seg_map)})
+
+
+def box_masks(boxes: Tensor, height: int, width: int) -> Tensor:
+    """Get the masks of boxes.
+
+    Args:
+        boxes (Tensor): The boxes of shape (..., 4) in the format of
+            (y1, y2, x1, x2), where y2 and x2 are exclusive.
+        height (int): The height of the masks.
+        width (int): The width of the masks.
+
+    Returns:
+        Tensor: The boolean masks of shape (..., H, W).
+    """
+    ys = torch.arange(height, device=boxes.device)
+    xs = torch.arange(width, device=boxes.device)
+    y1, y2, x1, x2 = (boxes[..., i, None] for i in range(4))
+    rows = (ys >= y1) & (ys < y2)
+    cols = (xs >= x1) & (xs < x2)
+    return rows[..., :, None] & cols[..., None, :]
+
+
+@MODELS.register_module()
+class BatchPhotoMetricDistortion(nn.Module):
+    """Apply photometric distortion to a batch of images on device.
+
+    It is the batched counterpart of
+    :class:`mmseg.datasets.transforms.PhotoMetricDistortion`, and samples the
+    parameters of each image independently. Each distortion is applied with a
+    probability of ``prob``, and the contrast distortion is applied either
+    before or after the saturation and hue distortions. The images are not
+    rounded to uint8 between the distortions.
+
+    The images should be in the original pixel range [0, 255] and the BGR
+    channel order, as the batch augmentations of
+    :class:`mmseg.models.SegDataPreProcessor` are applied before the channel
+    conversion and normalization.
+
+    Args:
+        brightness_delta (int): delta of brightness. Defaults to 32.
+        contrast_range (Sequence[float]): range of contrast.
+            Defaults to (0.5, 1.5).
+        saturation_range (Sequence[float]): range of saturation.
+            Defaults to (0.5, 1.5).
+        hue_delta (int): delta of hue. Defaults to 18.
+        prob (float): The probability of applying each distortion.
+            Defaults to 0.5.
+    """
+
+    def __init__(self,
+                 brightness_delta: int = 32,
+                 contrast_range: Sequence[float] = (0.5, 1.5),
+                 saturation_range: Sequence[float] = (0.5, 1.5),
+                 hue_delta: int = 18,
+                 prob: float = 0.5):
+        super().__init__()
+        self.brightness_delta = brightness_delta
+        self.contrast_lower, self.contrast_upper = contrast_range
+        self.saturation_lower, self.saturation_upper = saturation_range
+        self.hue_delta = hue_delta
+        self.prob = prob
+
+    def _sample(self, num: int, low: float, high: float, default: float,
+                device: torch.device) -> Tensor:
+        """Sample a uniform parameter of each image, which is ``default`` if
+        the distortion is not applied."""
+        value = torch.empty(num, device=device).uniform_(low, high)
+        applied = torch.rand(num, device=device) < self.prob
+        return torch.where(applied, value, value.new_tensor(default))
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        """Distort the images.
+
+        Args:
+            inputs (Tensor): The BGR images of shape (N, 3, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The data samples,
+                which are not modified.
+
+        Returns:
+            tuple[Tensor, list[:obj:`SegDataSample`]]: The distorted images
+            and the data samples.
+        """
+        assert inputs.size(1) == 3, \
+            'BatchPhotoMetricDistortion only supports 3-channel images'
+        num, device = inputs.size(0), inputs.device
+        brightness = self._sample(num, -self.brightness_delta,
+                                  self.brightness_delta, 0, device)
+        contrast = self._sample(num, self.contrast_lower, self.contrast_upper,
+                                1, device)
+        saturation = self._sample(num, self.saturation_lower,
+                                  self.saturation_upper, 1, device)
+        hue = self._sample(num, -self.hue_delta, self.hue_delta, 0,
+                           device).round()
+        # mode == 1 --> do random contrast first
+        # mode == 0 --> do random contrast last
+        mode = torch.rand(num, device=device) < 0.5
+        contrast_first = torch.where(mode, contrast, contrast.new_tensor(1.))
+        contrast_last = torch.where(mode, contrast.new_tensor(1.), contrast)
+
+        img = inputs.float()
+        img = (img + brightness.view(-1, 1, 1, 1)).clamp(0, 255)
+        img = (img * contrast_first.view(-1, 1, 1, 1)).clamp(0, 255)
+
+        # random saturation and hue in a single round trip to HSV, where the
+        # hue delta is in the OpenCV unit of 2 degrees
+        img_hue, img_saturation, img_value = bgr_to_hsv(img)
+        img_saturation = (img_saturation * saturation.view(-1, 1, 1)).clamp(
+            0, 1)
+        img_hue = (img_hue + hue.view(-1, 1, 1) * 2) % 360
+        img = hsv_to_bgr(img_hue, img_saturation, img_value)
+
+        img = (img * contrast_last.view(-1, 1, 1, 1)).clamp(0, 255)
+        return img.to(inputs.dtype), data_samples
+
+
+@MODELS.register_module()
+class BatchGenerateEdge(nn.Module):
+    """Generate the edge maps of a batch of segmentation maps on device.
+
+    It is the batched counterpart of
+    :class:`mmseg.datasets.transforms.GenerateEdge`, which adds
+    ``gt_edge_map`` to each data sample from its ``gt_sem_seg``. The pixels
+    different from their neighbours in the directions of down, left, up_left
+    and up_right are marked as edges, unless either of them is ignored, and
+    the edges are dilated with a max pooling of ``edge_width``, the same as
+    ``cv2.dilate`` with a rectangular kernel.
+
+    Args:
+        edge_width (int): The width of edge. Defaults to 3.
+        ignore_index (int): Index that will be ignored. Defaults to 255.
+    """
+
+    def __init__(self, edge_width: int = 3, ignore_index: int = 255):
+        super().__init__()
+        self.edge_width = edge_width
+        self.ignore_index = ignore_index
+
+    def generate_edge(self, seg_maps: Tensor) -> Tensor:
+        """Generate the edge maps.
+
+        Args:
+            seg_maps (Tensor): The segmentation maps of shape (N, 1, H, W).
+
+        Returns:
+            Tensor: The edge maps of shape (N, 1, H, W) and dtype uint8.
+        """
+        valid = seg_maps != self.ignore_index
+        edge = torch.zeros_like(seg_maps, dtype=torch.bool)
+        for src, dst in (
+            (np.s_[..., 1:, :], np.s_[..., :-1, :]),
+            (np.s_[..., :, :-1], np.s_[..., :, 1:]),
+            (np.s_[..., :-1, :-1], np.s_[..., 1:, 1:]),
+            (np.s_[..., :-1, 1:], np.s_[..., 1:, :-1]),
+        ):
+            edge[src] |= (seg_maps[src] !=
+                          seg_maps[dst]) & valid[src] & valid[dst]
+
+        # the kernel is anchored at its center like cv2.dilate, which is
+        # padded asymmetrically if the edge width is even
+        before = self.edge_width // 2
+        after = self.edge_width - 1 - before
+        edge = F.pad(edge.float(), (before, after, before, after))
+        edge = F.max_pool2d(edge, self.edge_width, stride=1)
+        return edge.to(torch.uint8)
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        """Add the edge maps to the data samples.
+
+        Args:
+            inputs (Tensor): The images of shape (N, C, H, W), which are not
+                modified.
+            data_samples (list[:obj:`SegDataSample`]): The data samples with
+                ``gt_sem_seg`` of the same shape.
+
+        Returns:
+            tuple[Tensor, list[:obj:`SegDataSample`]]: The images and the data
+            samples with ``gt_edge_map``.
+        """
+        seg_maps = torch.stack(
+            [data_sample.gt_sem_seg.data for data_sample in data_samples])
+        edge_maps = self.generate_edge(seg_maps).long()
+        for data_sample, edge_map in zip(data_samples, edge_maps):
+            data_sample.gt_edge_map = PixelData(data=edge_map)
+        return inputs, data_samples
+
+
+@MODELS.register_module()
+class BatchRandomResizeCrop(nn.Module):
+    """Randomly resize and crop a batch of images and segmentation maps on
+    device.
+
+    Each image is rescaled by a ratio sampled from ``ratio_range`` keeping
+    its aspect ratio, and a region of ``crop_size`` is cropped at a random
+    position, where the regions out of the rescaled image are padded. The
+    rescaling and cropping of all the images are done by a single
+    ``grid_sample``, which is bilinear for the images and nearest for the
+    segmentation maps.
+
+    Args:
+        crop_size (int | tuple[int, int]): The size (h, w) of the crops.
+        ratio_range (tuple[float, float]): The range of the rescale ratio.
+            Defaults to (0.5, 2.0).
+        pad_val (float): The padding value of the images. Defaults to 0.
+        seg_pad_val (int): The padding value of the segmentation maps.
+            Defaults to 255.
+    """
+
+    def __init__(self,
+                 crop_size: Union[int, Tuple[int, int]],
+                 ratio_range: Tuple[float, float] = (0.5, 2.0),
+                 pad_val: float = 0,
+                 seg_pad_val: int = 255):
+        super().__init__()
+        if isinstance(crop_size, int):
+            crop_size = (crop_size, crop_size)
+        assert crop_size[0] > 0 and crop_size[1] > 0
+        assert 0 < ratio_range[0] <= ratio_range[1]
+        self.crop_size = tuple(crop_size)
+        self.ratio_range = ratio_range
+        self.pad_val = pad_val
+        self.seg_pad_val = seg_pad_val
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        """Resize and crop the images and segmentation maps.
+
+        Args:
+            inputs (Tensor): The images of shape (N, C, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The data samples.
+
+        Returns:
+            tuple[Tensor, list[:obj:`SegDataSample`]]: The images of shape
+            (N, C, crop_h, crop_w) and the data samples.
+        """
+        num, _, height, width = inputs.shape
+        crop_h, crop_w = self.crop_size
+        device = inputs.device
+        ratio = torch.empty(num, device=device).uniform_(*self.ratio_range)
+        offset_h = (torch.rand(num, device=device) *
+                    (height * ratio - crop_h + 1).clamp(min=0)).floor()
+        offset_w = (torch.rand(num, device=device) *
+                    (width * ratio - crop_w + 1).clamp(min=0)).floor()
+
+        # map the normalized coordinates of the crops to the images
+        theta = inputs.new_zeros(num, 2, 3, dtype=torch.float)
+        theta[:, 0, 0] = crop_w / (width * ratio)
+        theta[:, 0, 2] = (crop_w + 2 * offset_w) / (width * ratio) - 1
+        theta[:, 1, 1] = crop_h / (height * ratio)
+        theta[:, 1, 2] = (crop_h + 2 * offset_h) / (height * ratio) - 1
+        grid = F.affine_grid(
+            theta, (num, 1, crop_h, crop_w), align_corners=False)
+
+        # shift the values so that the zero padding of grid_sample is
+        # distinguished from the valid pixels
+        img = inputs.float() - self.pad_val
+        img = F.grid_sample(img, grid, align_corners=False) + self.pad_val
+
+        seg_maps = stack_seg_maps(data_samples)
+        for key, seg_map in seg_maps.items():
+            seg_map = F.grid_sample(
+                seg_map.float() + 1, grid, mode='nearest',
+                align_corners=False).to(seg_map.dtype) - 1
+            seg_maps[key] = seg_map.masked_fill_(seg_map < 0, self.seg_pad_val)
+        unstack_seg_maps(data_samples, seg_maps)
+        for data_sample in data_samples:
+            data_sample.set_metainfo(dict(img_shape=self.crop_size))
+        return img.to(inputs.dtype), data_samples
+
+
+@MODELS.register_module()
+class BatchRandomFlip(nn.Module):
+    """Randomly flip a batch of images and segmentation maps on device.
+
+    Args:
+        prob (float): The probability of flipping each image.
+            Defaults to 0.5.
+        direction (str): The flipping direction, either 'horizontal' or
+            'vertical'. Defaults to 'horizontal'.
+    """
+
+    def __init__(self, prob: float = 0.5, direction: str = 'horizontal'):
+        super().__init__()
+        assert 0 <= prob <= 1
+        assert direction in ('horizontal', 'vertical')
+        self.prob = prob
+        self.direction = direction
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        """Flip the images and segmentation maps.
+
+        Args:
+            inputs (Tensor): The images of shape (N, C, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The data samples.
+
+        Returns:
+            tuple[Tensor, list[:obj:`SegDataSample`]]: The flipped images and
+            data samples.
+        """
+        flip = torch.rand(inputs.size(0), device=inputs.device) < self.prob
+        dim = -1 if self.direction == 'horizontal' else -2
+        mask = flip.view(-1, 1, 1, 1)
+        inputs = torch.where(mask, inputs.flip(dim), inputs)
+        seg_maps = {
+            key: torch.where(mask, seg_map.flip(dim), seg_map)
+            for key, seg_map in stack_seg_maps(data_samples).items()
+        }
+        unstack_seg_maps(data_samples, seg_maps)
+        for data_sample, flipped in zip(data_samples, flip.tolist()):
+            data_sample.set_metainfo(
+                dict(
+                    flip=flipped,
+                    flip_direction=self.direction if flipped else None))
+        return inputs, data_samples
+
+
+@MODELS.register_module()
+class BatchRandomCutOut(nn.Module):
+    """Randomly drop rectangular regions of a batch of images and segmentation
+    maps on device.
+
+    It is the batched counterpart of
+    :class:`mmseg.datasets.transforms.RandomCutOut`.
+
+    Args:
+        prob (float): cutout probability.
+        n_holes (int | tuple[int, int]): Number of regions to be dropped.
+            If it is given as a tuple, number of holes will be randomly
+            selected from the closed interval [`n_holes[0]`, `n_holes[1]`].
+        cutout_shape (tuple[int, int] | list[tuple[int, int]], optional): The
+            candidate shape (w, h) of dropped regions, which is randomly
+            chosen for each region if a list is given. Defaults to None.
+        cutout_ratio (tuple[float, float] | list[tuple[float, float]],
+            optional): The candidate ratio (w, h) of dropped regions. Please
+            note that `cutout_shape` and `cutout_ratio` cannot be both given
+            at the same time. Defaults to None.
+        fill_in (tuple[float, float, float]): The value of pixel to fill in
+            the dropped regions. Defaults to (0, 0, 0).
+        seg_fill_in (int, optional): The labels of pixel to fill in the
+            dropped regions. If seg_fill_in is None, skip. Defaults to None.
+    """
+
+    def __init__(self,
+                 prob: float,
+                 n_holes: Union[int, Tuple[int, int]],
+                 cutout_shape: Optional[Union[Tuple[int, int],
+                                              List[Tuple[int, int]]]] = None,
+                 cutout_ratio: Optional[Union[Tuple[float, float],
+                                              List[Tuple[float,
+                                                         float]]]] = None,
+                 fill_in: Sequence[float] = (0, 0, 0),
+                 seg_fill_in: Optional[int] = None):
+        super().__init__()
+        assert 0 <= prob <= 1
+        assert (cutout_shape is None) ^ (cutout_ratio is None), \
+            'Either cutout_shape or cutout_ratio should be specified.'
+        if isinstance(n_holes, int):
+            n_holes = (n_holes, n_holes)
+        assert 0 <= n_holes[0] <= n_holes[1]
+        self.prob = prob
+        self.n_holes = tuple(n_holes)
+        self.with_ratio = cutout_ratio is not None
+        candidates = cutout_ratio if self.with_ratio else cutout_shape
+        if not isinstance(candidates, list):
+            candidates = [candidates]
+        self.register_buffer(
+            'candidates',
+            torch.tensor(candidates, dtype=torch.float).view(-1, 2), False)
+        self.fill_in = fill_in
+        self.seg_fill_in = seg_fill_in
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        """Drop the regions of the images and segmentation maps.
+
+        Args:
+            inputs (Tensor): The images of shape (N, C, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The data samples.
+
+        Returns:
+            tuple[Tensor, list[:obj:`SegDataSample`]]: The images and data
+            samples with the regions dropped.
+        """
+        num, _, height, width = inputs.shape
+        device = inputs.device
+        max_holes = self.n_holes[1]
+        applied = torch.rand(num, device=device) < self.prob
+        n_holes = torch.randint(
+            self.n_holes[0], max_holes + 1, (num, 1), device=device)
+        valid = torch.arange(max_holes, device=device) < n_holes
+
+        shapes = self.candidates[torch.randint(
+            len(self.candidates), (num, max_holes), device=device)]
+        if self.with_ratio:
+            shapes = shapes * shapes.new_tensor([width, height])
+        shapes = shapes.long()
+        y1 = (torch.rand(num, max_holes, device=device) * height).long()
+        x1 = (torch.rand(num, max_holes, device=device) * width).long()
+        boxes = torch.stack([y1, y1 + shapes[..., 1], x1, x1 + shapes[..., 0]],
+                            dim=-1)
+        masks = box_masks(boxes, height, width) & valid[..., None, None]
+        masks = (masks.any(1) & applied.view(-1, 1, 1))[:, None]
+
+        fill_in = inputs.new_tensor(self.fill_in).view(1, -1, 1, 1)
+        inputs = torch.where(masks, fill_in, inputs)
+        if self.seg_fill_in is not None:
+            seg_maps = {
+                key: seg_map.masked_fill(masks, self.seg_fill_in)
+                for key, seg_map in stack_seg_maps(data_samples).items()
+            }
+            unstack_seg_maps(data_samples, seg_maps)
+        return inputs, data_samples
+
+
+@MODELS.register_module()
+class BatchCutMix(nn.Module):
+    """Apply CutMix to a batch of images and segmentation maps on device.
+
+    A box of each image is replaced by the same box of another image in the
+    batch, together with the segmentation maps, where the area ratio of the
+    box is ``1 - lambda`` and ``lambda`` is sampled from
+    ``Beta(alpha, alpha)``.
+
+    Args:
+        alpha (float): The parameter of the beta distribution.
+            Defaults to 1.0.
+        prob (float): The probability of applying CutMix to each image.
+            Defaults to 0.5.
+    """
+
+    def __init__(self, alpha: float = 1.0, prob: float = 0.5):
+        super().__init__()
+        assert alpha > 0
+        assert 0 <= prob <= 1
+        self.alpha = alpha
+        self.prob = prob
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        """Mix the images and segmentation maps.
+
+        Args:
+            inputs (Tensor): The images of shape (N, C, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The data samples.
+
+        Returns:
+            tuple[Tensor, list[:obj:`SegDataSample`]]: The mixed images and
+            data samples.
+        """
+        num, _, height, width = inputs.shape
+        device = inputs.device
+        index = torch.randperm(num, device=device)
+        lam = torch.distributions.Beta(self.alpha, self.alpha).sample(
+            (num, )).to(device)
+        cut_h = (height * (1 - lam).sqrt()).long()
+        cut_w = (width * (1 - lam).sqrt()).long()
+        center_y = torch.randint(height, (num, ), device=device)
+        center_x = torch.randint(width, (num, ), device=device)
+        boxes = torch.stack([
+            (center_y - cut_h // 2).clamp(0, height),
+            (center_y + cut_h // 2).clamp(0, height),
+            (center_x - cut_w // 2).clamp(0, width),
+            (center_x + cut_w // 2).clamp(0, width),
+        ], -1)
+        applied = torch.rand(num, device=device) < self.prob
+        masks = (box_masks(boxes, height, width)
+                 & applied.view(-1, 1, 1))[:, None]
+
+        inputs = torch.where(masks, inputs[index], inputs)
+        seg_maps = {
+            key: torch.where(masks, seg_map[index], seg_map)
+            for key, seg_map in stack_seg_maps(data_samples).items()
+        }
+        unstack_seg_maps(data_samples, seg_maps)
+        return inputs, data_samples
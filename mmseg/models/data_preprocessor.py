@@ -1,12 +1,14 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 from numbers import Number
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 import torch
+import torch.nn as nn
 from mmengine.model import BaseDataPreprocessor
 
 from mmseg.registry import MODELS
-from mmseg.utils import stack_batch
+from mmseg.utils import SampleList, pad_data_sample
 
 
 @MODELS.register_module()
@@ -23,12 +25,16 @@ class SegDataPreProcessor(BaseDataPreprocessor):
     It provides the data pre-processing as follows
 
     - Collate and move data to the target device.
+    - Do batch augmentations like photometric distortion during training.
     - Pad inputs to the input size with defined ``pad_val``, and pad seg map
         with defined ``seg_pad_val``.
     - Stack inputs to batch_inputs.
     - Convert inputs from bgr to rgb if the shape of input is (3, H, W).
     - Normalize image with defined std and mean.
-    - Do batch augmentations like Mixup and Cutmix during training.
+
+    The inputs are copied into a single preallocated batch tensor, and
+    converted to float and normalized in place, so that no intermediate copy
+    of each image is created.
 
     Args:
         mean (Sequence[Number], optional): The pixel mean of R, G, B channels.
@@ -47,10 +53,22 @@ class SegDataPreProcessor(BaseDataPreprocessor):
             Defaults to False.
         rgb_to_bgr (bool): whether to convert image from RGB to RGB.
             Defaults to False.
-        batch_augments (list[dict], optional): Batch-level augmentations
+        batch_augments (list[dict], optional): Batch-level augmentations,
+            which are built with ``MODELS`` and applied sequentially during
+            training. They take the images of the original pixel values and
+            channel order, before the channel conversion, normalization and
+            padding. The images of the same shape are augmented as a batch.
+            Defaults to None.
+        fp16 (bool): Whether to output the batch inputs in float16, e.g. for
+            the models trained or tested with mixed precision. Defaults to
+            False.
+        channels_last (bool): Whether to output the batch inputs in the
+            channels last memory format. Defaults to False.
         test_cfg (dict, optional): The padding size config in testing, if not
             specify, will use `size` and `size_divisor` params as default.
             Defaults to None, only supports keys `size` or `size_divisor`.
+            The images of different shapes in a batch are always padded to
+            the same shape in testing.
     """
 
     def __init__(
@@ -64,6 +82,8 @@ class SegDataPreProcessor(BaseDataPreprocessor):
         bgr_to_rgb: bool = False,
         rgb_to_bgr: bool = False,
         batch_augments: Optional[List[dict]] = None,
+        fp16: bool = False,
+        channels_last: bool = False,
         test_cfg: dict = None,
     ):
         super().__init__()
@@ -89,8 +109,14 @@ class SegDataPreProcessor(BaseDataPreprocessor):
         else:
             self._enable_normalize = False
 
-        # TODO: support batch augmentations.
-        self.batch_augments = batch_augments
+        if batch_augments is not None:
+            self.batch_augments = nn.ModuleList(
+                [MODELS.build(aug) for aug in batch_augments])
+        else:
+            self.batch_augments = None
+
+        self.fp16 = fp16
+        self.channels_last = channels_last
 
         # Support different padding methods in testing
         self.test_cfg = test_cfg
@@ -109,43 +135,125 @@ class SegDataPreProcessor(BaseDataPreprocessor):
         data = self.cast_data(data)  # type: ignore
         inputs = data['inputs']
         data_samples = data.get('data_samples', None)
-        # TODO: whether normalize should be after stack_batch
-        if self.channel_conversion and inputs[0].size(0) == 3:
-            inputs = [_input[[2, 1, 0], ...] for _input in inputs]
-
-        inputs = [_input.float() for _input in inputs]
-        if self._enable_normalize:
-            inputs = [(_input - self.mean) / self.std for _input in inputs]
-
+        if training and self.batch_augments is not None:
+            inputs, data_samples = self._batch_augment(inputs, data_samples)
         if training:
             assert data_samples is not None, ('During training, ',
                                               '`data_samples` must be define.')
-            inputs, data_samples = stack_batch(
-                inputs=inputs,
-                data_samples=data_samples,
-                size=self.size,
-                size_divisor=self.size_divisor,
-                pad_val=self.pad_val,
-                seg_pad_val=self.seg_pad_val)
-
-            if self.batch_augments is not None:
-                inputs, data_samples = self.batch_augments(
-                    inputs, data_samples)
+            img_shapes = [_input.shape[-2:] for _input in inputs]
+            inputs, padding_sizes = self._stack_normalize(
+                inputs, size=self.size, size_divisor=self.size_divisor)
+            for data_sample, img_shape, padding_size in zip(
+                    data_samples, img_shapes, padding_sizes):
+                pad_data_sample(data_sample, img_shape, padding_size,
+                                self.seg_pad_val)
         else:
-            assert len(inputs) == 1, (
-                'Batch inference is not support currently, '
-                'as the image size might be different in a batch')
-            # pad images when testing
-            if self.test_cfg:
-                inputs, padded_samples = stack_batch(
-                    inputs=inputs,
-                    size=self.test_cfg.get('size', None),
-                    size_divisor=self.test_cfg.get('size_divisor', None),
-                    pad_val=self.pad_val,
-                    seg_pad_val=self.seg_pad_val)
-                for data_sample, pad_info in zip(data_samples, padded_samples):
-                    data_sample.set_metainfo({**pad_info})
-            else:
-                inputs = torch.stack(inputs, dim=0)
+            # pad the images of different shapes into a batch when testing,
+            # which are unpadded in `postprocess_result` of the segmentor
+            test_cfg = self.test_cfg or dict()
+            inputs, padding_sizes = self._stack_normalize(
+                inputs,
+                size=test_cfg.get('size', None),
+                size_divisor=test_cfg.get('size_divisor', None))
+            for data_sample, padding_size in zip(data_samples or [],
+                                                 padding_sizes):
+                data_sample.set_metainfo(
+                    dict(
+                        img_padding_size=padding_size,
+                        pad_shape=inputs.shape[-2:]))
 
         return dict(inputs=inputs, data_samples=data_samples)
+
+    def _batch_augment(
+            self, inputs: List[torch.Tensor],
+            data_samples: SampleList) -> Tuple[List[torch.Tensor], SampleList]:
+        """Apply the batch augmentations to the images.
+
+        The images are stacked into a batch if they have the same shape, or
+        augmented one by one otherwise.
+
+        Args:
+            inputs (list[Tensor]): The images of shape (C, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The data samples.
+
+        Returns:
+            tuple[list[Tensor], list[:obj:`SegDataSample`]]: The augmented
+            images and data samples.
+        """
+        inputs = [_input.float() for _input in inputs]
+        if len({_input.shape for _input in inputs}) == 1:
+            groups = [(torch.stack(inputs), data_samples)]
+        else:
+            groups = [(_input[None], [data_sample])
+                      for _input, data_sample in zip(inputs, data_samples)]
+
+        aug_inputs, aug_samples = [], []
+        for batch_inputs, batch_samples in groups:
+            for batch_aug in self.batch_augments:
+                batch_inputs, batch_samples = batch_aug(
+                    batch_inputs, batch_samples)
+            aug_inputs.extend(batch_inputs.unbind(0))
+            aug_samples.extend(batch_samples)
+        return aug_inputs, aug_samples
+
+    def _stack_normalize(
+        self,
+        inputs: List[torch.Tensor],
+        size: Optional[tuple] = None,
+        size_divisor: Optional[int] = None
+    ) -> Tuple[torch.Tensor, List[Tuple[int, int, int, int]]]:
+        """Stack the images into a padded batch, and convert their channels
+        and normalize them in place.
+
+        The images are padded at the right and bottom to the maximum shape of
+        them and ``size``, which is rounded up to be divisible by
+        ``size_divisor``. The results are the same as converting, normalizing
+        and then padding each image with ``pad_val``.
+
+        Args:
+            inputs (list[Tensor]): The images of shape (C, H, W).
+            size (tuple, optional): Fixed padding size. Defaults to None.
+            size_divisor (int, optional): The divisor of padded size.
+                Defaults to None.
+
+        Returns:
+            tuple[Tensor, list[tuple]]: The batch inputs of shape
+            (N, C, H, W), and the padding size of each image in the order of
+            (left, right, top, bottom).
+        """
+        assert len({_input.shape[0] for _input in inputs}) == 1, \
+            'Expected the channels of all inputs must be the same, ' \
+            f'but got {[_input.shape[0] for _input in inputs]}'
+        channels = inputs[0].size(0)
+        max_size = np.stack([_input.shape[-2:] for _input in inputs]).max(0)
+        if size is not None:
+            max_size = np.maximum(max_size, size[-2:])
+        if size_divisor is not None and size_divisor > 1:
+            max_size = (max_size +
+                        (size_divisor - 1)) // size_divisor * size_divisor
+        height, width = max_size.tolist()
+
+        batch_inputs = torch.empty(
+            (len(inputs), channels, height, width),
+            dtype=torch.half if self.fp16 else torch.float,
+            device=inputs[0].device,
+            memory_format=torch.channels_last
+            if self.channels_last else torch.contiguous_format)
+        swap_channels = self.channel_conversion and channels == 3
+        for batch_input, _input in zip(batch_inputs, inputs):
+            h, w = _input.shape[-2:]
+            if swap_channels:
+                for c in range(channels):
+                    batch_input[channels - 1 - c, :h, :w].copy_(_input[c])
+            else:
+                batch_input[:, :h, :w].copy_(_input)
+        if self._enable_normalize:
+            batch_inputs.sub_(self.mean).div_(self.std)
+
+        padding_sizes = []
+        for batch_input, _input in zip(batch_inputs, inputs):
+            h, w = _input.shape[-2:]
+            batch_input[:, h:].fill_(self.pad_val)
+            batch_input[:, :h, w:].fill_(self.pad_val)
+            padding_sizes.append((0, width - w, 0, height - h))
+        return batch_inputs, padding_sizes
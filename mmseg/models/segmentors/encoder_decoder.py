@@ -1,13 +1,20 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import List, Optional
+import math
+import warnings
+from collections import OrderedDict
+from itertools import groupby
+from typing import Iterator, List, Optional, Tuple
 
+import torch
 import torch.nn as nn
-import torch.nn.functional as F
+from mmengine.structures import PixelData
 from torch import Tensor
 
 from mmseg.registry import MODELS
+from mmseg.structures import SegDataSample
 from mmseg.utils import (ConfigType, OptConfigType, OptMultiConfig,
                          OptSampleList, SampleList, add_prefix)
+from ..utils import resize
 from .base import BaseSegmentor
 
 
@@ -92,6 +99,9 @@ class EncoderDecoder(BaseSegmentor):
 
         self.train_cfg = train_cfg
         self.test_cfg = test_cfg
+        # LRU cache of sliding-window blend weights, see
+        # `_get_slide_weights`
+        self._slide_weight_cache = OrderedDict()
 
         assert self.with_decode_head
 
@@ -215,10 +225,79 @@ class EncoderDecoder(BaseSegmentor):
                     padding_size=[0, 0, 0, 0])
             ] * inputs.shape[0]
 
+        if self.test_cfg.mode == 'slide' and self.test_cfg.get(
+                'argmax_in_bands', False):
+            seg_preds = self.slide_inference_in_bands(inputs, batch_img_metas)
+            return self.postprocess_seg_preds(seg_preds, data_samples)
+
         seg_logits = self.inference(inputs, batch_img_metas)
 
         return self.postprocess_result(seg_logits, data_samples)
 
+    def postprocess_seg_preds(
+            self,
+            seg_preds: Tensor,
+            data_samples: OptSampleList = None) -> SampleList:
+        """Convert predicted label maps to `SegDataSample`.
+
+        Different from :meth:`postprocess_result`, the logits are not
+        available, so the label maps are resized to the original shape with
+        nearest interpolation and only ``pred_sem_seg`` is set. The label
+        maps may be stored in a compact integer dtype, and are converted to
+        ``torch.long`` image by image.
+
+        Args:
+            seg_preds (Tensor): The predicted label maps of each input image,
+                with shape (N, 1, H, W).
+            data_samples (list[:obj:`SegDataSample`]): The seg data samples.
+                It usually includes information such as `metainfo` and
+                `gt_sem_seg`. Default to None.
+
+        Returns:
+            list[:obj:`SegDataSample`]: Segmentation results of the
+            input images. Each SegDataSample contains ``pred_sem_seg``.
+        """
+        batch_size, _, H, W = seg_preds.shape
+
+        if data_samples is None:
+            return [
+                SegDataSample(
+                    pred_sem_seg=PixelData(data=seg_preds[i].long()))
+                for i in range(batch_size)
+            ]
+
+        for i in range(batch_size):
+            img_meta = data_samples[i].metainfo
+            # remove padding area
+            if 'img_padding_size' not in img_meta:
+                padding_size = img_meta.get('padding_size', [0] * 4)
+            else:
+                padding_size = img_meta['img_padding_size']
+            padding_left, padding_right, padding_top, padding_bottom =\
+                padding_size
+            i_seg_pred = seg_preds[i:i + 1, :, padding_top:H - padding_bottom,
+                                   padding_left:W - padding_right]
+
+            flip = img_meta.get('flip', None)
+            if flip:
+                flip_direction = img_meta.get('flip_direction', None)
+                assert flip_direction in ['horizontal', 'vertical']
+                if flip_direction == 'horizontal':
+                    i_seg_pred = i_seg_pred.flip(dims=(3, ))
+                else:
+                    i_seg_pred = i_seg_pred.flip(dims=(2, ))
+
+            # resize as original shape
+            ori_shape = tuple(img_meta['ori_shape'][:2])
+            if tuple(i_seg_pred.shape[2:]) != ori_shape:
+                i_seg_pred = resize(
+                    i_seg_pred.float(), size=ori_shape, mode='nearest')
+            i_seg_pred = i_seg_pred.long()
+            data_samples[i].set_data(
+                {'pred_sem_seg': PixelData(**{'data': i_seg_pred.squeeze(0)})})
+
+        return data_samples
+
     def _forward(self,
                  inputs: Tensor,
                  data_samples: OptSampleList = None) -> Tensor:
@@ -236,6 +315,192 @@ class EncoderDecoder(BaseSegmentor):
         x = self.extract_feat(inputs)
         return self.decode_head.forward(x)
 
+    @staticmethod
+    def _get_slide_ranges(size: int, crop: int,
+                          stride: int) -> List[Tuple[int, int]]:
+        """Compute the ``(start, end)`` bounds of the crop windows of
+        sliding-window inference along one axis."""
+        grids = max(size - crop + stride - 1, 0) // stride + 1
+        ranges = []
+        for idx in range(grids):
+            end = min(idx * stride + crop, size)
+            start = max(end - crop, 0)
+            ranges.append((int(start), int(end)))
+        return ranges
+
+    def _get_slide_windows(self, h_img: int,
+                           w_img: int) -> List[Tuple[int, int, int, int]]:
+        """Compute the crop windows of sliding-window inference.
+
+        Args:
+            h_img (int): The height of the input image.
+            w_img (int): The width of the input image.
+
+        Returns:
+            List[Tuple[int, int, int, int]]: The ``(y1, y2, x1, x2)`` bound of
+                every crop window, in row-major order.
+        """
+        h_stride, w_stride = self.test_cfg.stride
+        h_crop, w_crop = self.test_cfg.crop_size
+        return [(y1, y2, x1, x2)
+                for y1, y2 in self._get_slide_ranges(h_img, h_crop, h_stride)
+                for x1, x2 in self._get_slide_ranges(w_img, w_crop, w_stride)]
+
+    def _slide_crop_logits(
+        self, inputs: Tensor, batch_img_metas: List[dict],
+        windows: List[Tuple[int, int, int, int]]
+    ) -> Iterator[Tuple[slice, Tuple[int, int, int, int], Tensor]]:
+        """Decode the crops of the given sliding windows.
+
+        By default every crop window is decoded for all images in the batch
+        at once. If ``test_cfg.crop_batch_size`` is set, crops of all windows
+        and all images are gathered into mini-batches of at most
+        ``crop_batch_size`` crops, so that each forward pass processes
+        several windows together.
+
+        Args:
+            inputs (tensor): the tensor should have a shape NxCxHxW,
+                which contains all images in the batch.
+            batch_img_metas (List[dict]): List of image metainfo.
+            windows (List[Tuple[int, int, int, int]]): The ``(y1, y2, x1,
+                x2)`` bound of the crop windows to decode.
+
+        Yields:
+            Tuple[slice, Tuple[int, int, int, int], Tensor]: The batch
+                indices of the decoded crops, their window and their seg
+                logits.
+        """
+        crop_batch_size = self.test_cfg.get('crop_batch_size', None)
+        if crop_batch_size is None:
+            for y1, y2, x1, x2 in windows:
+                crop_img = inputs[:, :, y1:y2, x1:x2]
+                # change the image shape to patch shape
+                batch_img_metas[0]['img_shape'] = crop_img.shape[2:]
+                # the output of encode_decode is seg logits tensor map
+                # with shape [N, C, H, W]
+                crop_seg_logit = self.encode_decode(crop_img, batch_img_metas)
+                yield slice(None), (y1, y2, x1, x2), crop_seg_logit
+            return
+
+        assert crop_batch_size > 0, \
+            '`crop_batch_size` should be a positive integer.'
+        # all crops share the same shape, since every window is clipped
+        # to the (padded) batch shape
+        crops = [(img_idx, window) for img_idx in range(inputs.shape[0])
+                 for window in windows]
+        for start in range(0, len(crops), crop_batch_size):
+            chunk = crops[start:start + crop_batch_size]
+            crop_imgs = torch.cat([
+                inputs[img_idx:img_idx + 1, :, y1:y2, x1:x2]
+                for img_idx, (y1, y2, x1, x2) in chunk
+            ])
+            crop_shape = crop_imgs.shape[2:]
+            crop_img_metas = [
+                dict(batch_img_metas[img_idx], img_shape=crop_shape)
+                for img_idx, _ in chunk
+            ]
+            crop_seg_logits = self.encode_decode(crop_imgs, crop_img_metas)
+            for i, (img_idx, window) in enumerate(chunk):
+                yield slice(img_idx, img_idx + 1), window, \
+                    crop_seg_logits[i:i + 1]
+
+    @staticmethod
+    def _get_window_weight_1d(size: int, blend_mode: str,
+                              device: torch.device) -> Tensor:
+        """Get the 1D blend weight of a crop window along one axis, whose
+        maximum is 1 at the window center."""
+        coords = torch.arange(size, dtype=torch.float32, device=device) + 0.5
+        if blend_mode == 'gaussian':
+            sigma = size / 8
+            weight = torch.exp(-(coords - size / 2)**2 / (2 * sigma**2))
+        else:
+            weight = torch.sin(coords * math.pi / size)**2
+        # avoid vanishing weights on the image border, where the windows
+        # are not overlapped
+        return weight.clamp_(min=1e-3)
+
+    def _get_slide_weights(
+            self, h_img: int, w_img: int,
+            device: torch.device) -> Tuple[Optional[Tensor], Tensor, Tensor]:
+        """Get the blend weights of sliding-window inference.
+
+        The crop logits are multiplied by the window weight, which is set by
+        ``test_cfg.blend_mode``: ``'uniform'`` (default) weights all pixels
+        equally, while ``'gaussian'`` and ``'cosine'`` taper the weights
+        towards the window border to reduce seams between windows. The
+        accumulated logits are normalized by the reciprocal of the sum of
+        window weights of each pixel.
+
+        As the windows form a grid and the window weight is the outer product
+        of the 1D weights along each axis, the sum of window weights is the
+        outer product of the sums along each axis. Thus the normalization is
+        kept as the row and column factors instead of a full resolution map,
+        and the rows of a band can be normalized by slicing the row factor.
+
+        The weights only depend on the image shape, crop size, stride and
+        blend mode, so they are computed once and kept in an LRU cache of
+        at most ``test_cfg.weight_cache_size`` (default 8) entries.
+
+        Args:
+            h_img (int): The height of the input image.
+            w_img (int): The width of the input image.
+            device (torch.device): The device of the weights.
+
+        Returns:
+            Tuple[Tensor, Tensor, Tensor]: The weight of a crop window with
+                shape (1, 1, h_crop, w_crop), which is None for uniform
+                weights, and the normalization factors of rows and columns
+                with shape (1, 1, H, 1) and (1, 1, 1, W).
+        """
+        blend_mode = self.test_cfg.get('blend_mode', 'uniform')
+        assert blend_mode in ('uniform', 'gaussian', 'cosine'), \
+            '`blend_mode` should be one of "uniform", "gaussian" and ' \
+            f'"cosine", but got {blend_mode}.'
+        key = (h_img, w_img, tuple(self.test_cfg.crop_size),
+               tuple(self.test_cfg.stride), blend_mode, device)
+        if key in self._slide_weight_cache:
+            self._slide_weight_cache.move_to_end(key)
+            return self._slide_weight_cache[key]
+
+        h_stride, w_stride = self.test_cfg.stride
+        h_crop, w_crop = self.test_cfg.crop_size
+        h_crop, w_crop = min(h_crop, h_img), min(w_crop, w_img)
+        if blend_mode == 'uniform':
+            h_weight = torch.ones(h_crop, device=device)
+            w_weight = torch.ones(w_crop, device=device)
+            window_weight = None
+        else:
+            h_weight = self._get_window_weight_1d(h_crop, blend_mode, device)
+            w_weight = self._get_window_weight_1d(w_crop, blend_mode, device)
+            window_weight = (h_weight[:, None] * w_weight[None, :])[None, None]
+        h_sum = torch.zeros(h_img, device=device)
+        for y1, y2 in self._get_slide_ranges(h_img, h_crop, h_stride):
+            h_sum[y1:y2] += h_weight
+        w_sum = torch.zeros(w_img, device=device)
+        for x1, x2 in self._get_slide_ranges(w_img, w_crop, w_stride):
+            w_sum[x1:x2] += w_weight
+        assert (h_sum == 0).sum() == 0 and (w_sum == 0).sum() == 0
+        weights = (window_weight, h_sum.reciprocal_().view(1, 1, h_img, 1),
+                   w_sum.reciprocal_().view(1, 1, 1, w_img))
+
+        self._slide_weight_cache[key] = weights
+        if len(self._slide_weight_cache) > self.test_cfg.get(
+                'weight_cache_size', 8):
+            self._slide_weight_cache.popitem(last=False)
+        return weights
+
+    def _get_accumulate_dtype(self, inputs: Tensor) -> torch.dtype:
+        """Get the dtype of the buffers accumulating sliding-window logits,
+        which is set by ``test_cfg.accumulate_dtype`` and defaults to the
+        dtype of inputs."""
+        accumulate_dtype = self.test_cfg.get('accumulate_dtype', None)
+        if accumulate_dtype is None:
+            return inputs.dtype
+        assert accumulate_dtype in ('float32', 'float16', 'bfloat16'), \
+            '`accumulate_dtype` should be one of "float32", "float16" and ' \
+            f'"bfloat16", but got {accumulate_dtype}.'
+        return getattr(torch, accumulate_dtype)
+
     def slide_inference(self, inputs: Tensor,
                         batch_img_metas: List[dict]) -> Tensor:
         """Inference by sliding-window with overlap.
@@ -243,6 +508,11 @@ class EncoderDecoder(BaseSegmentor):
         If h_crop > h_img or w_crop > w_img, the small patch will be used to
         decode without padding.
 
+        The logits are accumulated in ``test_cfg.accumulate_dtype`` if it is
+        set, e.g. ``'float16'`` halves the memory of the full resolution
+        logits. Note that ``'float16'`` logits can not be resized on CPU,
+        where ``'bfloat16'`` should be used instead.
+
         Args:
             inputs (tensor): the tensor should have a shape NxCxHxW,
                 which contains all images in the batch.
@@ -257,38 +527,101 @@ class EncoderDecoder(BaseSegmentor):
                 input image.
         """
 
-        h_stride, w_stride = self.test_cfg.stride
-        h_crop, w_crop = self.test_cfg.crop_size
         batch_size, _, h_img, w_img = inputs.size()
         num_classes = self.num_classes
-        h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
-        w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
-        preds = inputs.new_zeros((batch_size, num_classes, h_img, w_img))
-        count_mat = inputs.new_zeros((batch_size, 1, h_img, w_img))
-        for h_idx in range(h_grids):
-            for w_idx in range(w_grids):
-                y1 = h_idx * h_stride
-                x1 = w_idx * w_stride
-                y2 = min(y1 + h_crop, h_img)
-                x2 = min(x1 + w_crop, w_img)
-                y1 = max(y2 - h_crop, 0)
-                x1 = max(x2 - w_crop, 0)
-                crop_img = inputs[:, :, y1:y2, x1:x2]
-                # change the image shape to patch shape
-                batch_img_metas[0]['img_shape'] = crop_img.shape[2:]
-                # the output of encode_decode is seg logits tensor map
-                # with shape [N, C, H, W]
-                crop_seg_logit = self.encode_decode(crop_img, batch_img_metas)
-                preds += F.pad(crop_seg_logit,
-                               (int(x1), int(preds.shape[3] - x2), int(y1),
-                                int(preds.shape[2] - y2)))
-
-                count_mat[:, :, y1:y2, x1:x2] += 1
-        assert (count_mat == 0).sum() == 0
-        seg_logits = preds / count_mat
+        dtype = self._get_accumulate_dtype(inputs)
+        windows = self._get_slide_windows(h_img, w_img)
+        window_weight, h_norm, w_norm = self._get_slide_weights(
+            h_img, w_img, inputs.device)
+        preds = inputs.new_zeros((batch_size, num_classes, h_img, w_img),
+                                 dtype=dtype)
+        for batch_idx, (y1, y2, x1, x2), crop_seg_logit in \
+                self._slide_crop_logits(inputs, batch_img_metas, windows):
+            if window_weight is not None:
+                crop_seg_logit = crop_seg_logit * window_weight
+            preds[batch_idx, :, y1:y2, x1:x2] += crop_seg_logit
+        seg_logits = preds.mul_(h_norm).mul_(w_norm)
 
         return seg_logits
 
+    def _band_to_seg_pred(self, band: Tensor, h_norm: Tensor,
+                          w_norm: Tensor) -> Tensor:
+        """Normalize the accumulated logits of a finished row band and
+        convert them to the label map."""
+        band_logits = band * h_norm * w_norm
+        if self.out_channels > 1:
+            return band_logits.argmax(dim=1, keepdim=True)
+        return (band_logits > self.decode_head.threshold).long()
+
+    def slide_inference_in_bands(self, inputs: Tensor,
+                                 batch_img_metas: List[dict]) -> Tensor:
+        """Inference by sliding-window with overlap, predicting the label map
+        band by band.
+
+        Instead of accumulating the logits of the whole image, only the row
+        band covered by the current row of windows is kept. The rows above
+        the band, which are not overlapped by any remaining window, are
+        converted to labels and released. Thus the peak memory of logits
+        scales with the crop height rather than the image height. The band
+        is accumulated in ``test_cfg.accumulate_dtype`` if it is set. Each
+        band is normalized by the rows of the normalization factors it
+        covers, and the labels are stored as ``torch.uint8``, or
+        ``torch.int16`` for more than 256 classes.
+
+        Args:
+            inputs (tensor): the tensor should have a shape NxCxHxW,
+                which contains all images in the batch.
+            batch_img_metas (List[dict]): List of image metainfo where each may
+                also contain: 'img_shape', 'scale_factor', 'flip', 'img_path',
+                'ori_shape', and 'pad_shape'.
+                For details on the values of these keys see
+                `mmseg/datasets/pipelines/formatting.py:PackSegInputs`.
+
+        Returns:
+            Tensor: The predicted label map of each input image, with shape
+                (N, 1, H, W).
+        """
+
+        batch_size, _, h_img, w_img = inputs.size()
+        out_channels = self.out_channels
+        dtype = self._get_accumulate_dtype(inputs)
+        windows = self._get_slide_windows(h_img, w_img)
+        window_weight, h_norm, w_norm = self._get_slide_weights(
+            h_img, w_img, inputs.device)
+        label_dtype = torch.uint8 if self.num_classes <= 256 else torch.int16
+        seg_preds = inputs.new_zeros((batch_size, 1, h_img, w_img),
+                                     dtype=label_dtype)
+        band = inputs.new_zeros((batch_size, out_channels, 0, w_img),
+                                dtype=dtype)
+        band_top = 0
+        # windows are in row-major order, so that both bounds of the rows
+        # never decrease
+        for (y1, y2), row_windows in groupby(windows, key=lambda w: w[:2]):
+            if y1 > band_top:
+                # no remaining window overlaps the rows above y1
+                seg_preds[:, :, band_top:y1] = self._band_to_seg_pred(
+                    band[:, :, :y1 - band_top], h_norm[:, :, band_top:y1],
+                    w_norm)
+                band = band[:, :, y1 - band_top:]
+                band_top = y1
+            band_bottom = band_top + band.shape[2]
+            if y2 > band_bottom:
+                new_rows = band.new_zeros(
+                    (batch_size, out_channels, y2 - band_bottom, w_img))
+                band = torch.cat([band, new_rows], dim=2)
+            for batch_idx, (_, _, x1, x2), crop_seg_logit in \
+                    self._slide_crop_logits(inputs, batch_img_metas,
+                                            list(row_windows)):
+                if window_weight is not None:
+                    crop_seg_logit = crop_seg_logit * window_weight
+                band[batch_idx, :, y1 - band_top:y2 - band_top,
+                     x1:x2] += crop_seg_logit
+        seg_pred = self._band_to_seg_pred(band, h_norm[:, :, band_top:],
+                                          w_norm)
+        seg_preds[:, :, band_top:] = seg_pred
+
+        return seg_preds
+
     def whole_inference(self, inputs: Tensor,
                         batch_img_metas: List[dict]) -> Tensor:
         """Inference with full image.
@@ -307,6 +640,12 @@ class EncoderDecoder(BaseSegmentor):
                 input image.
         """
 
+        # the images of different shapes are padded to the shape of inputs,
+        # so the seg logits are resized to it and unpadded per image later
+        batch_img_metas = [
+            dict(img_meta, img_shape=inputs.shape[2:])
+            for img_meta in batch_img_metas
+        ]
         seg_logits = self.encode_decode(inputs, batch_img_metas)
 
         return seg_logits
@@ -314,6 +653,11 @@ class EncoderDecoder(BaseSegmentor):
     def inference(self, inputs: Tensor, batch_img_metas: List[dict]) -> Tensor:
         """Inference with slide/whole style.
 
+        The seg logits of the whole image are returned, so
+        ``test_cfg.argmax_in_bands`` is ignored here. It only takes effect in
+        :meth:`predict`, but not in the other callers such as
+        :class:`SegTTAModel`.
+
         Args:
             inputs (Tensor): The input image of shape (N, 3, H, W).
             batch_img_metas (List[dict]): List of image metainfo where each may
@@ -328,9 +672,11 @@ class EncoderDecoder(BaseSegmentor):
         """
 
         assert self.test_cfg.mode in ['slide', 'whole']
-        ori_shape = batch_img_metas[0]['ori_shape']
-        assert all(_['ori_shape'] == ori_shape for _ in batch_img_metas)
         if self.test_cfg.mode == 'slide':
+            if self.test_cfg.get('argmax_in_bands', False):
+                warnings.warn('`argmax_in_bands` is ignored when the seg '
+                              'logits of the whole image are inferred, '
+                              'which is only supported by `predict`.')
             seg_logit = self.slide_inference(inputs, batch_img_metas)
         else:
             seg_logit = self.whole_inference(inputs, batch_img_metas)
@@ -10,8 +10,9 @@ from .class_names import (ade_classes, ade_palette, cityscapes_classes,
                           vaihingen_palette, voc_classes, voc_palette)
 # yapf: enable
 from .collect_env import collect_env
-from .io import datafrombytes
-from .misc import add_prefix, stack_batch
+from .io import AsyncWriter, datafrombytes, save_png
+from .misc import (add_prefix, apply_label_lut, get_label_lut, pad_data_sample,
+                   stack_batch)
 from .set_env import register_all_modules
 from .typing_utils import (ConfigType, ForwardResults, MultiConfig,
                            OptConfigType, OptMultiConfig, OptSampleList,
@@ -27,5 +28,6 @@ __all__ = [
     'cityscapes_palette', 'ade_palette', 'voc_palette', 'cocostuff_palette',
     'loveda_palette', 'potsdam_palette', 'vaihingen_palette', 'isaid_palette',
     'stare_palette', 'dataset_aliases', 'get_classes', 'get_palette',
-    'datafrombytes', 'synapse_palette', 'synapse_classes'
+    'datafrombytes', 'synapse_palette', 'synapse_classes', 'AsyncWriter',
+    'save_png', 'apply_label_lut', 'get_label_lut', 'pad_data_sample'
 ]
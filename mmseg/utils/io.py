@@ -2,8 +2,12 @@
 import gzip
 import io
 import pickle
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
 
 import numpy as np
+from PIL import Image
 
 
 def datafrombytes(content: bytes, backend: str = 'numpy') -> np.ndarray:
@@ -36,3 +40,104 @@ def datafrombytes(content: bytes, backend: str = 'numpy') -> np.ndarray:
             else:
                 raise ValueError
     return data
+
+
+def save_png(img: np.ndarray,
+             filename: str,
+             compress_level: int = 6,
+             mode: Optional[str] = None,
+             palette: Optional[Sequence[Sequence[int]]] = None) -> None:
+    """Encode an image or label map and save it as a PNG file.
+
+    Args:
+        img (np.ndarray): The image or label map to save.
+        filename (str): The path of the PNG file.
+        compress_level (int): The zlib compression level of PNG, from 0 (no
+            compression) to 9 (best compression). Defaults to 6.
+        mode (str, optional): If specified, the image is converted to this
+            PIL mode, e.g. 'P', before saving. Defaults to None.
+        palette (Sequence[Sequence[int]], optional): If specified, the uint8
+            label map is saved as a palette-indexed PNG with the RGB color of
+            each label, which is shown in color by image viewers but read as
+            the labels. Defaults to None.
+    """
+    output = Image.fromarray(img)
+    if mode is not None:
+        output = output.convert(mode)
+    if palette is not None:
+        output.putpalette(np.asarray(palette, dtype=np.uint8).ravel())
+    output.save(filename, compress_level=compress_level)
+
+
+class AsyncWriter:
+    """Run file writing functions in a pool of background threads.
+
+    The submitted functions take the ownership of their arguments, so the
+    arrays passed to them should not be modified afterwards. At most
+    ``max_pending`` writes can be pending, and :meth:`submit` blocks when
+    the limit is reached, which bounds the memory held by pending writes.
+
+    Args:
+        num_workers (int): The number of writer threads. If it is 0, the
+            functions are run synchronously in :meth:`submit`. Defaults to 4.
+        max_pending (int): The maximum number of pending writes.
+            Defaults to 32.
+    """
+
+    def __init__(self, num_workers: int = 4, max_pending: int = 32) -> None:
+        assert num_workers >= 0, \
+            f'num_workers should be non-negative, but got {num_workers}'
+        assert max_pending > 0, \
+            f'max_pending should be positive, but got {max_pending}'
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures: List[Future] = []
+
+    def submit(self, func: Callable, *args, **kwargs) -> None:
+        """Submit a writing function, which is called with the given
+        arguments in a background thread.
+
+        Args:
+            func (Callable): The writing function.
+        """
+        if self.num_workers == 0:
+            func(*args, **kwargs)
+            return
+        # the thread pool is created lazily, so that the writer can be
+        # copied or pickled before using
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.num_workers)
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        # only keep the futures to be waited for or to raise errors
+        self._futures = [
+            f for f in self._futures
+            if not f.done() or f.exception() is not None
+        ]
+        self._futures.append(future)
+
+    def flush(self) -> None:
+        """Wait for all pending writes to finish, and raise the first error
+        raised by them if any."""
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def __getstate__(self) -> dict:
+        self.flush()
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_slots'] = None
+        state['_futures'] = []
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
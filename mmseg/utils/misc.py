@@ -1,10 +1,11 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Sequence, Union
 
 import numpy as np
 import torch
 import torch.nn.functional as F
 
+from mmseg.structures import SegDataSample
 from .typing_utils import SampleList
 
 
@@ -27,6 +28,103 @@ def add_prefix(inputs, prefix):
     return outputs
 
 
+def get_label_lut(label_map: Optional[Dict] = None,
+                  reduce_zero_label: bool = False) -> Optional[np.ndarray]:
+    """Compile the label remapping into a lookup table.
+
+    The label values are first reduced by 1 if ``reduce_zero_label`` is
+    True, where 0 is mapped to 255, and then mapped by ``label_map``.
+
+    Args:
+        label_map (dict, optional): The mapping from old label ids to new
+            label ids. Defaults to None.
+        reduce_zero_label (bool): Whether to mark label zero as ignored.
+            Defaults to False.
+
+    Returns:
+        np.ndarray, optional: The uint8 lookup table with 256 entries, or
+        None if the labels are not remapped.
+    """
+    if label_map is None and not reduce_zero_label:
+        return None
+    lut = np.arange(256, dtype=np.uint8)
+    if reduce_zero_label:
+        # reduce all the labels by 1, where the zero label and the
+        # ignored label 255 are both mapped to 255
+        lut = np.roll(lut, 1)
+        lut[[0, 255]] = 255
+    if label_map is not None:
+        mapped_lut = lut.copy()
+        for old_id, new_id in label_map.items():
+            mapped_lut[lut == old_id] = new_id
+        lut = mapped_lut
+    return lut
+
+
+def apply_label_lut(
+        label: Union[np.ndarray, torch.Tensor],
+        lut: Union[np.ndarray,
+                   torch.Tensor]) -> Union[np.ndarray, torch.Tensor]:
+    """Map the values of a label map with a lookup table.
+
+    All the values are mapped with a single fancy-index, instead of one
+    masked assignment per value. A torch label map is mapped on its own
+    device.
+
+    Args:
+        label (np.ndarray | Tensor): The label map, whose values should be
+            valid indices of ``lut``.
+        lut (np.ndarray | Tensor): The 1D lookup table, where ``lut[i]`` is
+            the mapped value of ``i``.
+
+    Returns:
+        np.ndarray | Tensor: The mapped label map, which has the same type as
+        ``label`` and the same dtype as ``lut``.
+    """
+    if isinstance(label, torch.Tensor):
+        if isinstance(lut, np.ndarray):
+            lut = torch.from_numpy(lut)
+        return lut.to(label.device)[label.long()]
+    if isinstance(lut, torch.Tensor):
+        lut = lut.cpu().numpy()
+    return np.take(lut, label)
+
+
+def pad_data_sample(data_sample: SegDataSample,
+                    img_shape: tuple,
+                    padding_size: Sequence[int],
+                    seg_pad_val: Union[int, float] = 255) -> SegDataSample:
+    """Pad the segmentation maps of a data sample in place, and record the
+    image shape and padding in its meta information.
+
+    Args:
+        data_sample (:obj:`SegDataSample`): The data sample with `gt_sem_seg`
+            and optionally `gt_edge_map`.
+        img_shape (tuple): The shape (h, w) of the image before padding.
+        padding_size (Sequence[int]): The padding size in the order of
+            (left, right, top, bottom).
+        seg_pad_val (int, float): The padding value. Defaults to 255
+
+    Returns:
+        :obj:`SegDataSample`: The padded data sample.
+    """
+    gt_sem_seg = data_sample.gt_sem_seg.data
+    del data_sample.gt_sem_seg.data
+    data_sample.gt_sem_seg.data = F.pad(
+        gt_sem_seg, padding_size, value=seg_pad_val)
+    if 'gt_edge_map' in data_sample:
+        gt_edge_map = data_sample.gt_edge_map.data
+        del data_sample.gt_edge_map.data
+        data_sample.gt_edge_map.data = F.pad(
+            gt_edge_map, padding_size, value=seg_pad_val)
+    data_sample.set_metainfo({
+        'img_shape': img_shape,
+        'pad_shape': data_sample.gt_sem_seg.shape,
+        'padding_size': padding_size
+    })
+    return data_sample
+
+
 def stack_batch(inputs: List[torch.Tensor],
                 data_samples: Optional[SampleList] = None,
                 size: Optional[tuple] = None,
@@ -93,21 +191,8 @@ def stack_batch(inputs: List[torch.Tensor],
         padded_inputs.append(pad_img)
         # pad gt_sem_seg
         if data_samples is not None:
-            data_sample = data_samples[i]
-            gt_sem_seg = data_sample.gt_sem_seg.data
-            del data_sample.gt_sem_seg.data
-            data_sample.gt_sem_seg.data = F.pad(
-                gt_sem_seg, padding_size, value=seg_pad_val)
-            if 'gt_edge_map' in data_sample:
-                gt_edge_map = data_sample.gt_edge_map.data
-                del data_sample.gt_edge_map.data
-                data_sample.gt_edge_map.data = F.pad(
-                    gt_edge_map, padding_size, value=seg_pad_val)
-            data_sample.set_metainfo({
-                'img_shape': tensor.shape[-2:],
-                'pad_shape': data_sample.gt_sem_seg.shape,
-                'padding_size': padding_size
-            })
+            data_sample = pad_data_sample(data_samples[i], tensor.shape[-2:],
+                                          padding_size, seg_pad_val)
             padded_samples.append(data_sample)
         else:
             padded_samples.append(
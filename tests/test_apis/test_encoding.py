@@ -0,0 +1,56 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from mmseg.apis import SEG_MAP_FORMATS, decode_seg_map, encode_seg_map
+
+
+@pytest.mark.parametrize('seg_format', SEG_MAP_FORMATS)
+def test_encode_seg_map(seg_format):
+    palette = [[i, 255 - i, i // 2] for i in range(256)]
+    rng = np.random.RandomState(0)
+    seg_maps = [
+        rng.randint(0, 256, (17, 23)).astype(np.uint8),
+        np.full((4, 5), 3, dtype=np.uint8),
+        np.zeros((0, 5), dtype=np.uint8),
+        # large regions with the ignored label
+        np.kron(rng.randint(0, 4, (3, 4)), np.ones((8, 8))).astype(np.int64),
+    ]
+    seg_maps[-1][:2] = 255
+    for seg_map in seg_maps:
+        if seg_format.endswith('png') and seg_map.size == 0:
+            continue
+        content = encode_seg_map(seg_map, seg_format, palette=palette)
+        assert isinstance(content, bytes)
+        decoded = decode_seg_map(content, seg_format)
+        assert decoded.dtype == np.uint8
+        assert np.array_equal(decoded, seg_map)
+
+    seg_map = seg_maps[-1]
+    if seg_format == 'rle':
+        flat = seg_map.ravel()
+        num_runs = 1 + np.count_nonzero(flat[1:] != flat[:-1])
+        content = encode_seg_map(seg_map, 'rle')
+        assert len(content) == 12 + 5 * num_runs < 8 + seg_map.size
+    elif seg_format == 'raw':
+        assert len(encode_seg_map(seg_map, 'raw')) == 8 + seg_map.size
+    elif seg_format == 'palette_png':
+        img = Image.open(
+            io.BytesIO(encode_seg_map(seg_map, seg_format, 9, palette)))
+        assert img.mode == 'P'
+        assert img.getpalette()[3:6] == [1, 254, 0]
+
+
+def test_encode_seg_map_errors():
+    seg_map = np.zeros((4, 4), dtype=np.uint8)
+    with pytest.raises(ValueError):
+        encode_seg_map(seg_map, 'jpg')
+    with pytest.raises(ValueError):
+        decode_seg_map(b'', 'jpg')
+    with pytest.raises(AssertionError):
+        encode_seg_map(seg_map, 'palette_png')
+    with pytest.raises(AssertionError):
+        encode_seg_map(seg_map[None], 'raw')
@@ -0,0 +1,84 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os.path as osp
+
+import numpy as np
+import torch
+from mmengine import Config
+
+from mmseg.apis import inference_model, init_model
+from mmseg.apis.inference import _preprare_data
+from mmseg.structures import SegDataSample
+from mmseg.utils import register_all_modules
+
+
+def _get_config():
+    return Config(
+        dict(
+            model=dict(
+                type='EncoderDecoder',
+                data_preprocessor=dict(
+                    type='SegDataPreProcessor',
+                    mean=[123.675, 116.28, 103.53],
+                    std=[58.395, 57.12, 57.375],
+                    bgr_to_rgb=True),
+                backbone=dict(
+                    type='ResNetV1c',
+                    depth=18,
+                    num_stages=1,
+                    out_indices=(0, ),
+                    base_channels=8,
+                    stem_channels=8,
+                    strides=(1, ),
+                    dilations=(1, )),
+                decode_head=dict(
+                    type='FCNHead',
+                    in_channels=8,
+                    channels=8,
+                    num_convs=1,
+                    num_classes=4),
+                test_cfg=dict(mode='whole')),
+            test_pipeline=[
+                dict(type='LoadImageFromFile'),
+                dict(type='Resize', scale=(64, 32), keep_ratio=False),
+                dict(type='LoadAnnotations'),
+                dict(type='PackSegInputs')
+            ]))
+
+
+def test_inference_model():
+    register_all_modules()
+    cfg = _get_config()
+    model = init_model(cfg, device='cpu')
+    # the test pipelines are built once without modifying the config
+    assert set(model.test_pipelines) == {'path', 'ndarray'}
+    assert len(cfg.test_pipeline) == 4
+    assert cfg.test_pipeline[0]['type'] == 'LoadImageFromFile'
+    pipelines = model.test_pipelines
+
+    img_path = osp.join(osp.dirname(__file__), '../data/color.jpg')
+    img = np.random.randint(0, 256, (40, 50, 3), dtype=np.uint8)
+    result = inference_model(model, img)
+    assert isinstance(result, SegDataSample)
+    assert result.pred_sem_seg.shape == (40, 50)
+    results = inference_model(model, [img_path, img])
+    assert len(results) == 2
+    assert results[0].pred_sem_seg.shape == (288, 512)
+    assert results[1].pred_sem_seg.shape == (40, 50)
+    assert model.test_pipelines is pipelines
+
+    # the test pipelines are rebuilt once the config is changed
+    model.cfg.test_pipeline = [
+        dict(type='LoadImageFromFile'),
+        dict(type='PackSegInputs')
+    ]
+    data, is_batch = _preprare_data(img, model)
+    assert not is_batch
+    inputs = data['inputs'][0]
+    assert torch.equal(inputs, torch.from_numpy(img).permute(2, 0, 1))
+    # the packed inputs do not alias the image, which may be reused
+    assert inputs.is_contiguous()
+    assert inputs.data_ptr() != img.ctypes.data
+    assert model.test_pipelines is not pipelines
+    model.cfg.test_pipeline.insert(
+        1, dict(type='Resize', scale=(64, 32), keep_ratio=False))
+    assert _preprare_data(img, model)[0]['inputs'][0].shape == (3, 32, 64)
@@ -1,10 +1,15 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import os
+import os.path as osp
 import tempfile
+from unittest.mock import patch
 
 import numpy as np
+import pytest
 import torch
 import torch.nn as nn
 from mmengine import ConfigDict
+from PIL import Image
 from torch.utils.data import DataLoader, Dataset
 
 from mmseg.apis import MMSegInferencer
@@ -111,3 +116,96 @@ def test_inferencer():
     assert 'visualization' in results
     assert len(results['predictions']) == 2
     assert results['predictions'][0].shape == (4, 4)
+
+
+def test_inferencer_workers():
+    register_all_modules()
+    cfg = ConfigDict(
+        model=dict(
+            type='InferExampleModel',
+            data_preprocessor=dict(type='SegDataPreProcessor'),
+            backbone=dict(type='InferExampleBackbone'),
+            decode_head=dict(type='InferExampleHead'),
+            test_cfg=dict(mode='whole')),
+        visualizer=dict(
+            type='SegLocalVisualizer',
+            vis_backends=[dict(type='LocalVisBackend')],
+            name='visualizer'),
+        test_dataloader=dict(
+            dataset=dict(pipeline=[
+                dict(type='LoadImageFromFile'),
+                dict(type='LoadAnnotations'),
+                dict(type='PackSegInputs')
+            ])))
+    infer = MMSegInferencer(cfg)
+
+    # images of different shapes are padded into batches
+    imgs = [
+        np.random.randint(0, 256, (8 + i, 12 - i, 3), dtype=np.uint8)
+        for i in range(5)
+    ]
+    expected = infer(imgs, batch_size=2)['predictions']
+    assert [pred.shape for pred in expected] == \
+        [img.shape[:2] for img in imgs]
+    for worker_type in ('thread', 'process'):
+        results = infer(
+            imgs, batch_size=2, num_workers=2, worker_type=worker_type)
+        for pred, expected_pred in zip(results['predictions'], expected):
+            assert np.array_equal(pred, expected_pred)
+    with pytest.raises(ValueError):
+        infer(imgs, num_workers=2, worker_type='fiber')
+
+
+def test_inferencer_outputs(tmp_path):
+    register_all_modules()
+    cfg = ConfigDict(
+        model=dict(
+            type='InferExampleModel',
+            data_preprocessor=dict(type='SegDataPreProcessor'),
+            backbone=dict(type='InferExampleBackbone'),
+            decode_head=dict(type='InferExampleHead'),
+            test_cfg=dict(mode='whole')),
+        visualizer=dict(
+            type='SegLocalVisualizer',
+            vis_backends=[dict(type='LocalVisBackend')],
+            name='visualizer'),
+        test_dataloader=dict(
+            dataset=dict(pipeline=[
+                dict(type='LoadImageFromFile'),
+                dict(type='PackSegInputs')
+            ])))
+    imgs = [
+        np.random.randint(0, 256, (8, 10, 3), dtype=np.uint8) for _ in range(3)
+    ]
+
+    for num_writers in (0, 2):
+        infer = MMSegInferencer(cfg, num_writers=num_writers)
+        for pred_format in ('png', 'palette_png', 'npy'):
+            out_dir = str(tmp_path / f'{num_writers}_{pred_format}')
+            results = infer(
+                imgs, batch_size=2, out_dir=out_dir, pred_format=pred_format)
+            assert len(results['predictions']) == 3
+            assert len(results['visualization']) == 3
+            # the outputs are written when the call returns
+            assert len(os.listdir(osp.join(out_dir, 'vis'))) == 3
+            pred_files = sorted(os.listdir(osp.join(out_dir, 'pred')))
+            assert len(pred_files) == 3
+            for pred, pred_file in zip(results['predictions'], pred_files):
+                pred_path = osp.join(out_dir, 'pred', pred_file)
+                if pred_format == 'npy':
+                    assert np.array_equal(np.load(pred_path), pred)
+                else:
+                    output = Image.open(pred_path)
+                    assert output.mode == ('P' if pred_format == 'palette_png'
+                                           else 'L')
+                    assert np.array_equal(np.array(output), pred)
+
+        # the visualizations are only written to `out_dir`, not to the
+        # storage backends of the visualizer
+        with patch.object(infer.visualizer, 'add_image') as add_image:
+            result = infer(imgs[0], out_dir=str(tmp_path / 'single'))
+        add_image.assert_not_called()
+        assert result['predictions'].shape == (8, 10)
+        assert result['visualization'].shape == (8, 10, 3)
+        with pytest.raises(ValueError):
+            infer(imgs, pred_format='jpg')
@@ -1,9 +1,14 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import os
 import os.path as osp
+import pickle
+import shutil
 import tempfile
 
+import mmcv
+import numpy as np
 import pytest
+from mmcv.transforms import LoadImageFromFile, RandomFlip
 
 from mmseg.datasets import (ADE20KDataset, BaseSegDataset, CityscapesDataset,
                             COCOStuffDataset, DecathlonDataset, ISPRSDataset,
@@ -11,8 +16,9 @@ from mmseg.datasets import (ADE20KDataset, BaseSegDataset, CityscapesDataset,
                             MapillaryDataset_v2, PascalVOCDataset,
                             PotsdamDataset, REFUGEDataset, SynapseDataset,
                             iSAIDDataset)
+from mmseg.datasets.transforms import LoadAnnotations
 from mmseg.registry import DATASETS
-from mmseg.utils import get_classes, get_palette
+from mmseg.utils import get_classes, get_label_lut, get_palette
 
 
 def test_classes():
@@ -433,3 +439,222 @@ def test_custom_dataset_custom_palette():
             ann_file=tempfile.mkdtemp(),
             metainfo=dict(classes=('bus', 'car'), palette=[[200, 200, 200]]),
             lazy_init=True)
+
+
+def test_label_lut():
+    # the lookup table is passed to the pipeline with the data info
+    dataset = ADE20KDataset(
+        data_prefix=dict(
+            img_path=osp.join(
+                osp.dirname(__file__), '../data/pseudo_dataset/imgs'),
+            seg_map_path=osp.join(
+                osp.dirname(__file__), '../data/pseudo_dataset/gts')),
+        img_suffix='img.jpg',
+        seg_map_suffix='gt.png')
+    np.testing.assert_array_equal(
+        dataset.get_data_info(0)['label_lut'],
+        get_label_lut(reduce_zero_label=True))
+
+
+def test_decode_cache():
+    kwargs = dict(
+        data_root=osp.join(osp.dirname(__file__), '../data/pseudo_dataset'),
+        data_prefix=dict(img_path='imgs/', seg_map_path='gts/'),
+        img_suffix='img.jpg',
+        seg_map_suffix='gt.png',
+        reduce_zero_label=True)
+
+    def get_pipeline():
+        return [LoadImageFromFile(), LoadAnnotations(), RandomFlip(prob=1.)]
+
+    dataset = BaseSegDataset(pipeline=get_pipeline(), **kwargs)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached_dataset = BaseSegDataset(
+            pipeline=get_pipeline(), decode_cache_dir=cache_dir, **kwargs)
+        assert cached_dataset.num_cached_transforms == 2
+        assert len(os.listdir(cache_dir)) == 1
+        for idx in range(len(dataset)):
+            results = dataset[idx]
+            cached_results = cached_dataset[idx]
+            for key in ('img', 'gt_seg_map'):
+                np.testing.assert_array_equal(cached_results[key],
+                                              results[key])
+            assert cached_results['img_shape'] == results['img_shape']
+            assert cached_results['seg_fields'] == ['gt_seg_map']
+
+        # the flipped results should not modify the cache
+        np.testing.assert_array_equal(cached_dataset[0]['img'],
+                                      dataset[0]['img'])
+
+        # the built cache is reused, and can be pickled to the workers
+        cached_dataset = BaseSegDataset(
+            pipeline=get_pipeline(), decode_cache_dir=cache_dir, **kwargs)
+        cached_dataset = pickle.loads(pickle.dumps(cached_dataset))
+        assert len(os.listdir(cache_dir)) == 1
+        np.testing.assert_array_equal(cached_dataset[1]['gt_seg_map'],
+                                      dataset[1]['gt_seg_map'])
+
+        # the cache is subset together with the samples
+        sub_dataset = cached_dataset.get_subset([3, 0, -1])
+        cached_dataset.get_subset_(-2)
+        for sub_idx, idx in enumerate([3, 0, 4]):
+            np.testing.assert_array_equal(sub_dataset[sub_idx]['img'],
+                                          dataset[idx]['img'])
+        for sub_idx, idx in enumerate([3, 4]):
+            np.testing.assert_array_equal(cached_dataset[sub_idx]['img'],
+                                          dataset[idx]['img'])
+            assert cached_dataset[sub_idx]['img_path'] == \
+                dataset[idx]['img_path']
+
+
+def test_get_img_shapes():
+    dataset = BaseSegDataset(
+        data_root=osp.join(osp.dirname(__file__), '../data/pseudo_dataset'),
+        data_prefix=dict(img_path='imgs/', seg_map_path='gts/'),
+        img_suffix='img.jpg',
+        seg_map_suffix='gt.png')
+    img_shapes = dataset.get_img_shapes()
+    assert img_shapes.shape == (5, 2)
+    for idx, img_shape in enumerate(img_shapes):
+        img = mmcv.imread(dataset.get_data_info(idx)['img_path'])
+        assert tuple(img_shape) == img.shape[:2]
+    assert dataset.get_img_shapes() is img_shapes
+
+    # the shapes in the data information are used if available
+    dataset = BaseSegDataset(lazy_init=True)
+    dataset.data_list = [
+        dict(img_path='a.jpg', height=3, width=4),
+        dict(img_path='b.jpg', height=5, width=2)
+    ]
+    dataset._fully_initialized = True
+    dataset.serialize_data = False
+    assert dataset.get_img_shapes().tolist() == [[3, 4], [5, 2]]
+
+    # the cached shapes are subset together with the samples
+    dataset.data_list = [
+        dict(img_path=f'{i}.jpg', height=i + 1, width=1) for i in range(5)
+    ]
+    dataset._img_shapes = None
+    img_shapes = dataset.get_img_shapes()
+    assert dataset.get_subset([3, 0, -1]).get_img_shapes().tolist() == \
+        img_shapes[[3, 0, 4]].tolist()
+    assert dataset.get_subset(2).get_img_shapes().tolist() == \
+        img_shapes[:2].tolist()
+    assert dataset.get_subset(-2).get_img_shapes().tolist() == \
+        img_shapes[-2:].tolist()
+    dataset.get_subset_([4, 1])
+    assert dataset.get_img_shapes().tolist() == [[5, 1], [2, 1]]
+
+
+def test_index_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_root = osp.join(tmp_dir, 'pseudo_dataset')
+        shutil.copytree(
+            osp.join(osp.dirname(__file__), '../data/pseudo_dataset'),
+            data_root)
+        index_cache_dir = osp.join(tmp_dir, 'index')
+
+        def build_dataset(**kwargs):
+            return BaseSegDataset(
+                data_root=data_root,
+                data_prefix=dict(img_path='imgs/', seg_map_path='gts/'),
+                img_suffix='img.jpg',
+                seg_map_suffix='gt.png',
+                **kwargs)
+
+        dataset = build_dataset()
+        indexed_dataset = build_dataset(index_cache_dir=index_cache_dir)
+        index_files = os.listdir(index_cache_dir)
+        assert len(index_files) == 1
+        assert len(indexed_dataset) == len(dataset) == 5
+        for idx in range(len(dataset)):
+            data_info = dataset.get_data_info(idx)
+            indexed_info = indexed_dataset.get_data_info(idx)
+            for key, value in data_info.items():
+                if key != 'label_lut':
+                    assert indexed_info[key] == value
+            img = mmcv.imread(data_info['img_path'])
+            assert (indexed_info['height'],
+                    indexed_info['width']) == img.shape[:2]
+            seg_map = mmcv.imread(
+                data_info['seg_map_path'], 'unchanged', backend='pillow')
+            assert np.array_equal(indexed_info['label_ids'],
+                                  np.unique(seg_map))
+        assert np.array_equal(indexed_dataset.get_img_shapes(),
+                              dataset.get_img_shapes())
+        # the category ids are the same with or without the index
+        reduced_dataset = build_dataset(reduce_zero_label=True)
+        reduced_indexed_dataset = build_dataset(
+            reduce_zero_label=True, index_cache_dir=index_cache_dir)
+        for idx in range(len(dataset)):
+            cat_ids = dataset.get_cat_ids(idx)
+            assert indexed_dataset.get_cat_ids(idx) == cat_ids
+            assert 255 not in cat_ids
+            reduced_cat_ids = reduced_dataset.get_cat_ids(idx)
+            assert reduced_indexed_dataset.get_cat_ids(idx) == reduced_cat_ids
+            assert reduced_cat_ids == [
+                cat_id - 1 for cat_id in cat_ids if cat_id > 0
+            ]
+
+        # the labels above 255 wrap around as in LoadAnnotations
+        reduced_dataset.data_list = [
+            dict(seg_map_path='a.png', label_ids=np.array([1, 256, 257, 511]))
+        ]
+        reduced_dataset.serialize_data = False
+        assert reduced_dataset.get_cat_ids(0) == [0]
+
+        # the index is loaded without listing the directories again
+        index_path = osp.join(index_cache_dir, index_files[0])
+        mtime = os.stat(index_path).st_mtime_ns
+        assert len(build_dataset(index_cache_dir=index_cache_dir)) == 5
+        assert os.stat(index_path).st_mtime_ns == mtime
+
+        # the index is rebuilt after the directory changes
+        os.remove(osp.join(data_root, 'imgs', '00000_img.jpg'))
+        assert len(build_dataset(index_cache_dir=index_cache_dir)) == 4
+
+
+def test_serialize_columns():
+
+    def build_dataset(**kwargs):
+        return BaseSegDataset(
+            data_root=osp.join(
+                osp.dirname(__file__), '../data/pseudo_dataset'),
+            data_prefix=dict(img_path='imgs/', seg_map_path='gts/'),
+            img_suffix='img.jpg',
+            seg_map_suffix='gt.png',
+            **kwargs)
+
+    dataset = build_dataset(serialize_data=False)
+    serialized_dataset = build_dataset()
+    assert set(serialized_dataset.shared_info) == {
+        'label_map', 'reduce_zero_label', 'seg_fields'
+    }
+    assert set(serialized_dataset.path_columns) == {'img_path', 'seg_map_path'}
+    prefix = serialized_dataset.path_columns['img_path'][0]
+    assert prefix.endswith(osp.join('pseudo_dataset', 'imgs', '0000'))
+    # only the paths are left to be serialized per sample
+    assert pickle.loads(
+        serialized_dataset.data_bytes[:len(serialized_dataset.data_bytes) //
+                                      5].tobytes()) == dict()
+    for idx in range(-4, 5):
+        assert serialized_dataset.get_data_info(idx) == \
+            dataset.get_data_info(idx)
+
+    # the data information is not shared among the samples
+    data_info = serialized_dataset.get_data_info(0)
+    data_info['seg_fields'].append('gt_seg_map')
+    assert serialized_dataset.get_data_info(0)['seg_fields'] == []
+
+    # the subsets have the path columns of their samples
+    sub_dataset = serialized_dataset.get_subset([3, -1, 0])
+    assert len(serialized_dataset) == 5
+    for sub_idx, idx in enumerate([3, 4, 0]):
+        data_info = sub_dataset.get_data_info(sub_idx)
+        data_info['sample_idx'] = idx
+        assert data_info == dataset.get_data_info(idx)
+    serialized_dataset.get_subset_(-2)
+    assert len(serialized_dataset) == 2
+    for sub_idx, idx in enumerate([3, 4]):
+        assert serialized_dataset.get_data_info(sub_idx)['img_path'] == \
+            dataset.get_data_info(idx)['img_path']
@@ -67,6 +67,19 @@ class TestLoading:
         assert results['gt_seg_map'].shape == (288, 512)
         assert results['gt_seg_map'].dtype == np.uint8
 
+        # remap the labels with the lookup table from dataset
+        gt_seg_map = mmcv.imread(seg_path, flag='unchanged', backend='pillow')
+        label_lut = np.arange(256, dtype=np.uint8)[::-1].copy()
+        results = dict(
+            seg_map_path=seg_path,
+            reduce_zero_label=True,
+            label_lut=label_lut,
+            seg_fields=[])
+        results = transform(results)
+        assert results['gt_seg_map'].dtype == np.uint8
+        np.testing.assert_array_equal(results['gt_seg_map'],
+                                      label_lut[gt_seg_map])
+
     def test_load_seg_custom_classes(self):
 
         test_img = np.random.rand(10, 10)
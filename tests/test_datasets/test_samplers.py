@@ -0,0 +1,132 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import itertools
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from mmengine.dataset import DefaultSampler
+from torch.utils.data import Dataset
+
+from mmseg.datasets import AspectRatioBatchSampler, RepeatFactorSampler
+from mmseg.registry import DATA_SAMPLERS
+
+
+class DummyDataset(Dataset):
+
+    def __init__(self, img_shapes, cat_ids=None):
+        self.img_shapes = np.array(img_shapes)
+        self.cat_ids = cat_ids
+
+    def __len__(self):
+        return len(self.img_shapes)
+
+    def __getitem__(self, idx):
+        return idx
+
+    def get_img_shapes(self):
+        return self.img_shapes
+
+    def get_cat_ids(self, idx):
+        return self.cat_ids[idx]
+
+
+def test_aspect_ratio_batch_sampler():
+    # portrait images at odd indices, landscape ones at even indices
+    img_shapes = [(10, 20) if i % 2 == 0 else (20, 10) for i in range(11)]
+    sampler = DefaultSampler(DummyDataset(img_shapes), shuffle=True)
+
+    with pytest.raises(TypeError):
+        AspectRatioBatchSampler(list(range(11)), batch_size=2)
+    with pytest.raises(ValueError):
+        AspectRatioBatchSampler(sampler, batch_size=0)
+
+    batch_sampler = DATA_SAMPLERS.build(
+        dict(type='AspectRatioBatchSampler'),
+        default_args=dict(sampler=sampler, batch_size=2))
+    batches = list(batch_sampler)
+    assert len(batches) == len(batch_sampler) == 6
+    assert sorted(idx for batch in batches for idx in batch) == list(range(11))
+    # the full batches are in the same bucket
+    for batch in batches[:-1]:
+        assert len(batch) == 2
+        assert len({idx % 2 for idx in batch}) == 1
+    assert len(batches[-1]) == 1
+
+    batch_sampler = AspectRatioBatchSampler(
+        sampler, batch_size=4, drop_last=True)
+    batches = list(batch_sampler)
+    assert len(batches) == len(batch_sampler) == 2
+    assert all(len(batch) == 4 for batch in batches)
+
+    # more buckets
+    img_shapes = [(10, 10), (10, 30), (10, 15), (10, 31), (10, 14), (10, 9)]
+    sampler = DefaultSampler(DummyDataset(img_shapes), shuffle=False)
+    batch_sampler = AspectRatioBatchSampler(
+        sampler, batch_size=2, ratio_boundaries=(1., 2.))
+    assert list(batch_sampler) == [[0, 2], [1, 3], [5, 4]]
+
+    # the leftovers filling exactly one batch are kept with drop_last
+    img_shapes = [(10, 20)] * 6 + [(20, 10)] * 6
+    sampler = DefaultSampler(DummyDataset(img_shapes), shuffle=False)
+    batch_sampler = AspectRatioBatchSampler(
+        sampler, batch_size=4, drop_last=True)
+    batches = list(batch_sampler)
+    assert len(batches) == len(batch_sampler) == 3
+    assert sorted(batches[-1]) == [4, 5, 10, 11]
+
+
+def test_repeat_factor_sampler():
+    # class 1 is in 1 of the 10 images, and class 0 is in 9 of them
+    cat_ids = [[0, 1]] + [[0]] * 8 + [[]]
+    dataset = DummyDataset([(10, 10)] * 10, cat_ids)
+    sampler = DATA_SAMPLERS.build(
+        dict(type='RepeatFactorSampler', repeat_thr=0.4, seed=0),
+        default_args=dict(dataset=dataset))
+    assert len(sampler) == 10
+    assert np.allclose(sampler.repeat_factors, [2.] + [1.] * 9)
+    counts = np.bincount(list(itertools.islice(sampler, 1100)))
+    assert counts[0] == 200 and (counts[1:] == 100).all()
+
+    # the repeat factors are rounded stochastically
+    sampler = RepeatFactorSampler(
+        dataset, repeat_thr=0.5, shuffle=False, seed=0)
+    assert np.allclose(sampler.repeat_factors, [5**0.5] + [1.] * 9)
+    indices = list(itertools.islice(sampler, 10000))
+    assert indices[:2] == [0, 0]
+    counts = np.bincount(indices)
+    assert abs(counts[0] / counts[1:].mean() - 5**0.5) < 0.05
+
+    # deterministic under the seed
+    sampler = RepeatFactorSampler(dataset, repeat_thr=0.5, seed=1)
+    indices = list(itertools.islice(sampler, 100))
+    assert list(
+        itertools.islice(
+            RepeatFactorSampler(dataset, repeat_thr=0.5, seed=1),
+            100)) == indices
+    assert list(
+        itertools.islice(
+            RepeatFactorSampler(dataset, repeat_thr=0.5, seed=2),
+            100)) != indices
+
+
+def test_repeat_factor_sampler_dist():
+    cat_ids = [[i % 3] for i in range(9)] + [[3]]
+    dataset = DummyDataset([(10, 10)] * 10, cat_ids)
+    sampler = RepeatFactorSampler(dataset, repeat_thr=0.5, seed=0)
+    expected = list(itertools.islice(sampler, 40))
+
+    samplers = []
+    for rank in range(2):
+        with patch(
+                'mmseg.datasets.samplers.repeat_factor_sampler.get_dist_info',
+                return_value=(rank, 2)), patch(
+                    'mmseg.datasets.samplers.repeat_factor_sampler.'
+                    'all_gather_object',
+                    return_value=[cat_ids[0::2], cat_ids[1::2]]):
+            samplers.append(
+                RepeatFactorSampler(dataset, repeat_thr=0.5, seed=0))
+    for sampler in samplers:
+        assert np.allclose(sampler.repeat_factors, samplers[0].repeat_factors)
+    # each rank takes its own slice of the same sequence
+    assert list(itertools.islice(samplers[0], 20)) == expected[0::2]
+    assert list(itertools.islice(samplers[1], 20)) == expected[1::2]
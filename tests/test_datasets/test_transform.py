@@ -2,6 +2,7 @@
 import copy
 import os.path as osp
 
+import cv2
 import mmcv
 import numpy as np
 import pytest
@@ -326,6 +327,47 @@ def test_random_crop():
     assert results['gt_semantic_seg'].shape[:2] == (h - 20, w - 20)
 
 
+def test_random_crop_cat_max_ratio():
+    # the left half is of class 1, the right half is of class 2 and ignored
+    seg = np.ones((32, 64), dtype=np.uint8)
+    seg[:, 32:] = 2
+    seg[:4, 32:] = 255
+    pipeline = RandomCrop(crop_size=(32, 32), cat_max_ratio=0.75)
+    assert not pipeline._accept_crop(seg[:, :32])
+    assert not pipeline._accept_crop(seg[:, 4:36])
+    assert pipeline._accept_crop(seg[:, 12:44])
+    assert not pipeline._accept_crop(seg[:4, 28:60])
+    # the counts of uint8 and other dtypes are the same
+    for x in range(0, 33, 4):
+        assert pipeline._accept_crop(seg[:, x:x + 32]) == \
+            pipeline._accept_crop(seg[:, x:x + 32].astype(np.int64))
+
+    for batch_candidates in (False, True):
+        pipeline = RandomCrop(
+            crop_size=(32, 32),
+            cat_max_ratio=0.75,
+            batch_candidates=batch_candidates)
+        np.random.seed(0)
+        for _ in range(10):
+            results = dict(
+                img=np.zeros((32, 64, 3), dtype=np.uint8),
+                gt_seg_map=seg.copy(),
+                seg_fields=['gt_seg_map'])
+            results = pipeline(results)
+            assert results['img'].shape[:2] == (32, 32)
+            assert pipeline._accept_crop(results['gt_seg_map'])
+
+    # the last candidate is used if all the candidates are rejected
+    pipeline = RandomCrop(
+        crop_size=(32, 32), cat_max_ratio=0.5, batch_candidates=True)
+    results = pipeline(
+        dict(
+            img=np.zeros((32, 64, 3), dtype=np.uint8),
+            gt_seg_map=np.ones((32, 64), dtype=np.uint8),
+            seg_fields=['gt_seg_map']))
+    assert results['gt_seg_map'].shape == (32, 32)
+
+
 def test_rgb2gray():
     # test assertion out_channels should be greater than 0
     with pytest.raises(AssertionError):
@@ -412,6 +454,28 @@ def test_photo_metric_distortion():
     assert (results['gt_semantic_seg'] == seg).all()
     assert results['img_shape'] == img.shape
 
+    # the brightness and contrast lookup table is the same as `convert`
+    pipeline = PhotoMetricDistortion()
+    lut = pipeline._get_lut(brightness=20.5, contrast=1.3)
+    np.testing.assert_array_equal(
+        cv2.LUT(img, lut),
+        pipeline.convert(pipeline.convert(img, beta=20.5), alpha=1.3))
+
+    # the fused distortion should be close to the sequential one, which
+    # differs only in rounding of the single HSV round trip
+    for seed in range(5):
+        np.random.seed(seed)
+        fused_img = pipeline(dict(img=img.copy()))['img']
+        np.random.seed(seed)
+        sequential_img = pipeline._transform_sequential(img.copy())
+        assert fused_img.dtype == np.uint8
+        assert np.abs(fused_img.astype(int) -
+                      sequential_img.astype(int)).max() <= 3
+
+    # the images which are not uint8 are distorted sequentially
+    results = pipeline(dict(img=img.astype(np.float32)))
+    assert results['img'].shape == img.shape
+
 
 def test_rerange():
     # test assertion if min_value or max_value is illegal
@@ -3,10 +3,12 @@ import os.path as osp
 import shutil
 from unittest import TestCase
 
+import cityscapesscripts.helpers.labels as CSLabels
 import numpy as np
 import pytest
 import torch
 from mmengine.structures import PixelData
+from PIL import Image
 
 from mmseg.evaluation import CityscapesMetric
 from mmseg.structures import SegDataSample
@@ -117,3 +119,88 @@ class TestCityscapesMetric(TestCase):
         assert osp.exists('tmp')
         assert osp.isfile('tmp/frankfurt_000000_000294_leftImg8bit.png')
         shutil.rmtree('tmp')
+
+        # test writing predictions in background threads
+        metric = CityscapesMetric(
+            output_dir='tmp',
+            format_only=True,
+            keep_results=True,
+            num_writers=2,
+            png_compress_level=1)
+        metric.process(data_batch, data_samples)
+        metric.evaluate(2)
+        assert osp.isfile('tmp/frankfurt_000000_000294_leftImg8bit.png')
+        shutil.rmtree('tmp')
+
+        # test converting trainId to labelId on device
+        metric = CityscapesMetric(
+            output_dir='tmp',
+            format_only=True,
+            keep_results=True,
+            convert_on_device=True)
+        metric.process(data_batch, data_samples)
+        metric.evaluate(2)
+        pred_label = data_samples[1]['pred_sem_seg']['data'][0].numpy()
+        label_id = np.array(
+            Image.open('tmp/frankfurt_000000_000294_leftImg8bit.png'))
+        np.testing.assert_array_equal(label_id,
+                                      metric._convert_to_label_id(pred_label))
+        shutil.rmtree('tmp')
+
+    def test_convert_to_label_id(self):
+        metric = CityscapesMetric(output_dir='tmp')
+        train_id = np.random.randint(0, 256, (16, 16), dtype=np.uint8)
+        label_id = metric._convert_to_label_id(train_id)
+        for trainId in range(19):
+            assert (label_id[train_id == trainId] ==
+                    CSLabels.trainId2label[trainId].id).all()
+        assert (label_id[train_id == 255] == 0).all()
+        mask = (train_id >= 19) & (train_id != 255)
+        np.testing.assert_array_equal(label_id[mask], train_id[mask])
+
+    def test_native_eval(self):
+        seg_map_path = 'tests/data/pseudo_cityscapes_dataset/gtFine/val/frankfurt/frankfurt_000000_000294_gtFine_labelTrainIds.png'  # noqa
+        # derive the trainIds from the labelIds used by cityscapesscripts
+        label_id = np.array(
+            Image.open(seg_map_path.replace('labelTrainIds', 'labelIds')))
+        gt_label = torch.full(label_id.shape, 255)
+        for label in CSLabels.labels:
+            if 0 <= label.trainId < 255:
+                gt_label[label_id == label.id] = label.trainId
+        # corrupt part of the ground truth as the prediction, which is shared
+        # by the samples as they are written to the same file
+        pred_label = gt_label.clone()
+        mask = torch.rand(gt_label.shape) < 0.3
+        pred_label[mask] = torch.randint(0, 19, (int(mask.sum()), ))
+        data_samples = []
+        for _ in range(2):
+            data_sample = SegDataSample()
+            data_sample.gt_sem_seg = PixelData(data=gt_label[None])
+            data_sample.pred_sem_seg = PixelData(data=pred_label[None])
+            data_sample = data_sample.to_dict()
+            data_sample['seg_map_path'] = seg_map_path
+            data_sample[
+                'img_path'] = 'tests/data/pseudo_cityscapes_dataset/leftImg8bit/val/frankfurt/frankfurt_000000_000294_leftImg8bit.png'  # noqa
+            data_samples.append(data_sample)
+
+        # the scores should be the same as the official cityscapesscripts
+        metric = CityscapesMetric(output_dir='tmp')
+        metric.process([], data_samples)
+        res = metric.evaluate(2)
+        native_metric = CityscapesMetric(
+            output_dir='tmp_native', native_eval=True)
+        native_metric.process([], data_samples)
+        native_res = native_metric.evaluate(2)
+        assert native_res.keys() == res.keys()
+        for key, value in res.items():
+            np.testing.assert_allclose(native_res[key], value)
+        assert not osp.exists(
+            'tmp_native/frankfurt_000000_000294_leftImg8bit.png')
+
+        # test keeping the predictions in native evaluation
+        native_metric = CityscapesMetric(
+            output_dir='tmp_native', keep_results=True, native_eval=True)
+        native_metric.process([], data_samples)
+        native_metric.evaluate(2)
+        assert osp.isfile('tmp_native/frankfurt_000000_000294_leftImg8bit.png')
+        shutil.rmtree('tmp_native')
@@ -3,6 +3,7 @@ import os.path as osp
 import shutil
 from unittest import TestCase
 
+import mmcv
 import numpy as np
 import torch
 from mmengine.structures import PixelData
@@ -102,3 +103,132 @@ class TestIoUMetric(TestCase):
         assert osp.exists('tmp')
         assert osp.isfile('tmp/00000_img.png')
         shutil.rmtree('tmp')
+
+        # the labels above 255 wrap around with reduce_zero_label
+        iou_metric = IoUMetric(
+            iou_metrics=['mIoU'], output_dir='tmp', format_only=True)
+        iou_metric.dataset_meta = dict(
+            classes=['wall', 'building', 'sky', 'floor', 'tree'],
+            label_map=dict(),
+            reduce_zero_label=True)
+        data_sample = dict(
+            pred_sem_seg=dict(data=torch.tensor([[[0, 254, 255, 299]]])),
+            img_path='tests/data/pseudo_dataset/imgs/00000_img.jpg',
+            reduce_zero_label=True)
+        iou_metric.process([0], [data_sample])
+        iou_metric.evaluate(1)
+        output = mmcv.imread('tmp/00000_img.png', flag='unchanged')
+        np.testing.assert_array_equal(output.ravel(), [1, 255, 0, 44])
+        shutil.rmtree('tmp')
+
+        # test writing predictions in background threads
+        iou_metric = IoUMetric(
+            iou_metrics=['mIoU'],
+            output_dir='tmp',
+            num_writers=2,
+            png_compress_level=1)
+        iou_metric.dataset_meta = dict(
+            classes=['wall', 'building', 'sky', 'floor', 'tree'],
+            label_map=dict(),
+            reduce_zero_label=False)
+        iou_metric.process([0] * len(data_samples), data_samples)
+        res = iou_metric.evaluate(2)
+        self.assertIsInstance(res, dict)
+        assert osp.isfile('tmp/00000_img.png')
+        shutil.rmtree('tmp')
+
+    def test_sample_order(self):
+        """Test the results are collected in the order of the samples."""
+
+        data_samples = self._demo_mm_inputs(batch_size=3)
+        data_samples = self._demo_mm_model_output(data_samples)
+        dataset_meta = dict(
+            classes=['wall', 'building', 'sky', 'floor', 'tree'],
+            label_map=dict(),
+            reduce_zero_label=False)
+        iou_metric = IoUMetric(iou_metrics=['mIoU'])
+        iou_metric.dataset_meta = dataset_meta
+        iou_metric.process([0] * 3, data_samples)
+        res = iou_metric.evaluate(3)
+        assert iou_metric.results == []
+
+        # the samples are reordered, and a sample is padded as a duplicate
+        for sample_idx, data_sample in enumerate(data_samples):
+            data_sample['sample_idx'] = sample_idx
+        iou_metric.process([0] * 4, [data_samples[i] for i in (1, 1, 0, 2)])
+        assert [sample_idx
+                for sample_idx, _ in iou_metric.results] == [1, 1, 0, 2]
+        self.assertDictEqual(iou_metric.evaluate(3), res)
+
+    def test_streaming(self):
+        """Test the running confusion matrix gives the same metrics."""
+
+        data_samples = self._demo_mm_inputs()
+        data_samples = self._demo_mm_model_output(data_samples)
+        dataset_meta = dict(
+            classes=['wall', 'building', 'sky', 'floor', 'tree'],
+            label_map=dict(),
+            reduce_zero_label=False)
+        data_samples[0]['gt_sem_seg']['data'][:, :8] = 255
+
+        iou_metric = IoUMetric(iou_metrics=['mIoU', 'mDice', 'mFscore'])
+        iou_metric.dataset_meta = dataset_meta
+        iou_metric.process([0] * len(data_samples), data_samples)
+        res = iou_metric.evaluate(2)
+
+        streaming_metric = IoUMetric(
+            iou_metrics=['mIoU', 'mDice', 'mFscore'], streaming=True)
+        streaming_metric.dataset_meta = dataset_meta
+        streaming_metric.process([0] * len(data_samples), data_samples)
+        assert streaming_metric.results == []
+        assert streaming_metric.confusion_matrix.shape == (6, 6)
+        streaming_res = streaming_metric.evaluate(2)
+        assert streaming_metric.confusion_matrix is None
+        self.assertDictEqual(res, streaming_res)
+
+        # test confusion matrix
+        pred_label = torch.tensor([[0, 1], [1, 2], [2, 4]])
+        label = torch.tensor([[0, 2], [1, 255], [3, 1]])
+        confusion_matrix = IoUMetric.compute_confusion_matrix(
+            pred_label, label, 3, 255)
+        assert torch.equal(
+            confusion_matrix,
+            torch.tensor([[1, 0, 0, 0], [0, 1, 0, 1], [0, 1, 0, 0],
+                          [0, 0, 1, 0]]))
+
+        # test save confusion matrix in output_dir
+        streaming_metric = IoUMetric(
+            iou_metrics=['mIoU'], output_dir='tmp', streaming=True)
+        streaming_metric.dataset_meta = dataset_meta
+        streaming_metric.process([0] * len(data_samples), data_samples)
+        streaming_metric.evaluate(2)
+        assert osp.isfile('tmp/confusion_matrix.npy')
+        assert np.load('tmp/confusion_matrix.npy').shape == (5, 5)
+        shutil.rmtree('tmp')
+
+    def test_batch_confusion_matrix(self):
+        """Test the batched histograms equal the per-image ones."""
+
+        num_classes = 5
+        # the labels and predictions out of range are not ignored
+        pred_labels = [
+            torch.randint(0, num_classes + 2, (16, 24)),
+            torch.randint(0, num_classes + 2, (32, 8))
+        ]
+        labels = [
+            torch.randint(0, num_classes + 3, (16, 24)),
+            torch.randint(0, num_classes + 3, (32, 8))
+        ]
+        for label in labels:
+            label[label == num_classes] = 255
+
+        confusion_matrices = IoUMetric.batch_confusion_matrix(
+            pred_labels, labels, num_classes, 255)
+        assert confusion_matrices.shape == (2, num_classes + 1,
+                                            num_classes + 1)
+        batch_areas = IoUMetric.confusion_matrix_to_areas(confusion_matrices)
+        for i, (pred_label, label) in enumerate(zip(pred_labels, labels)):
+            areas = IoUMetric.intersect_and_union(pred_label, label,
+                                                  num_classes, 255)
+            for area, batch_area in zip(areas, batch_areas):
+                assert torch.equal(area, batch_area[i])
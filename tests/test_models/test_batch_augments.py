@@ -0,0 +1,195 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import cv2
+import numpy as np
+import pytest
+import torch
+from mmengine.structures import PixelData
+
+from mmseg.datasets.transforms import GenerateEdge
+from mmseg.models import (BatchCutMix, BatchGenerateEdge,
+                          BatchPhotoMetricDistortion, BatchRandomCutOut,
+                          BatchRandomFlip, BatchRandomResizeCrop)
+from mmseg.models.batch_augments import bgr_to_hsv, hsv_to_bgr
+from mmseg.structures import SegDataSample
+
+
+def test_hsv_conversion():
+    img = torch.rand(2, 3, 8, 8) * 255
+    hue, saturation, value = bgr_to_hsv(img)
+    expected = cv2.cvtColor(img[0].permute(1, 2, 0).numpy(), cv2.COLOR_BGR2HSV)
+    np.testing.assert_allclose(hue[0].numpy(), expected[..., 0], atol=1e-3)
+    np.testing.assert_allclose(
+        saturation[0].numpy(), expected[..., 1], atol=1e-5)
+    np.testing.assert_allclose(value[0].numpy(), expected[..., 2])
+    # the round trip through the float32 hue accumulates rounding errors
+    # of about 1e-4 on values up to 255
+    torch.testing.assert_close(
+        hsv_to_bgr(hue, saturation, value), img, atol=1e-3, rtol=1e-5)
+
+
+def test_batch_photo_metric_distortion():
+    inputs = torch.randint(0, 256, (4, 3, 16, 16)).float()
+    data_samples = [dict() for _ in range(4)]
+
+    # no distortion is applied
+    transform = BatchPhotoMetricDistortion(prob=0.)
+    outputs, out_samples = transform(inputs, data_samples)
+    assert out_samples is data_samples
+    torch.testing.assert_close(outputs, inputs, atol=1e-3, rtol=1e-5)
+
+    # all the distortions are applied
+    transform = BatchPhotoMetricDistortion(prob=1.)
+    outputs, _ = transform(inputs, data_samples)
+    assert outputs.shape == inputs.shape
+    assert outputs.dtype == inputs.dtype
+    assert outputs.min() >= 0 and outputs.max() <= 255
+    assert not torch.allclose(outputs, inputs)
+
+    # only the brightness distortion is applied
+    transform = BatchPhotoMetricDistortion(
+        contrast_range=(1., 1.),
+        saturation_range=(1., 1.),
+        hue_delta=0,
+        prob=1.)
+    outputs, _ = transform(inputs, data_samples)
+    delta = (outputs - inputs).flatten(1)
+    unclipped = (outputs > 0) & (outputs < 255)
+    for i in range(4):
+        image_delta = delta[i][unclipped[i].flatten()]
+        torch.testing.assert_close(
+            image_delta,
+            image_delta[:1].expand_as(image_delta),
+            atol=1e-3,
+            rtol=1e-5)
+
+
+def test_batch_generate_edge():
+    seg_maps = torch.randint(0, 3, (2, 1, 16, 20))
+    seg_maps[0, :, 4:8] = 255
+    data_samples = [
+        SegDataSample(gt_sem_seg=PixelData(data=seg_map))
+        for seg_map in seg_maps
+    ]
+    inputs = torch.rand(2, 3, 16, 20)
+    for edge_width in (1, 3, 4):
+        transform = BatchGenerateEdge(edge_width=edge_width)
+        outputs, out_samples = transform(inputs, data_samples)
+        assert outputs is inputs
+        for seg_map, data_sample in zip(seg_maps, out_samples):
+            results = GenerateEdge(edge_width=edge_width)(
+                dict(gt_seg_map=seg_map[0].numpy(), img_shape=(16, 20)))
+            edge_map = data_sample.gt_edge_map.data
+            assert edge_map.shape == (1, 16, 20)
+            assert edge_map.dtype == torch.int64
+            np.testing.assert_array_equal(edge_map[0].numpy(),
+                                          results['gt_edge_map'])
+
+
+def _get_batch(num=4, height=16, width=20):
+    inputs = torch.randint(0, 256, (num, 3, height, width)).float()
+    data_samples = []
+    for _input in inputs:
+        # the labels are the same as the first channel of the images
+        data_samples.append(
+            SegDataSample(
+                gt_sem_seg=PixelData(data=_input[:1].long()),
+                gt_edge_map=PixelData(data=_input[:1].long() % 2)))
+    return inputs, data_samples
+
+
+def test_batch_random_resize_crop():
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomResizeCrop(crop_size=(8, 12), ratio_range=(1, 1))
+    outputs, out_samples = transform(inputs, data_samples)
+    assert outputs.shape == (4, 3, 8, 12)
+    for output, data_sample in zip(outputs, out_samples):
+        assert data_sample.img_shape == (8, 12)
+        assert data_sample.gt_sem_seg.shape == (8, 12)
+        assert data_sample.gt_edge_map.shape == (8, 12)
+        # the crops are not rescaled
+        torch.testing.assert_close(output, output.round(), atol=1e-3, rtol=0)
+        torch.testing.assert_close(data_sample.gt_sem_seg.data,
+                                   output[:1].round().long())
+
+    # the regions out of the rescaled images are padded
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomResizeCrop(
+        crop_size=(20, 24), ratio_range=(0.5, 0.5), pad_val=1, seg_pad_val=7)
+    outputs, out_samples = transform(inputs, data_samples)
+    assert outputs.shape == (4, 3, 20, 24)
+    assert (outputs[:, :, 8:] == 1).all()
+    assert (outputs[:, :, :, 10:] == 1).all()
+    for data_sample in out_samples:
+        seg_map = data_sample.gt_sem_seg.data
+        assert (seg_map[:, 8:] == 7).all()
+        assert (seg_map[:, :, 10:] == 7).all()
+        assert (seg_map[:, :8, :10] != 7).any()
+
+
+def test_batch_random_flip():
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomFlip(prob=1.)
+    outputs, out_samples = transform(inputs.clone(), data_samples)
+    torch.testing.assert_close(outputs, inputs.flip(-1))
+    for output, data_sample in zip(outputs, out_samples):
+        assert data_sample.flip
+        assert data_sample.flip_direction == 'horizontal'
+        torch.testing.assert_close(data_sample.gt_sem_seg.data,
+                                   output[:1].long())
+
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomFlip(prob=0., direction='vertical')
+    outputs, out_samples = transform(inputs.clone(), data_samples)
+    torch.testing.assert_close(outputs, inputs)
+    assert not any(data_sample.flip for data_sample in out_samples)
+
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomFlip(prob=1., direction='vertical')
+    outputs, _ = transform(inputs.clone(), data_samples)
+    torch.testing.assert_close(outputs, inputs.flip(-2))
+
+
+def test_batch_random_cutout():
+    with pytest.raises(AssertionError):
+        BatchRandomCutOut(prob=0.5, n_holes=1)
+
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomCutOut(
+        prob=1.,
+        n_holes=(1, 3),
+        cutout_shape=[(4, 2), (2, 4)],
+        fill_in=(300, 300, 300),
+        seg_fill_in=300)
+    outputs, out_samples = transform(inputs.clone(), data_samples)
+    for output, data_sample in zip(outputs, out_samples):
+        mask = output == 300
+        # all the channels are dropped, with at most 3 holes of 8 pixels
+        assert mask.any()
+        assert (mask == mask[:1]).all()
+        assert mask[0].sum() <= 24
+        torch.testing.assert_close(data_sample.gt_sem_seg.data,
+                                   output[:1].long())
+        assert (data_sample.gt_edge_map.data[mask[:1]] == 300).all()
+
+    inputs, data_samples = _get_batch()
+    transform = BatchRandomCutOut(
+        prob=0., n_holes=1, cutout_ratio=(0.5, 0.5), seg_fill_in=300)
+    outputs, _ = transform(inputs.clone(), data_samples)
+    torch.testing.assert_close(outputs, inputs)
+
+
+def test_batch_cutmix():
+    inputs, data_samples = _get_batch()
+    transform = BatchCutMix(prob=1.)
+    outputs, out_samples = transform(inputs.clone(), data_samples)
+    assert outputs.shape == inputs.shape
+    # the pixels are taken from the same location of the images in the batch
+    assert ((outputs[:, None] == inputs[None]).all(2).any(1)).all()
+    for output, data_sample in zip(outputs, out_samples):
+        torch.testing.assert_close(data_sample.gt_sem_seg.data,
+                                   output[:1].long())
+
+    inputs, data_samples = _get_batch()
+    transform = BatchCutMix(prob=0.)
+    outputs, _ = transform(inputs.clone(), data_samples)
+    torch.testing.assert_close(outputs, inputs)
@@ -6,6 +6,7 @@ from mmengine.structures import PixelData
 
 from mmseg.models import SegDataPreProcessor
 from mmseg.structures import SegDataSample
+from mmseg.utils import stack_batch
 
 
 class TestSegDataPreProcessor(TestCase):
@@ -62,3 +63,119 @@ class TestSegDataPreProcessor(TestCase):
         out = processor(data, training=False)
         self.assertEqual(out['inputs'].shape[2] % 15, 0)
         self.assertEqual(out['inputs'].shape[3] % 15, 0)
+
+        # test predict with images of different shapes
+        data = dict(
+            inputs=[
+                torch.randint(0, 256, (3, 11, 10)),
+                torch.randint(0, 256, (3, 9, 17))
+            ],
+            data_samples=[SegDataSample(), SegDataSample()])
+        out = processor(data, training=False)
+        data_samples = out['data_samples']
+        self.assertEqual(out['inputs'].shape, (2, 3, 15, 30))
+        self.assertEqual(data_samples[0].img_padding_size, (0, 20, 0, 4))
+        self.assertEqual(data_samples[1].img_padding_size, (0, 13, 0, 6))
+        self.assertEqual(data_samples[1].pad_shape, (15, 30))
+
+    def test_stack_normalize(self):
+        mean, std = [1, 2, 3], [4, 5, 6]
+        inputs = [
+            torch.randint(0, 256, (3, 11, 10), dtype=torch.uint8),
+            torch.randint(0, 256, (3, 9, 13), dtype=torch.uint8)
+        ]
+        data_samples = []
+        for _input in inputs:
+            data_sample = SegDataSample()
+            data_sample.gt_sem_seg = PixelData(
+                data=torch.randint(0, 10, (1, ) + _input.shape[-2:]))
+            data_samples.append(data_sample)
+
+        # the same as converting, normalizing and then padding each image
+        expected, _ = stack_batch(
+            [(_input[[2, 1, 0]].float() - torch.tensor(mean).view(-1, 1, 1)) /
+             torch.tensor(std).view(-1, 1, 1) for _input in inputs],
+            size_divisor=8,
+            pad_val=7)
+        processor = SegDataPreProcessor(
+            mean=mean, std=std, size_divisor=8, pad_val=7, bgr_to_rgb=True)
+        data = dict(inputs=inputs, data_samples=data_samples)
+        out = processor(data, training=True)
+        torch.testing.assert_close(out['inputs'], expected)
+        self.assertEqual(out['data_samples'][1].img_shape, (9, 13))
+        self.assertEqual(out['data_samples'][1].padding_size, (0, 3, 0, 7))
+        self.assertEqual(out['data_samples'][1].gt_sem_seg.shape, (16, 16))
+
+        # output in float16 and channels last
+        processor = SegDataPreProcessor(
+            mean=mean,
+            std=std,
+            pad_val=7,
+            bgr_to_rgb=True,
+            fp16=True,
+            channels_last=True,
+            test_cfg=dict(size=(16, 16)))
+        out = processor(dict(inputs=inputs[:1]), training=False)
+        self.assertEqual(out['inputs'].dtype, torch.half)
+        self.assertTrue(
+            out['inputs'].is_contiguous(memory_format=torch.channels_last))
+        torch.testing.assert_close(
+            out['inputs'], expected[:1].half(), atol=1e-2, rtol=1e-3)
+
+    def test_batch_augments(self):
+        data_samples = []
+        for _ in range(2):
+            data_sample = SegDataSample()
+            data_sample.gt_sem_seg = PixelData(
+                **{'data': torch.randint(0, 10, (1, 11, 10))})
+            data_samples.append(data_sample)
+        processor = SegDataPreProcessor(
+            mean=[0, 0, 0],
+            std=[1, 1, 1],
+            size=(20, 20),
+            batch_augments=[dict(type='BatchPhotoMetricDistortion')])
+        self.assertIsInstance(processor.batch_augments, torch.nn.ModuleList)
+
+        # images of the same shape are augmented as a batch
+        inputs = [
+            torch.randint(0, 256, (3, 11, 10)),
+            torch.randint(0, 256, (3, 11, 10))
+        ]
+        data = dict(inputs=inputs, data_samples=data_samples)
+        out = processor(data, training=True)
+        self.assertEqual(out['inputs'].shape, (2, 3, 20, 20))
+        self.assertEqual(len(out['data_samples']), 2)
+
+        # images of different shapes are augmented one by one
+        inputs = [
+            torch.randint(0, 256, (3, 11, 10)),
+            torch.randint(0, 256, (3, 12, 9))
+        ]
+        data = dict(inputs=inputs, data_samples=data_samples)
+        out = processor(data, training=True)
+        self.assertEqual(out['inputs'].shape, (2, 3, 20, 20))
+
+        # geometric batch augmentations transform the segmentation maps
+        processor = SegDataPreProcessor(
+            size=(20, 20),
+            batch_augments=[
+                dict(type='BatchRandomResizeCrop', crop_size=(8, 8)),
+                dict(type='BatchRandomFlip'),
+                dict(type='BatchCutMix')
+            ])
+        inputs = [
+            torch.randint(0, 256, (3, 11, 10)),
+            torch.randint(0, 256, (3, 11, 10))
+        ]
+        data = dict(inputs=inputs, data_samples=data_samples)
+        out = processor(data, training=True)
+        self.assertEqual(out['inputs'].shape, (2, 3, 20, 20))
+        for data_sample in out['data_samples']:
+            self.assertEqual(data_sample.img_shape, (8, 8))
+            self.assertEqual(data_sample.gt_sem_seg.shape, (20, 20))
+
+        # batch augmentations are not applied in testing
+        inputs = [torch.randint(0, 256, (3, 11, 10))]
+        data = dict(inputs=inputs, data_samples=data_samples[:1])
+        out = processor(data, training=False)
+        torch.testing.assert_close(out['inputs'][0], inputs[0].float())
@@ -1,6 +1,8 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import pytest
 import torch
 from mmengine import ConfigDict
+from mmengine.registry import init_default_scope
 from mmengine.structures import PixelData
 
 from mmseg.models import build_segmentor
@@ -37,6 +39,12 @@ def test_encoder_decoder():
     segmentor = build_segmentor(cfg)
     _segmentor_forward_train_test(segmentor)
 
+    # test slide mode with batched crops
+    cfg.test_cfg = ConfigDict(
+        mode='slide', crop_size=(3, 3), stride=(2, 2), crop_batch_size=4)
+    segmentor = build_segmentor(cfg)
+    _segmentor_forward_train_test(segmentor)
+
     # test 1 decode head, 1 aux head
     cfg = ConfigDict(
         type='EncoderDecoder',
@@ -98,3 +106,160 @@ def test_postprocess_result():
     outputs = model.postprocess_result(seg_logits, data_samples)
     assert outputs[0].seg_logits.data.shape == torch.Size((2, 8, 8))
     assert torch.allclose(outputs[0].seg_logits.data, torch.ones((2, 8, 8)))
+
+
+def _build_segmentor(test_cfg, **kwargs):
+    cfg = ConfigDict(
+        type='EncoderDecoder',
+        backbone=dict(type='ExampleBackbone'),
+        decode_head=dict(type='ExampleDecodeHead'),
+        train_cfg=None,
+        test_cfg=test_cfg,
+        **kwargs)
+    model = build_segmentor(cfg)
+    model.eval()
+    return model
+
+
+def test_slide_inference_crop_batch_size():
+    model = _build_segmentor(
+        dict(mode='slide', crop_size=(6, 6), stride=(4, 4)))
+
+    inputs = torch.randn(2, 3, 10, 14)
+    batch_img_metas = [
+        dict(ori_shape=(10, 14), img_shape=(10, 14), pad_shape=(10, 14))
+        for _ in range(2)
+    ]
+    with torch.no_grad():
+        seg_logits = model.slide_inference(inputs, batch_img_metas)
+        for crop_batch_size in (1, 3, 100):
+            model.test_cfg.crop_batch_size = crop_batch_size
+            batched_seg_logits = model.slide_inference(inputs, batch_img_metas)
+            assert torch.allclose(seg_logits, batched_seg_logits, atol=1e-5)
+
+
+def test_slide_inference_in_bands():
+    model = _build_segmentor(
+        dict(mode='slide', crop_size=(6, 6), stride=(4, 4)))
+
+    inputs = torch.randn(2, 3, 14, 10)
+    batch_img_metas = [
+        dict(ori_shape=(14, 10), img_shape=(14, 10), pad_shape=(14, 10))
+        for _ in range(2)
+    ]
+    with torch.no_grad():
+        seg_logits = model.slide_inference(inputs, batch_img_metas)
+        seg_preds = model.slide_inference_in_bands(inputs, batch_img_metas)
+        assert seg_preds.shape == (2, 1, 14, 10)
+        assert seg_preds.dtype == torch.uint8
+        assert torch.equal(seg_preds.long(),
+                           seg_logits.argmax(dim=1, keepdim=True))
+
+        model.test_cfg.crop_batch_size = 3
+        assert torch.equal(
+            model.slide_inference_in_bands(inputs, batch_img_metas), seg_preds)
+
+        # test reduced precision accumulation
+        model.test_cfg.accumulate_dtype = 'bfloat16'
+        seg_logits = model.slide_inference(inputs, batch_img_metas)
+        assert seg_logits.dtype == torch.bfloat16
+        assert seg_logits.shape == (2, 19, 14, 10)
+
+        # test predict with band argmax
+        model.test_cfg.argmax_in_bands = True
+        data_samples = [
+            SegDataSample(metainfo=dict(ori_shape=(7, 5), flip=False))
+            for _ in range(2)
+        ]
+        outputs = model.predict(inputs, data_samples)
+        assert outputs[0].pred_sem_seg.shape == (7, 5)
+        assert outputs[0].pred_sem_seg.data.dtype == torch.long
+        assert 'seg_logits' not in outputs[0]
+
+        # the other callers of inference ignore band argmax
+        with pytest.warns(UserWarning, match='argmax_in_bands'):
+            seg_logits = model.inference(inputs, batch_img_metas)
+        assert seg_logits.shape == (2, 19, 14, 10)
+
+
+def test_slide_inference_blend_mode():
+    model = _build_segmentor(
+        dict(
+            mode='slide', crop_size=(6, 6), stride=(4, 4),
+            weight_cache_size=2))
+
+    inputs = torch.randn(1, 3, 10, 14)
+    batch_img_metas = [
+        dict(ori_shape=(10, 14), img_shape=(10, 14), pad_shape=(10, 14))
+    ]
+    with torch.no_grad():
+        uniform_seg_logits = model.slide_inference(inputs, batch_img_metas)
+        for blend_mode in ('gaussian', 'cosine'):
+            model.test_cfg.blend_mode = blend_mode
+            seg_logits = model.slide_inference(inputs, batch_img_metas)
+            assert seg_logits.shape == uniform_seg_logits.shape
+            # pixels covered by a single window keep their logits
+            assert torch.allclose(seg_logits[..., 0, 0],
+                                  uniform_seg_logits[..., 0, 0])
+            assert torch.equal(
+                model.slide_inference_in_bands(inputs, batch_img_metas).long(),
+                seg_logits.argmax(dim=1, keepdim=True))
+
+    # test the LRU cache of weights
+    assert len(model._slide_weight_cache) == 2
+    window_weight, h_norm, w_norm = model._get_slide_weights(
+        10, 14, inputs.device)
+    assert window_weight.shape == (1, 1, 6, 6)
+    assert h_norm.shape == (1, 1, 10, 1)
+    assert w_norm.shape == (1, 1, 1, 14)
+    assert list(model._slide_weight_cache.values())[-1][1] is h_norm
+    # the row and column factors make up the reciprocal of the weight sum
+    weight_sum = torch.zeros(1, 1, 10, 14)
+    for y1, y2, x1, x2 in model._get_slide_windows(10, 14):
+        weight_sum[:, :, y1:y2, x1:x2] += window_weight
+    assert torch.allclose(h_norm * w_norm, weight_sum.reciprocal())
+    model.test_cfg.blend_mode = 'uniform'
+    window_weight, _, _ = model._get_slide_weights(10, 14, inputs.device)
+    assert window_weight is None
+    assert len(model._slide_weight_cache) == 2
+
+
+def test_batched_inference():
+    init_default_scope('mmseg')
+
+    # the images of different shapes are padded into a batch and unpadded
+    shapes = [(10, 14), (12, 8), (7, 7)]
+    inputs = [torch.randint(0, 256, (3, ) + shape) for shape in shapes]
+
+    def get_data_samples():
+        return [
+            SegDataSample(
+                metainfo=dict(ori_shape=(h * 2, w * 2), img_shape=(h, w)))
+            for h, w in shapes
+        ]
+
+    for test_cfg in (dict(mode='whole'),
+                     dict(mode='slide', crop_size=(6, 6), stride=(4, 4))):
+        model = _build_segmentor(
+            test_cfg, data_preprocessor=dict(type='SegDataPreProcessor'))
+        # the backbone is pointwise, so that the logits of each image are
+        # not changed by the padding and the sliding windows
+        model.backbone.conv = torch.nn.Conv2d(3, 3, 1)
+        with torch.no_grad():
+            outputs = model.test_step(
+                dict(inputs=inputs, data_samples=get_data_samples()))
+            for i, (output, (h, w)) in enumerate(zip(outputs, shapes)):
+                assert output.img_padding_size == (0, 14 - w, 0, 12 - h)
+                assert output.pad_shape == (12, 14)
+                assert output.seg_logits.shape == (h * 2, w * 2)
+                assert output.pred_sem_seg.shape == (h * 2, w * 2)
+
+                # the same as inferring each image alone
+                single_output = model.test_step(
+                    dict(
+                        inputs=[inputs[i]],
+                        data_samples=[get_data_samples()[i]]))[0]
+                torch.testing.assert_close(output.seg_logits.data,
+                                           single_output.seg_logits.data)
+                assert torch.equal(output.pred_sem_seg.data,
+                                   single_output.pred_sem_seg.data)
@@ -1,11 +1,13 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import copy
 import os.path as osp
 
 import numpy as np
 import pytest
 from mmengine import FileClient
+from PIL import Image
 
-from mmseg.utils import datafrombytes
+from mmseg.utils import AsyncWriter, datafrombytes, save_png
 
 
 @pytest.mark.parametrize(
@@ -31,3 +33,47 @@ def test_datafrombytes(backend, suffix):
             # testing data biomedical.npy includes data and label
             assert len(data.shape) == 4
             assert data.shape[0] == 2
+
+
+def test_async_writer(tmp_path):
+    img = np.random.randint(0, 255, (16, 16), dtype=np.uint8)
+
+    for num_workers in (0, 2):
+        writer = AsyncWriter(num_workers=num_workers, max_pending=2)
+        for i in range(5):
+            writer.submit(
+                save_png,
+                img,
+                str(tmp_path / f'{num_workers}_{i}.png'),
+                compress_level=1)
+        writer.flush()
+        for i in range(5):
+            assert osp.isfile(tmp_path / f'{num_workers}_{i}.png')
+    assert (np.array(Image.open(tmp_path / '2_0.png')) == img).all()
+
+    # test palette mode
+    save_png(img, str(tmp_path / 'p.png'), mode='P')
+    assert Image.open(tmp_path / 'p.png').mode == 'P'
+
+    # test errors are raised when flushing
+    def _fail():
+        raise ValueError('fail')
+
+    writer = AsyncWriter(num_workers=1)
+    writer.submit(_fail)
+    with pytest.raises(ValueError):
+        writer.flush()
+
+    # test the writer can be copied
+    writer = copy.deepcopy(writer)
+    writer.submit(save_png, img, str(tmp_path / 'copy.png'))
+    writer.flush()
+    assert osp.isfile(tmp_path / 'copy.png')
+
+    # test palette-indexed label map
+    palette = [[i, 255 - i, 0] for i in range(256)]
+    save_png(img, str(tmp_path / 'palette.png'), palette=palette)
+    output = Image.open(tmp_path / 'palette.png')
+    assert output.mode == 'P'
+    assert (np.array(output) == img).all()
+    assert output.getpalette()[:6] == [0, 255, 0, 1, 254, 0]
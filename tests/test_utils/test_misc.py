@@ -0,0 +1,51 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import torch
+
+from mmseg.utils import apply_label_lut, get_label_lut
+
+
+def test_get_label_lut():
+    assert get_label_lut() is None
+
+    # the lookup table should match remapping the labels with masks
+    label_map = {0: 0, 1: 255, 2: 1, 3: 2}
+    gt = np.arange(256, dtype=np.uint8)
+    expected = gt.copy()
+    expected[gt == 0] = 255
+    expected = expected - 1
+    expected[expected == 254] = 255
+    expected_copy = expected.copy()
+    for old_id, new_id in label_map.items():
+        expected[expected_copy == old_id] = new_id
+    label_lut = get_label_lut(label_map, True)
+    assert label_lut.dtype == np.uint8
+    np.testing.assert_array_equal(label_lut, expected)
+
+    label_lut = get_label_lut(reduce_zero_label=True)
+    assert label_lut[0] == label_lut[255] == 255
+    np.testing.assert_array_equal(label_lut[1:255], np.arange(254))
+
+
+def test_apply_label_lut():
+    lut = np.arange(256, dtype=np.uint8)
+    lut[0] = 255
+    lut[1:] -= 1
+    label = np.array([[0, 1, 2], [255, 3, 0]], dtype=np.uint8)
+    expected = np.array([[255, 0, 1], [254, 2, 255]], dtype=np.uint8)
+
+    # test numpy label map
+    mapped = apply_label_lut(label, lut)
+    assert isinstance(mapped, np.ndarray)
+    assert mapped.dtype == np.uint8
+    np.testing.assert_array_equal(mapped, expected)
+
+    # test torch label map
+    mapped = apply_label_lut(torch.from_numpy(label).long(), lut)
+    assert isinstance(mapped, torch.Tensor)
+    assert mapped.dtype == torch.uint8
+    assert torch.equal(mapped, torch.from_numpy(expected))
+
+    # test torch lookup table
+    mapped = apply_label_lut(label, torch.from_numpy(lut))
+    np.testing.assert_array_equal(mapped, expected)
@@ -1,17 +1,45 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import base64
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-import cv2
 import mmcv
 import torch
 from mmengine.model.utils import revert_sync_batchnorm
 from ts.torch_handler.base_handler import BaseHandler
 
-from mmseg.apis import inference_model, init_model
+from mmseg.apis import (SEG_MAP_FORMATS, encode_seg_map, inference_model,
+                        init_model)
 
 
 class MMsegHandler(BaseHandler):
+    """The TorchServe handler of segmentors.
+
+    The requests in a batch handed by TorchServe are inferred together. The
+    images of the same shape are forwarded as one batch, and the images of
+    different shapes are forwarded in separate batches, so that the results
+    are the same as inferring each request alone. If ``group_by_shape`` is
+    False, all the images are padded into one batch instead.
+
+    The format of the result of each request is chosen by its ``seg-format``
+    form field or header, which is one of ``'png'`` (default),
+    ``'palette_png'``, ``'rle'`` and ``'raw'``, and the PNG compression level
+    by ``compress-level`` from 0 to 9. See :func:`mmseg.apis.encode_seg_map`
+    for the formats, and :func:`mmseg.apis.decode_seg_map` to decode them.
+    The results are encoded by a pool of ``num_encode_workers`` threads. A
+    request with invalid options is answered with status 400 and the error
+    message, while the other requests in the batch are served as usual.
+    """
+
+    group_by_shape = True
+    num_encode_workers = 4
+    png_compress_level = 1
+    content_types = dict(
+        png='image/png',
+        palette_png='image/png',
+        rle='application/octet-stream',
+        raw='application/octet-stream')
 
     def initialize(self, context):
         properties = context.system_properties
@@ -28,12 +56,58 @@ class MMsegHandler(BaseHandler):
 
         self.model = init_model(self.config_file, checkpoint, self.device)
         self.model = revert_sync_batchnorm(self.model)
+        self.encode_pool = ThreadPoolExecutor(self.num_encode_workers)
         self.initialized = True
 
+    def _get_option(self, idx, row, key, default):
+        """Get an option of a request from its form field or header."""
+        value = row.get(key)
+        context = getattr(self, 'context', None)
+        if value is None and context is not None:
+            value = context.get_request_header(idx, key)
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode()
+        return default if value is None else value
+
+    def _get_format_options(self, idx, row):
+        """Get and validate the format and PNG compression level of a
+        request."""
+        seg_format = self._get_option(idx, row, 'seg-format', 'png')
+        if seg_format not in SEG_MAP_FORMATS:
+            raise ValueError(f'seg-format should be one of '
+                             f'{SEG_MAP_FORMATS}, but got {seg_format}')
+        value = self._get_option(idx, row, 'compress-level',
+                                 self.png_compress_level)
+        try:
+            compress_level = int(value)
+        except ValueError:
+            compress_level = -1
+        if not 0 <= compress_level <= 9:
+            raise ValueError('compress-level should be an integer from 0 to '
+                             f'9, but got {value}')
+        return seg_format, compress_level
+
     def preprocess(self, data):
         images = []
+        self.seg_formats = []
+        self.compress_levels = []
+        # the requests with invalid options are answered with the errors,
+        # without failing the other requests in the batch
+        self.errors = []
+
+        for idx, row in enumerate(data):
+            try:
+                seg_format, compress_level = self._get_format_options(idx, row)
+            except ValueError as e:
+                self.seg_formats.append(None)
+                self.compress_levels.append(None)
+                self.errors.append(str(e))
+                images.append(None)
+                continue
+            self.seg_formats.append(seg_format)
+            self.compress_levels.append(compress_level)
+            self.errors.append(None)
 
-        for row in data:
             image = row.get('data') or row.get('body')
             if isinstance(image, str):
                 image = base64.b64decode(image)
@@ -43,14 +117,43 @@ class MMsegHandler(BaseHandler):
         return images
 
     def inference(self, data, *args, **kwargs):
-        results = [inference_model(self.model, img) for img in data]
+        indices = [i for i, img in enumerate(data) if img is not None]
+        if self.group_by_shape:
+            groups = defaultdict(list)
+            for i in indices:
+                groups[data[i].shape].append(i)
+            batches = list(groups.values())
+        else:
+            batches = [indices] if indices else []
+
+        results = [None] * len(data)
+        for batch in batches:
+            batch_results = inference_model(self.model,
+                                            [data[i] for i in batch])
+            for i, result in zip(batch, batch_results):
+                results[i] = result.pred_sem_seg.data[0].cpu().numpy()
         return results
 
-    def postprocess(self, data):
-        output = []
+    def _encode(self, idx, seg_map):
+        """Encode the result of a request, or return its error."""
+        if self.errors[idx] is not None:
+            return self.errors[idx]
+        return encode_seg_map(
+            seg_map,
+            self.seg_formats[idx],
+            self.compress_levels[idx],
+            palette=self.model.dataset_meta['palette'])
 
-        for image_result in data:
-            _, buffer = cv2.imencode('.png', image_result[0].astype('uint8'))
-            content = buffer.tobytes()
-            output.append(content)
-        return output
+    def postprocess(self, data):
+        context = getattr(self, 'context', None)
+        if context is not None:
+            for idx, seg_format in enumerate(self.seg_formats):
+                if self.errors[idx] is not None:
+                    context.set_response_status(400, self.errors[idx], idx)
+                    context.set_response_content_type(idx, 'text/plain')
+                else:
+                    context.set_response_content_type(
+                        idx, self.content_types[seg_format])
+        # the encoders release the GIL when compressing, so the results are
+        # encoded in parallel by the threads
+        return list(self.encode_pool.map(self._encode, range(len(data)), data))
@@ -1,12 +1,12 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 from argparse import ArgumentParser
-from io import BytesIO
 
 import matplotlib.pyplot as plt
 import mmcv
 import requests
 
-from mmseg.apis import inference_model, init_model
+from mmseg.apis import (SEG_MAP_FORMATS, decode_seg_map, inference_model,
+                        init_model)
 
 
 def parse_args():
@@ -28,6 +28,11 @@ def parse_args():
         help='save server output in result-image')
     parser.add_argument(
         '--device', default='cuda:0', help='Device used for inference')
+    parser.add_argument(
+        '--seg-format',
+        default='png',
+        choices=SEG_MAP_FORMATS,
+        help='The format of the server output')
 
     args = parser.parse_args()
     return args
@@ -36,16 +41,14 @@ def parse_args():
 def main(args):
     url = 'http://' + args.inference_addr + '/predictions/' + args.model_name
     with open(args.img, 'rb') as image:
-        tmp_res = requests.post(url, image)
+        tmp_res = requests.post(
+            url, image, headers={'seg-format': args.seg_format})
     content = tmp_res.content
     if args.result_image:
         with open(args.result_image, 'wb') as out_image:
             out_image.write(content)
-        plt.imshow(mmcv.imread(args.result_image, 'grayscale'))
-        plt.show()
-    else:
-        plt.imshow(plt.imread(BytesIO(content)))
-        plt.show()
+    plt.imshow(decode_seg_map(content, args.seg_format))
+    plt.show()
     model = init_model(args.config, args.checkpoint, args.device)
     image = mmcv.imread(args.img)
     result = inference_model(model, image)